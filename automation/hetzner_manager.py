@@ -4,6 +4,8 @@ from typing import List, Dict, Optional
 from datetime import datetime, timedelta, timezone
 import time
 
+from metric_cache import MetricCache
+
 
 class HetznerManager:
     BASE_URL = "https://api.hetzner.cloud/v1"
@@ -15,6 +17,9 @@ class HetznerManager:
             "Content-Type": "application/json"
         }
         self.logger = logging.getLogger(__name__)
+        # Same cache as the web app, but windows here span up to 30 days, so keep a coarser step
+        # (settling three steps behind) and retain the whole month.
+        self._metrics = MetricCache(step_seconds=300, settle_seconds=900, retention_seconds=30 * 86400)
     
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict:
         url = f"{self.BASE_URL}/{endpoint}"
@@ -45,6 +50,7 @@ class HetznerManager:
         metric_type: str = "network",
         start: datetime = None,
         end: datetime = None,
+        step: Optional[int] = None,
     ) -> Dict:
         if not start:
             start = datetime.now(timezone.utc) - timedelta(hours=1)
@@ -67,6 +73,8 @@ class HetznerManager:
             "start": start.isoformat(),
             "end": end.isoformat()
         }
+        if step:
+            params["step"] = int(step)
         
         try:
             response = self._request("GET", f"servers/{server_id}/metrics", params=params)
@@ -75,24 +83,31 @@ class HetznerManager:
             self.logger.error(f"获取服务器 {server_id} 指标失败: {e}")
             return {}
     
-    def _sum_series_gb(self, time_series: Dict, key: str) -> float:
-        values = time_series.get(key, {}).get("values", [])
-        if not values:
-            return 0.0
-        return sum(float(v[1]) for v in values) / (1024**3)
+    def _network_totals(self, server_id: int, start: datetime) -> Dict[str, float]:
+        """Bytes in/out since start; after warm-up only samples newer than the settled mark are fetched."""
+
+        def fetch(from_ts: float, to_ts: float, step: int) -> Optional[Dict]:
+            metrics = self.get_server_metrics(
+                server_id,
+                "network",
+                datetime.fromtimestamp(from_ts, timezone.utc),
+                datetime.fromtimestamp(to_ts, timezone.utc),
+                step=step,
+            )
+            return metrics.get("time_series") if metrics else None
+
+        totals = self._metrics.integrals(
+            server_id, ["network.0.bandwidth.in", "network.0.bandwidth.out"], start.timestamp(), fetch
+        )
+        return {"in": totals["network.0.bandwidth.in"], "out": totals["network.0.bandwidth.out"]}
 
     def calculate_traffic(self, server_id: int, days: int = 30) -> Dict:
         end = datetime.now(timezone.utc)
         days = min(days, 30)
         start = end - timedelta(days=days)
-        metrics = self.get_server_metrics(server_id, "network", start, end)
-
-        inbound = 0.0
-        outbound = 0.0
-        if metrics:
-            time_series = metrics.get("time_series", {})
-            inbound = self._sum_series_gb(time_series, "network.0.bandwidth.in")
-            outbound = self._sum_series_gb(time_series, "network.0.bandwidth.out")
+        totals = self._network_totals(server_id, start)
+        inbound = totals["in"] / (1024**3)
+        outbound = totals["out"] / (1024**3)
 
         server_detail = self.get_server(server_id)
         inbound_bytes = None
@@ -110,15 +125,9 @@ class HetznerManager:
         }
 
     def get_today_traffic(self, server_id: int) -> Dict:
-        end = datetime.now(timezone.utc)
-        start = end - timedelta(days=1)
-        metrics = self.get_server_metrics(server_id, "network", start, end)
-        if not metrics:
-            return {"inbound": 0, "outbound": 0, "total": 0}
-
-        time_series = metrics.get("time_series", {})
-        inbound = self._sum_series_gb(time_series, "network.0.bandwidth.in")
-        outbound = self._sum_series_gb(time_series, "network.0.bandwidth.out")
+        totals = self._network_totals(server_id, datetime.now(timezone.utc) - timedelta(days=1))
+        inbound = totals["in"] / (1024**3)
+        outbound = totals["out"] / (1024**3)
 
         return {
             "inbound": round(inbound, 2),
@@ -0,0 +1,142 @@
+"""Incremental Hetzner metric integrals, shared by the web app (main.py) and the automation bot.
+
+Samples older than the "settled" mark are final and kept; each refresh only refetches the tail,
+so integrating over a long window costs one small API call after warm-up.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Defaults suit "traffic today" (main.py); HetznerManager overrides them for its 30-day windows.
+STEP_SECONDS = 60
+SETTLE_SECONDS = 300
+REFRESH_SECONDS = 30
+RETENTION_SECONDS = 2 * 86400
+
+
+def parse_metric_timestamp(raw: Any) -> float:
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    return datetime.fromisoformat(str(raw).replace("Z", "+00:00")).timestamp()
+
+
+def metric_points(series: Any) -> List[tuple]:
+    """Parse a Hetzner series ({"values": [[ts, "v"], ...]} or a bare list) into (epoch, value) pairs."""
+    values = series.get("values", []) if isinstance(series, dict) else (series or [])
+    points: List[tuple] = []
+    for item in values:
+        try:
+            points.append((parse_metric_timestamp(item[0]), float(item[1])))
+        except Exception:
+            continue
+    return points
+
+
+class MetricSeries:
+    """Epoch-indexed samples with a running left-Riemann integral (rate x seconds until the next sample)."""
+
+    def __init__(self) -> None:
+        self.ts = array("d")
+        self.values = array("d")
+        self.cum = array("d")
+
+    def extend(self, points: List[tuple]) -> None:
+        for ts, value in points:
+            if self.ts and ts <= self.ts[-1]:
+                continue
+            self.cum.append(self.cum[-1] + self.values[-1] * (ts - self.ts[-1]) if self.ts else 0.0)
+            self.ts.append(ts)
+            self.values.append(value)
+
+    def truncate_after(self, ts: float) -> None:
+        index = bisect_right(self.ts, ts)
+        del self.ts[index:], self.values[index:], self.cum[index:]
+
+    def drop_before(self, ts: float) -> None:
+        index = bisect_left(self.ts, ts)
+        del self.ts[:index], self.values[:index], self.cum[:index]
+
+    def integral(self, start: float, end: Optional[float] = None) -> float:
+        first = bisect_left(self.ts, start)
+        last = (bisect_right(self.ts, end) if end is not None else len(self.ts)) - 1
+        if last <= first:
+            return 0.0
+        return self.cum[last] - self.cum[first]
+
+
+class MetricCache:
+    """Per-key series cache; each key has its own lock, so a slow fetch never blocks other servers."""
+
+    def __init__(
+        self,
+        step_seconds: int = STEP_SECONDS,
+        settle_seconds: float = SETTLE_SECONDS,
+        refresh_seconds: float = REFRESH_SECONDS,
+        retention_seconds: float = RETENTION_SECONDS,
+        on_lookup: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        self.step_seconds = step_seconds
+        self.settle_seconds = settle_seconds
+        self.refresh_seconds = refresh_seconds
+        self.retention_seconds = retention_seconds
+        self.on_lookup = on_lookup
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def integrals(
+        self,
+        key: Any,
+        names: List[str],
+        start_ts: float,
+        fetch: Callable[[float, float, int], Optional[Dict[str, Any]]],
+    ) -> Dict[str, float]:
+        """Integrate ``names`` from start_ts to now.
+
+        ``fetch(from_ts, to_ts, step)`` returns the API's ``time_series`` dict, or None on failure
+        (the cached samples are then used as they are).
+        """
+        now = time.time()
+        with self._lock:
+            for other in [k for k, v in self._entries.items() if now - v["used_at"] > self.retention_seconds]:
+                self._entries.pop(other, None)
+            entry = self._entries.setdefault(
+                key,
+                {"series": {}, "start": None, "settled": None, "fetched_at": 0.0, "used_at": now, "lock": threading.Lock()},
+            )
+            entry["used_at"] = now
+        with entry["lock"]:
+            covered = entry["start"] is not None and entry["start"] <= start_ts
+            fresh = covered and now - entry["fetched_at"] < self.refresh_seconds
+            if self.on_lookup:
+                self.on_lookup(fresh)
+            if not fresh:
+                # Samples up to "settled" are final; everything after it is refetched.
+                fetch_from = entry["settled"] if covered else start_ts
+                time_series = fetch(fetch_from, now, self.step_seconds)
+                if isinstance(time_series, dict):
+                    if covered:
+                        for series in entry["series"].values():
+                            series.truncate_after(fetch_from)
+                    else:
+                        entry["series"] = {}
+                        entry["start"] = fetch_from
+                    latest = fetch_from
+                    for name in names:
+                        points = metric_points(time_series.get(name))
+                        entry["series"].setdefault(name, MetricSeries()).extend(points)
+                        if points:
+                            latest = max(latest, points[-1][0])
+                    # Never mark beyond the last sample seen, so late samples are still picked up.
+                    entry["settled"] = max(fetch_from, min(now - self.settle_seconds, latest))
+                    entry["fetched_at"] = now
+                    retain_from = now - self.retention_seconds
+                    if entry["start"] < retain_from:
+                        for series in entry["series"].values():
+                            series.drop_before(retain_from)
+                        entry["start"] = retain_from
+            return {
+                name: entry["series"][name].integral(start_ts) if name in entry["series"] else 0.0 for name in names
+            }
@@ -1,6 +1,7 @@
 """Telegram Bot - Hetzner Monitor commands (python-telegram-bot v20+)"""
 from decimal import Decimal, ROUND_HALF_UP
-from datetime import datetime
+from datetime import datetime, time as dt_time, timedelta, timezone
+import heapq
 import json
 import logging
 import os
@@ -8,6 +9,7 @@ import socket
 import threading
 import time
 from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import yaml
 import requests
 
@@ -25,6 +27,10 @@ except Exception as e:
 
 
 class TelegramBot:
+    # 与 Web 端一致：迟到不超过容差视为准点；更晚的按 scheduler.misfire_policy / misfire_grace_seconds 处理
+    REPORT_LATE_TOLERANCE_SECONDS = 60
+    REPORT_MISFIRE_GRACE_SECONDS = 3600
+
     def __init__(self, config, hetzner_manager, traffic_monitor, scheduler):
         self.config = config
         self.hetzner = hetzner_manager
@@ -369,8 +375,30 @@ class TelegramBot:
             parts.append("\n".join(lines))
         return "\n\n".join(parts)
 
+    def _report_tz(self):
+        """scheduler.timezone（IANA 名称），未配置或无效时为本机时区"""
+        name = str((self.config.get('scheduler') or {}).get('timezone') or '').strip()
+        if name:
+            try:
+                return ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                self.logger.warning(f"未知时区 {name}，使用本机时区")
+        return datetime.now().astimezone().tzinfo
+
+    def _report_misfire_allows(self, late: float) -> bool:
+        if late <= self.REPORT_LATE_TOLERANCE_SECONDS:
+            return True
+        scheduler_cfg = self.config.get('scheduler') or {}
+        if (scheduler_cfg.get('misfire_policy') or 'run_once') == 'skip':
+            return False
+        try:
+            grace = float(scheduler_cfg.get('misfire_grace_seconds'))
+        except (TypeError, ValueError):
+            grace = self.REPORT_MISFIRE_GRACE_SECONDS
+        return late <= grace
+
     def _send_scheduled_report(self, label: str) -> None:
-        now = datetime.now().astimezone()
+        now = datetime.now(self._report_tz())
         self._record_hourly_snapshot(now)
         state = self._load_report_state()
         last_time = state.get("last_time")
@@ -414,20 +442,49 @@ class TelegramBot:
         }
         self._save_report_state(state)
 
+    @staticmethod
+    def _next_report_time(target: str, after: datetime, tz) -> datetime:
+        """下一次触发时间（按 tz 的整点/钟点，用 UTC 时间戳比较，兼容夏令时和非整点时区）"""
+        local = after.astimezone(tz)
+        if target == "hourly":
+            top = local.replace(minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+            return (top + timedelta(hours=1)).astimezone(tz)
+        hour, minute = (int(x) for x in target.split(":", 1))
+        day = local.date()
+        for offset in range(3):
+            candidate = datetime.combine(day + timedelta(days=offset), dt_time(hour, minute), tzinfo=tz)
+            # 落在夏令时空档的时间经 UTC 往返后顺延到第一个有效时刻
+            candidate = candidate.astimezone(timezone.utc).astimezone(tz)
+            if candidate > after:
+                return candidate
+        return after + timedelta(days=1)
+
     def _start_report_thread(self) -> None:
         def loop():
-            last_sent = {"11:55": None, "23:55": None}
+            tz = self._report_tz()
+            now = datetime.now(tz)
+            timers = [(self._next_report_time(t, now, tz).timestamp(), t) for t in ("hourly", "11:55", "23:55")]
+            heapq.heapify(timers)
             while True:
-                now = datetime.now().astimezone()
-                if now.minute == 0:
-                    self._record_hourly_snapshot(now)
-                current_time = now.strftime("%H:%M")
-                for target in ("11:55", "23:55"):
-                    if current_time == target:
-                        if last_sent[target] != now.date().isoformat():
-                            self._send_scheduled_report(target)
-                            last_sent[target] = now.date().isoformat()
-                time.sleep(30)
+                fire_ts, target = timers[0]
+                delay = fire_ts - time.time()
+                if delay > 0:
+                    # 上限 60 秒，系统时间被调整时也能及时纠正
+                    time.sleep(min(delay, 60))
+                    continue
+                heapq.heappop(timers)
+                now = datetime.now(tz)
+                late = time.time() - fire_ts
+                try:
+                    if target == "hourly":
+                        self._record_hourly_snapshot(now)
+                    elif self._report_misfire_allows(late):
+                        self._send_scheduled_report(target)
+                    else:
+                        self.logger.warning(f"定时汇报 {target} 延迟 {int(late)} 秒，已跳过")
+                except Exception as e:
+                    self.logger.error(f"定时任务 {target} 失败: {e}")
+                heapq.heappush(timers, (self._next_report_time(target, now, tz).timestamp(), target))
 
         t = threading.Thread(target=loop, daemon=True)
         t.start()
@@ -1,42 +1,315 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import bisect
+import csv
+import errno
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
 import json
+import mimetypes
 import os
+import random
+import re
 import shutil
 import socket
+import struct
+import tempfile
 import threading
 import time
-from datetime import datetime, timedelta
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from zoneinfo import ZoneInfo
 
 import requests
 import yaml
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from requests.adapters import HTTPAdapter
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from automation.metric_cache import MetricCache
+
+try:
+    import brotli  # optional: enables "br" negotiation
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # POSIX file locks for leader election across uvicorn workers
+except ImportError:
+    fcntl = None
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(APP_ROOT, "static")
 
 CONFIG_PATH = os.environ.get("HETZNER_CONFIG_PATH", "/app/config.yaml")
+CONFIG_WRITE_LOCK = threading.Lock()
 WEB_CONFIG_PATH = os.environ.get("WEB_CONFIG_PATH", "/app/web_config.json")
 THRESHOLD_STATE_PATH = os.environ.get("THRESHOLD_STATE_PATH", "/app/threshold_state.json")
 REPORT_STATE_PATH = os.environ.get("REPORT_STATE_PATH", "/app/report_state.json")
 REPORT_STATE_BACKUP_DIR = os.environ.get("REPORT_STATE_BACKUP_DIR", "/app/report_state_backups")
 REPORT_STATE_BACKUP_KEEP = 3
+REPORT_STATE_LOCK = threading.Lock()
+DELAYED_TASKS_PATH = os.environ.get("DELAYED_TASKS_PATH", "/app/delayed_tasks.json")
+TIMER_STATE_PATH = os.environ.get("TIMER_STATE_PATH", "/app/timer_state.json")
 
 ALERT_STATE: Dict[str, Dict[str, Optional[float]]] = {}
 REBUILD_LOCKS: Dict[str, threading.Lock] = {}
 SCHEDULE_STATE: Dict[str, Any] = {"last_daily_report": None, "last_task_runs": {}}
+TIMER_MAX_SLEEP_SECONDS = 60
+TIMER_LATE_TOLERANCE_SECONDS = 60
+TIMER_MISFIRE_GRACE_SECONDS = 3600
+TIMER_LOCK = threading.Condition()
+TIMER_HEAP: List[tuple] = []
+TIMER_TASKS: Dict[str, Dict[str, Any]] = {}
+TIMER_STATE: Dict[str, Any] = {"seq": 0, "config_mtime": None, "fired": None}
+TIMER_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="timer")
 BOT_STATE: Dict[str, Any] = {"update_offset": 0, "last_message_id": None, "last_message_text": None}
+# Outbound Telegram messages go through one queue per (bot, chat) drained by a single sender.
+TELEGRAM_MAX_CHARS = 4096
+TELEGRAM_GLOBAL_INTERVAL_SECONDS = 1 / 30
+TELEGRAM_CHAT_INTERVAL_SECONDS = 1.0
+TELEGRAM_COALESCE_SECONDS = 1.5
+TELEGRAM_SEND_ATTEMPTS = 5
+TELEGRAM_RETRY_BACKOFF_SECONDS = 2.0
+TELEGRAM_OUTBOX: Dict[tuple, deque] = {}
+TELEGRAM_OUTBOX_COND = threading.Condition()
+TELEGRAM_RATE: Dict[str, Any] = {"global_next": 0.0, "chat_next": {}, "retry_until": {}}
+# Bot commands run on a small pool so getUpdates keeps polling while /report or /rebuild work.
+BOT_WORKERS = 4
+BOT_EXECUTOR = ThreadPoolExecutor(max_workers=BOT_WORKERS, thread_name_prefix="bot")
+# Write jobs waiting for their key, in arrival order, and the keys currently running.
+BOT_SERIAL_PENDING: deque = deque()
+BOT_SERIAL_RUNNING: set = set()
+BOT_SERIAL_LOCK = threading.Lock()
+# Commands that change servers or shared config; they run one at a time per target, and
+# fleet-wide ones (key "fleet") run alone.
+BOT_WRITE_COMMANDS = {
+    "/startserver",
+    "/stopserver",
+    "/reboot",
+    "/delete",
+    "/rebuild",
+    "/createsnapshot",
+    "/createfromsnapshot",
+    "/createfromsnapshots",
+    "/dnstest",
+    "/dnsync",
+    "/scheduleon",
+    "/scheduleoff",
+    "/scheduleset",
+    "/reportreset",
+}
+# Answered inline: no upstream calls, and menu commands must apply in order.
+BOT_INLINE_COMMANDS = {"/start", "/help", "/reportstatus", "/schedulestatus"}
+BOT_ACK_TEXT = "⏳ 处理中…"
+# Read-only replies are reused for telegram.command_cache_seconds while the fleet data version is unchanged.
+BOT_CACHE_TTL_SECONDS = 30
+BOT_CACHEABLE_COMMANDS = {"/list", "/listcode", "/status", "/ll", "/traffic", "/today"}
+BOT_RESPONSE_CACHE: Dict[tuple, Dict[str, Any]] = {}
+BOT_RESPONSE_CACHE_LOCK = threading.Lock()
+# Serializes update handling so polling and webhook deliveries apply in update_id order.
+BOT_UPDATE_LOCK = threading.Lock()
+TELEGRAM_WEBHOOK_STATE: Dict[str, Any] = {"applied": None}
+TELEGRAM_WEBHOOK_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Webhook updates received by follower workers are queued here for the leader, which owns BOT_STATE
+# (offset dedup, prompts, menus) and the outbox.
+TELEGRAM_INBOX_PATH = os.environ.get("HETZNER_WEB_TELEGRAM_INBOX", "/tmp/hetzner-web.telegram-inbox.json")
+TELEGRAM_INBOX_LOCK = threading.Lock()
+TELEGRAM_INBOX_MAX = 1000
+TELEGRAM_INBOX_POLL_SECONDS = 0.5
+TELEGRAM_ALLOWED_UPDATES = ["message", "callback_query"]
 QB_COOLDOWN_UNTIL: Dict[str, float] = {}
 QB_REBUILD_COOLDOWN_SECONDS = 300
+# One logged-in session per qB instance; sync/maindata is polled with rid so only deltas come back.
+QB_CLIENTS: Dict[tuple, Dict[str, Any]] = {}
+QB_CLIENTS_LOCK = threading.Lock()
+QB_DEADLINE_SECONDS = 10.0
+QB_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="qb")
+QB_HISTORY_DEFAULT_HOURS = 48
+QB_HISTORY_MAX_HOURS = 24 * 31
+# Upload pacing, per server name: the qB global upload limit we applied (bytes/s), the operator's
+# limit found before we engaged ("baseline", 0 = unlimited) and the last outbound counter.
+# Persisted so a restart only adopts or releases limits this service set.
+QB_PACING_STATE: Dict[str, Dict[str, Any]] = {}
+QB_PACING_STATE_PATH = os.environ.get("QB_PACING_STATE_PATH", "/app/qb_pacing_state.json")
+QB_PACING_META: Dict[str, Any] = {"loaded": False, "backoff": {}, "calls": {}}
+QB_PACING_MAX_BOOST = 3.0
+QB_PACING_MIN_CHANGE = 0.02
+QB_PACING_BACKOFF_SECONDS = 60
+QB_PACING_BACKOFF_MAX_SECONDS = 1800
 CF_RETRY_ATTEMPTS = 3
 CF_RETRY_DELAY_SECONDS = 5
 CF_REBUILD_SYNC_DELAY_SECONDS = 90
 CF_VERIFY_DELAY_SECONDS = 120
+# A records per zone (name -> id/content/ttl/proxied), filled by one paginated list and kept in step with our writes.
+CF_RECORD_CACHE: Dict[str, Dict[str, Any]] = {}
+CF_RECORD_CACHE_LOCK = threading.Lock()
+CF_RECORD_CACHE_SECONDS = 300
+CF_LIST_PAGE_SIZE = 1000
+CF_SYNC_WORKERS = 4
+CF_SYNC_EXECUTOR = ThreadPoolExecutor(max_workers=CF_SYNC_WORKERS, thread_name_prefix="dns")
+# Last fleet view seen by the DNS differ (sid -> name/ipv4); None until the first poll sets the baseline.
+DNS_FLEET_STATE: Dict[str, Any] = {"servers": None, "reconciled_at": 0.0}
+DELAYED_TASK_MAX_ATTEMPTS = 5
+DELAYED_TASK_BACKOFF_SECONDS = 30
+DELAYED_TASK_BACKOFF_MAX_SECONDS = 900
+DELAYED_TASK_POLL_SECONDS = 30
+DELAYED_TASKS_LOCK = threading.Lock()
+DELAYED_TASKS_WAKE = threading.Condition()
+DELAYED_TASK_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="delayed")
+API_CACHE_CONTROL = "private, no-cache"
+INDEX_CACHE_CONTROL = "no-cache"
+# Asset filenames are not content-hashed, so browsers revalidate against the ETag on every load.
+STATIC_CACHE_CONTROL = "public, no-cache"
+COMPRESS_MIN_BYTES = 1024
+# Part of every data-version ETag, so a deploy that changes payload shapes invalidates old validators.
+API_ETAG_SALT = str(os.stat(os.path.abspath(__file__)).st_mtime_ns)
+# Data sources an API payload is built from; "fleet" is the poll snapshot, paths are files.
+API_SOURCES_HISTORY = ("fleet", "REPORT_STATE")
+API_SOURCES_DASHBOARD = ("fleet", "REPORT_STATE", "CONFIG", "WEB_CONFIG")
+STATIC_ENCODED_CACHE: Dict[str, Dict[str, Any]] = {}
+FILE_CACHE: Dict[str, Dict[str, Any]] = {}
+UPSTREAM_MAX_WORKERS = max(4, int(os.environ.get("HETZNER_WEB_UPSTREAM_WORKERS", "16")))
+UPSTREAM_DEADLINE_SECONDS = float(os.environ.get("HETZNER_WEB_UPSTREAM_DEADLINE", "45"))
+HETZNER_HTTP_TIMEOUT = (5, 20)
+# Web handlers hand blocking upstream work to these pools so the event loop never
+# waits on Hetzner, Cloudflare or qBittorrent; rebuilds get their own pool so a
+# long rebuild cannot starve dashboard reads.
+UPSTREAM_EXECUTOR = ThreadPoolExecutor(max_workers=UPSTREAM_MAX_WORKERS, thread_name_prefix="upstream")
+REBUILD_CONCURRENCY = max(1, int(os.environ.get("HETZNER_WEB_REBUILD_CONCURRENCY", "2")))
+REBUILD_EXECUTOR = ThreadPoolExecutor(max_workers=REBUILD_CONCURRENCY, thread_name_prefix="rebuild")
+# Jobs run by this process (with their config/client); every job's view is also published to
+# REBUILD_JOBS_PATH so any uvicorn worker can dedup, list and long-poll it.
+REBUILD_JOBS: Dict[str, Dict[str, Any]] = {}
+REBUILD_JOBS_PATH = os.environ.get("HETZNER_WEB_REBUILD_JOBS", "/tmp/hetzner-web.jobs.json")
+REBUILD_JOBS_FILE_LOCK = threading.Lock()
+REBUILD_JOBS_LOCK = threading.Lock()
+REBUILD_JOB_RETENTION_SECONDS = 6 * 3600
+JOB_LONG_POLL_MAX_SECONDS = 60
+DNS_TIMEOUT_SECONDS = 3.0
+# Hetzner metrics are cached per (server, type): settled samples are kept, only the tail is refetched.
+METRICS_CACHE = MetricCache(on_lookup=lambda fresh: _cache_lookup("metrics", fresh))
+DNS_DEFAULT_TTL_SECONDS = 30
+DNS_MAX_TTL_SECONDS = 300
+DNS_NEGATIVE_TTL_SECONDS = 10
+DNS_CACHE: Dict[tuple, Dict[str, Any]] = {}
+METRICS_LOCK = threading.Lock()
+METRIC_META: Dict[str, tuple] = {}
+METRIC_VALUES: Dict[tuple, float] = {}
+METRIC_HISTOGRAMS: Dict[tuple, Dict[str, Any]] = {}
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOOP_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+FLEET_STATE: Dict[str, Any] = {"servers": {}, "updated_at": None, "version": 0, "full_at": None, "refreshed": []}
+UPSTREAM_CALL_TIMES: Dict[str, deque] = {}
+POLL_STATE: Dict[str, Dict[str, Any]] = {}
+MONITOR_STATE: Dict[str, Any] = {
+    "servers": [],
+    "servers_at": 0.0,
+    "last_bucket": None,
+    "refresh_requested": False,
+    "running": False,
+}
+FLEET_BUS = threading.Condition()
+FLEET_REFRESH = threading.Event()
+FLEET_SUBSCRIBERS: List[tuple] = []
+SNAPSHOT_MIN_MINUTES = 5
+SSE_KEEPALIVE_SECONDS = 15
+SSE_SNAPSHOT_CHECK_SECONDS = 1.0
+# Wakes /api/events streams on this process's event loop when a new fleet version is published.
+SSE_WAKE: Dict[str, Any] = {"loop": None, "future": None, "watcher": None, "listeners": 0}
+POLL_MIN_SECONDS = 60
+POLL_MAX_SECONDS = 900
+POLL_SAFETY_FACTOR = 0.5
+POLL_RATE_SMOOTHING = 0.5
+FORECAST_HISTORY_HOURS = 24 * 28
+FORECAST_HORIZON_HOURS = 24 * 40
+FORECAST_MIN_HISTORY_HOURS = 48
+FORECAST_TREND_ALPHA = 0.3
+FORECAST_WINDOW_HOURS = 24
+FORECAST_CACHE: Dict[str, Any] = {"source": None, "models": {}}
+LEADER_LOCK_PATH = os.environ.get("HETZNER_WEB_LEADER_LOCK", "/tmp/hetzner-web.leader.lock")
+FLEET_SNAPSHOT_PATH = os.environ.get("HETZNER_WEB_FLEET_SNAPSHOT", "/tmp/hetzner-web.fleet.json")
+LEADER_STATE: Dict[str, Any] = {"leader": False, "since": None, "fd": None}
+WORKER_STOP = threading.Event()
+WORKER_THREADS: Dict[str, threading.Thread] = {}
+WORKER_START_DELAY_SECONDS = 1.0
+WORKER_RESTART_BACKOFF_SECONDS = 1.0
+WORKER_RESTART_BACKOFF_MAX_SECONDS = 60.0
+WORKER_HEALTHY_SECONDS = 60.0
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get("HETZNER_WEB_SHUTDOWN_DRAIN", "25"))
+INFLIGHT_FUTURES: set = set()
+INFLIGHT_LOCK = threading.Lock()
+HEALTH_SNAPSHOT_PATH = os.environ.get("HETZNER_WEB_HEALTH_SNAPSHOT", "/tmp/hetzner-web.health.json")
+HEALTH_PUBLISH_SECONDS = 10
+HEALTH_MAX_CONSECUTIVE_ERRORS = 3
+HEALTH_ERROR_MAX_CHARS = 300
+# Seconds without a finished iteration before a loop counts as stale; fleet_poll is derived
+# from the poll interval. Override per loop with health.stale_seconds in config.yaml.
+HEALTH_STALE_SECONDS = {"telegram_bot": 180, "timer": 180, "delayed_tasks": 120}
+WORKER_HEALTH: Dict[str, Dict[str, Any]] = {}
+WORKER_HEALTH_LOCK = threading.Lock()
+HEALTH_STATE: Dict[str, Any] = {"started_at": time.time(), "published_at": 0.0}
+METRIC_META.update(
+    {
+        "hetzner_web_leader": ("gauge", "1 if this process runs the background workers."),
+        "hetzner_web_server_outbound_bytes": ("gauge", "Outbound traffic counter reported by Hetzner."),
+        "hetzner_web_server_inbound_bytes": ("gauge", "Inbound traffic counter reported by Hetzner."),
+        "hetzner_web_server_limit_bytes": ("gauge", "Configured outbound traffic limit."),
+        "hetzner_web_server_limit_percent": ("gauge", "Outbound traffic as percent of the limit."),
+        "hetzner_web_server_sample_age_seconds": ("gauge", "Age of the latest traffic sample per server."),
+        "hetzner_web_server_outbound_rate_bytes": ("gauge", "Smoothed outbound rate in bytes per second."),
+        "hetzner_web_server_poll_interval_seconds": ("gauge", "Delay until the next traffic check of the server."),
+        "hetzner_web_upstream_calls_last_hour": ("gauge", "Upstream API calls made in the last hour."),
+        "hetzner_web_server_rebuilds_total": ("counter", "Rebuilds recorded per server."),
+        "hetzner_web_fleet_snapshot_age_seconds": ("gauge", "Age of the latest fleet snapshot."),
+        "hetzner_web_rebuild_queue_jobs": ("gauge", "Rebuild jobs by status."),
+        "hetzner_web_delayed_tasks": ("gauge", "Persistent delayed tasks by kind and state."),
+        "hetzner_web_telegram_outbox_messages": ("gauge", "Telegram messages waiting in the outbound queue."),
+        "hetzner_web_delayed_task_runs_total": ("counter", "Delayed task executions by kind and result."),
+        "hetzner_web_upstream_request_seconds": ("histogram", "Upstream API call latency."),
+        "hetzner_web_upstream_errors_total": ("counter", "Failed upstream API calls."),
+        "hetzner_web_loop_duration_seconds": ("histogram", "Background loop iteration duration."),
+        "hetzner_web_loop_iterations_total": ("counter", "Background loop iterations by result."),
+        "hetzner_web_cache_requests_total": ("counter", "Cache lookups by cache and result."),
+        "hetzner_web_worker_restarts_total": ("counter", "Background worker restarts after a crash or exit."),
+        "hetzner_web_qb_upload_limit_bytes": ("gauge", "qBittorrent upload limit set by pacing (0 = unlimited)."),
+    }
+)
+DASHBOARD_SECTIONS = ("servers", "tracking", "rebuilds", "hourly", "daily", "cycle", "qb")
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_RESOLUTIONS = ("raw", "hour", "day")
+EXPORT_COLUMNS = (
+    "time",
+    "server_id",
+    "server",
+    "outbound_bytes",
+    "inbound_bytes",
+    "outbound_total_bytes",
+    "inbound_total_bytes",
+)
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def _build_http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=UPSTREAM_MAX_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+HTTP_SESSION = _build_http_session()
 
 
 def _load_yaml(path: str) -> Dict[str, Any]:
@@ -45,8 +318,33 @@ def _load_yaml(path: str) -> Dict[str, Any]:
 
 
 def _save_yaml(path: str, data: Dict[str, Any]) -> None:
-    with open(path, "w") as f:
-        yaml.safe_dump(data, f, sort_keys=False, allow_unicode=False)
+    _replace_file(path, lambda f: yaml.safe_dump(data, f, sort_keys=False, allow_unicode=False))
+
+
+@contextmanager
+def _locked_file(path: str, lock: threading.Lock) -> Iterator[None]:
+    """Serialize writers of path: lock within this process, flock on <path>.lock across workers."""
+    with lock:
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600) if fcntl is not None else None
+        try:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+
+def _update_config(update: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+    """Apply update to a fresh read of config.yaml and write it back; returns the written config.
+
+    Callers must not hold the config long: a snapshot taken earlier would erase edits made since.
+    """
+    with _locked_file(CONFIG_PATH, CONFIG_WRITE_LOCK):
+        config = _load_yaml(CONFIG_PATH)
+        update(config)
+        _save_yaml(CONFIG_PATH, config)
+    return config
 
 
 def _load_json(path: str) -> Dict[str, Any]:
@@ -56,11 +354,304 @@ def _load_json(path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
+def _load_cached(path: str, loader: Any) -> Dict[str, Any]:
+    """Return the parsed file, re-reading it only when its mtime or size changed.
+
+    The result is shared between callers and must be treated as read-only.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return loader(path)
+    cached = FILE_CACHE.get(path)
+    hit = bool(cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size)
+    _cache_lookup("file", hit)
+    if hit:
+        return cached["data"]
+    data = loader(path)
+    FILE_CACHE[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "data": data}
+    return data
+
+
+def _metric_key(name: str, labels: Optional[Dict[str, Any]]) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in (labels or {}).items())))
+
+
+def _metric_inc(name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1.0) -> None:
+    key = _metric_key(name, labels)
+    with METRICS_LOCK:
+        METRIC_VALUES[key] = METRIC_VALUES.get(key, 0.0) + value
+
+
+def _metric_set(name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+    with METRICS_LOCK:
+        METRIC_VALUES[_metric_key(name, labels)] = float(value)
+
+
+def _metric_observe(
+    name: str, value: float, labels: Optional[Dict[str, Any]] = None, buckets: tuple = LATENCY_BUCKETS
+) -> None:
+    key = _metric_key(name, labels)
+    with METRICS_LOCK:
+        hist = METRIC_HISTOGRAMS.get(key)
+        if hist is None:
+            hist = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            METRIC_HISTOGRAMS[key] = hist
+        for idx, bound in enumerate(hist["buckets"]):
+            if value <= bound:
+                hist["counts"][idx] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+
+def _cache_lookup(cache: str, hit: bool) -> None:
+    _metric_inc("hetzner_web_cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+def _upstream_endpoint(endpoint: str) -> str:
+    # servers/123/metrics -> servers/{id}/metrics, to keep label cardinality bounded.
+    return "/".join("{id}" if part.isdigit() else part for part in endpoint.strip("/").split("/"))
+
+
+def _observe_upstream(service: str, endpoint: str, started: float, ok: bool) -> None:
+    labels = {"service": service, "endpoint": _upstream_endpoint(endpoint)}
+    _metric_observe("hetzner_web_upstream_request_seconds", time.monotonic() - started, labels)
+    with METRICS_LOCK:
+        UPSTREAM_CALL_TIMES.setdefault(service, deque()).append(time.time())
+    if not ok:
+        _metric_inc("hetzner_web_upstream_errors_total", labels)
+
+
+def _observe_loop(loop: str, started: float, error: Optional[Exception] = None) -> None:
+    duration = time.monotonic() - started
+    _metric_observe("hetzner_web_loop_duration_seconds", duration, {"loop": loop}, LOOP_BUCKETS)
+    _metric_inc("hetzner_web_loop_iterations_total", {"loop": loop, "result": "error" if error else "ok"})
+    now = time.time()
+    with WORKER_HEALTH_LOCK:
+        entry = _worker_health_entry(loop)
+        entry["last_start"] = now - duration
+        entry["last_finish"] = now
+        entry["duration"] = round(duration, 3)
+        if error is None:
+            entry["ok"] += 1
+            entry["consecutive_errors"] = 0
+        else:
+            entry["errors"] += 1
+            entry["consecutive_errors"] += 1
+            entry["last_error"] = _redact_error(error)
+            entry["last_error_at"] = now
+    _publish_worker_health()
+
+
+def _worker_health_entry(name: str) -> Dict[str, Any]:
+    return WORKER_HEALTH.setdefault(
+        name,
+        {
+            "last_start": None,
+            "last_finish": None,
+            "duration": None,
+            "ok": 0,
+            "errors": 0,
+            "consecutive_errors": 0,
+            "last_error": None,
+            "last_error_at": None,
+            "restarts": 0,
+        },
+    )
+
+
+def _redact_error(error: Any) -> str:
+    # requests errors embed the URL, which for Telegram carries the bot token.
+    text = re.sub(r"bot\d+:[A-Za-z0-9_-]+", "bot<redacted>", str(error))
+    return text[:HEALTH_ERROR_MAX_CHARS]
+
+
+def _publish_worker_health(force: bool = False) -> None:
+    """Leader writes the registry to a shared file (throttled) so any process can answer /healthz."""
+    if not LEADER_STATE["leader"]:
+        return
+    now = time.time()
+    with WORKER_HEALTH_LOCK:
+        if not force and now - HEALTH_STATE["published_at"] < HEALTH_PUBLISH_SECONDS:
+            return
+        HEALTH_STATE["published_at"] = now
+        workers = {name: dict(entry) for name, entry in WORKER_HEALTH.items()}
+    try:
+        _save_json(
+            HEALTH_SNAPSHOT_PATH,
+            {"pid": os.getpid(), "started_at": HEALTH_STATE["started_at"], "updated_at": now, "workers": workers},
+        )
+    except Exception as e:
+        print(f"[alert] health snapshot write failed: {e}")
+
+
+def _upstream_calls_last_hour() -> Dict[str, int]:
+    cutoff = time.time() - 3600
+    with METRICS_LOCK:
+        for calls in UPSTREAM_CALL_TIMES.values():
+            while calls and calls[0] < cutoff:
+                calls.popleft()
+        return {service: len(calls) for service, calls in UPSTREAM_CALL_TIMES.items()}
+
+
+def _update_fleet_server(
+    sid: str,
+    name: str,
+    outgoing: Any,
+    ingoing: Any,
+    limit_bytes: Optional[float],
+    rate: Optional[float] = None,
+    poll_seconds: Optional[float] = None,
+    status: Optional[str] = None,
+    ipv4: Optional[str] = None,
+    server_type: Optional[str] = None,
+    location: Optional[str] = None,
+) -> None:
+    entry = {
+        "id": str(sid),
+        "name": name,
+        "status": status,
+        "ipv4": ipv4,
+        "server_type": server_type,
+        "location": location,
+        "outbound_bytes": float(outgoing) if outgoing is not None else None,
+        "inbound_bytes": float(ingoing) if ingoing is not None else None,
+        "limit_bytes": limit_bytes,
+        "percent": (float(outgoing) / limit_bytes * 100) if outgoing is not None and limit_bytes else None,
+        "rate": rate,
+        "poll_seconds": poll_seconds,
+        "sampled_at": time.time(),
+    }
+    FLEET_STATE["servers"][str(sid)] = entry
+    FLEET_STATE["updated_at"] = entry["sampled_at"]
+
+
+def _publish_fleet_state() -> None:
+    try:
+        _save_json(FLEET_SNAPSHOT_PATH, FLEET_STATE)
+    except Exception as e:
+        print(f"[alert] fleet snapshot write failed: {e}")
+
+
+def _current_fleet_state() -> Dict[str, Any]:
+    """The leader's in-memory fleet state; followers read the snapshot it publishes."""
+    if LEADER_STATE["leader"] or not os.path.exists(FLEET_SNAPSHOT_PATH):
+        return FLEET_STATE
+    return _load_cached(FLEET_SNAPSHOT_PATH, _load_json) or FLEET_STATE
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def _format_metric_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _render_metrics() -> str:
+    """Render the in-memory registries plus the latest fleet snapshot as Prometheus text.
+
+    Everything here reads pre-aggregated state; no history or upstream is touched per scrape.
+    """
+    gauges: Dict[tuple, float] = {}
+
+    def _gauge(name: str, value: Any, labels: Optional[Dict[str, Any]] = None) -> None:
+        if value is not None:
+            gauges[_metric_key(name, labels)] = float(value)
+
+    now = time.time()
+    fleet = _current_fleet_state()
+    _gauge("hetzner_web_leader", 1 if LEADER_STATE["leader"] else 0)
+    for sid, entry in list((fleet.get("servers") or {}).items()):
+        labels = {"server_id": sid, "server": entry.get("name") or sid}
+        _gauge("hetzner_web_server_outbound_bytes", entry.get("outbound_bytes"), labels)
+        _gauge("hetzner_web_server_inbound_bytes", entry.get("inbound_bytes"), labels)
+        _gauge("hetzner_web_server_limit_bytes", entry.get("limit_bytes"), labels)
+        _gauge("hetzner_web_server_limit_percent", entry.get("percent"), labels)
+        _gauge("hetzner_web_server_sample_age_seconds", now - entry["sampled_at"], labels)
+        _gauge("hetzner_web_server_outbound_rate_bytes", entry.get("rate"), labels)
+        _gauge("hetzner_web_server_poll_interval_seconds", entry.get("poll_seconds"), labels)
+    if fleet.get("updated_at"):
+        _gauge("hetzner_web_fleet_snapshot_age_seconds", now - fleet["updated_at"])
+    for service, calls in _upstream_calls_last_hour().items():
+        _gauge("hetzner_web_upstream_calls_last_hour", calls, {"service": service})
+    for (kind, task_state), depth in _delayed_queue_depth().items():
+        _gauge("hetzner_web_delayed_tasks", depth, {"kind": kind, "state": task_state})
+    for status, depth in _rebuild_queue_depth().items():
+        _gauge("hetzner_web_rebuild_queue_jobs", depth, {"status": status})
+    _gauge("hetzner_web_telegram_outbox_messages", _telegram_outbox_depth())
+
+    lines: List[str] = []
+    emitted = set()
+
+    def _header(name: str, default_type: str) -> None:
+        if name in emitted:
+            return
+        emitted.add(name)
+        metric_type, help_text = METRIC_META.get(name, (default_type, name.replace("_", " ")))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    with METRICS_LOCK:
+        values = sorted(METRIC_VALUES.items())
+        histograms = sorted(
+            (key, {**hist, "counts": list(hist["counts"])}) for key, hist in METRIC_HISTOGRAMS.items()
+        )
+    for (name, labels), value in sorted(gauges.items()) + values:
+        _header(name, "counter" if name.endswith("_total") else "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {_format_metric_value(value)}")
+    for (name, labels), hist in histograms:
+        _header(name, "histogram")
+        for bound, count in zip(hist["buckets"], hist["counts"]):
+            le = (("le", _format_metric_value(bound)),)
+            lines.append(f"{name}_bucket{_format_labels(labels, le)} {count}")
+        lines.append(f'{name}_bucket{_format_labels(labels, (("le", "+Inf"),))} {hist["count"]}')
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_metric_value(hist['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _replace_file(path: str, write: Callable[[Any], None]) -> None:
+    """Write through a private temp file in the same directory and rename it over path.
+
+    Concurrent writers each get their own temp file, so readers only ever see a complete file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            write(f)
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except OSError:
+            os.chmod(tmp, 0o644)
+        try:
+            os.replace(tmp, path)
+        except OSError as exc:
+            if exc.errno != errno.EBUSY:
+                raise
+            # A single-file bind mount (docker-compose) cannot be renamed over; rewrite it in place.
+            shutil.copyfile(tmp, path)
+            os.unlink(tmp)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def _save_json(path: str, data: Dict[str, Any]) -> None:
-    tmp = f"{path}.tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f)
-    os.replace(tmp, path)
+    _replace_file(path, lambda f: json.dump(data, f))
 
 
 def _load_threshold_state() -> Dict[str, int]:
@@ -110,10 +701,134 @@ def _load_report_state() -> Dict[str, Any]:
         return {}
 
 
-def _save_report_state(state: Dict[str, Any]) -> None:
-    _backup_report_state()
-    with open(REPORT_STATE_PATH, "w") as f:
-        json.dump(state, f)
+def _update_report_state(update: Callable[[Dict[str, Any]], Any]) -> Any:
+    """Load, update and save report_state.json under one lock (shared by all workers); returns update's result."""
+    with _locked_file(REPORT_STATE_PATH, REPORT_STATE_LOCK):
+        state = _load_report_state()
+        result = update(state)
+        _backup_report_state()
+        _save_json(REPORT_STATE_PATH, state)
+    return result
+
+
+class _JsonStreamReader:
+    """Walks a JSON document in fixed-size chunks, decoding one value at a time."""
+
+    def __init__(self, fp: Any, chunk_size: int = 65536) -> None:
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self._buf += chunk
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self._pos}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A bare number touching the end of the buffer may continue in the next chunk.
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    def skip_separator(self, close: str) -> bool:
+        char = self.peek()
+        if char == ",":
+            self._pos += 1
+            return True
+        if char == close:
+            self._pos += 1
+            return False
+        raise ValueError(f"expected ',' or {close!r} at offset {self._pos}")
+
+    def items(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if not self.skip_separator("}"):
+                return
+
+
+def _iter_report_state_section(section: str, path: Optional[str] = None):
+    """Yield ``(key, value)`` pairs of one top-level object in report_state.json.
+
+    Only a single entry is held in memory at a time, so a year of 5-minute
+    buckets streams in constant space.
+    """
+    path = path or REPORT_STATE_PATH
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        reader = _JsonStreamReader(f)
+        for key in reader.items():
+            if key != section:
+                reader.value()
+                continue
+            if reader.peek() != "{":
+                reader.value()
+                return
+            for entry_key in reader.items():
+                yield entry_key, reader.value()
+            return
+
+
+def _iter_hourly_sorted(path: Optional[str] = None, window: int = 16):
+    """Stream hourly snapshots in key order.
+
+    Buckets are appended chronologically, apart from the occasional backfilled
+    previous bucket; a small reorder window absorbs those.
+    """
+    pending: List[Any] = []
+    seq = 0
+    for key, snapshot in _iter_report_state_section("hourly", path):
+        if not isinstance(snapshot, dict):
+            continue
+        heapq.heappush(pending, (key, seq, snapshot))
+        seq += 1
+        if len(pending) > window:
+            key, _, snapshot = heapq.heappop(pending)
+            yield key, snapshot
+    while pending:
+        key, _, snapshot = heapq.heappop(pending)
+        yield key, snapshot
 
 
 def _backup_report_state() -> None:
@@ -186,22 +901,29 @@ def _backfill_rebuild_stats(state: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def _record_rebuild_event(server_id: int, server_name: str, source: str) -> None:
-    state = _load_report_state()
-    stats = state.get("rebuild_stats", {}) or {}
-    key = server_name or str(server_id)
-    entry = stats.get(key, {}) or {}
-    entry["count"] = int(entry.get("count") or 0) + 1
-    now = _now_local()
-    entry["last_time"] = now.strftime("%Y-%m-%d %H:%M:%S")
-    entry["last_time_iso"] = now.isoformat()
-    entry["last_source"] = source
-    entry["last_server_id"] = str(server_id)
-    sources = entry.get("sources", {}) or {}
-    sources[source] = int(sources.get(source) or 0) + 1
-    entry["sources"] = sources
-    stats[key] = entry
-    state["rebuild_stats"] = stats
-    _save_report_state(state)
+    def _apply(state: Dict[str, Any]) -> Dict[str, Any]:
+        stats = state.get("rebuild_stats", {}) or {}
+        key = server_name or str(server_id)
+        entry = stats.get(key, {}) or {}
+        entry["count"] = int(entry.get("count") or 0) + 1
+        now = _now_local()
+        entry["last_time"] = now.strftime("%Y-%m-%d %H:%M:%S")
+        entry["last_time_iso"] = now.isoformat()
+        entry["last_source"] = source
+        entry["last_server_id"] = str(server_id)
+        sources = entry.get("sources", {}) or {}
+        sources[source] = int(sources.get(source) or 0) + 1
+        entry["sources"] = sources
+        stats[key] = entry
+        state["rebuild_stats"] = stats
+        return stats
+
+    _publish_rebuild_stats(_update_report_state(_apply))
+
+
+def _publish_rebuild_stats(stats: Dict[str, Any]) -> None:
+    for name, entry in stats.items():
+        _metric_set("hetzner_web_server_rebuilds_total", int(entry.get("count") or 0), {"server": name})
 
 
 def _summarize_rebuild_stats(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -258,6 +980,7 @@ def _normalize_qb_instances(qb_cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
                     "login_retries": qb_cfg.get("login_retries"),
                     "login_retry_delay": qb_cfg.get("login_retry_delay"),
                     "counter_mode": qb_cfg.get("counter_mode"),
+                    "deadline_seconds": qb_cfg.get("deadline_seconds"),
                 }
             ]
     if not instances:
@@ -280,42 +1003,48 @@ def _normalize_qb_instances(qb_cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
                 "login_retries": entry.get("login_retries"),
                 "login_retry_delay": entry.get("login_retry_delay"),
                 "counter_mode": entry.get("counter_mode"),
+                "deadline_seconds": entry.get("deadline_seconds", qb_cfg.get("deadline_seconds")),
             }
         )
     return normalized
 
 
-def _fetch_qb_instance(instance: Dict[str, Any], counter_mode: str) -> Dict[str, Any]:
-    base_url = str(instance.get("url") or "").rstrip("/")
-    name = instance.get("name") or base_url
-    username = instance.get("username") or ""
-    password = instance.get("password") or ""
-    timeout = float(instance.get("timeout_seconds") or 6)
-    login_retries = max(1, int(instance.get("login_retries") or 3))
-    login_retry_delay = max(0, float(instance.get("login_retry_delay") or 3))
-    verify_ssl = instance.get("verify_ssl", True)
-    if not base_url or not username or not password:
-        return {
-            "name": name,
-            "url": base_url,
-            "status": "error",
-            "error": "missing_credentials",
-            "counter_mode": counter_mode,
-        }
-    now = time.time()
-    cooldown_until = QB_COOLDOWN_UNTIL.get(name) or QB_COOLDOWN_UNTIL.get(base_url)
-    if cooldown_until and now < cooldown_until:
-        return {
-            "name": name,
-            "url": base_url,
-            "status": "error",
-            "error": "cooldown",
-            "counter_mode": counter_mode,
-        }
+def _qb_client(base_url: str, username: str) -> Dict[str, Any]:
+    key = (base_url, username)
+    with QB_CLIENTS_LOCK:
+        client = QB_CLIENTS.get(key)
+        if client is None:
+            client = {
+                "session": requests.Session(),
+                "logged_in": False,
+                "rid": 0,
+                "server_state": {},
+                "lock": threading.Lock(),
+                "fetch": None,
+            }
+            QB_CLIENTS[key] = client
+        return client
+
+
+def _qb_login(
+    client: Dict[str, Any],
+    base_url: str,
+    username: str,
+    password: str,
+    timeout: float,
+    verify_ssl: Any,
+    retries: int,
+    retry_delay: float,
+) -> Optional[str]:
+    # A fresh session drops the stale SID; the delta state is rebuilt from rid=0.
+    old_session = client.get("session")
+    if old_session is not None:
+        old_session.close()
     session = requests.Session()
-    login = None
+    client.update({"session": session, "logged_in": False, "rid": 0, "server_state": {}})
     last_error = None
-    for attempt in range(login_retries):
+    for attempt in range(retries):
+        started = time.monotonic()
         try:
             login = session.post(
                 f"{base_url}/api/v2/auth/login",
@@ -323,41 +1052,152 @@ def _fetch_qb_instance(instance: Dict[str, Any], counter_mode: str) -> Dict[str,
                 timeout=timeout,
                 verify=verify_ssl,
             )
+            _observe_upstream("qbittorrent", "auth/login", started, login.status_code == 200)
             if login.status_code == 200 and login.text.strip().lower().startswith("ok"):
-                break
+                client["logged_in"] = True
+                return None
             body = login.text.strip()
             if body:
                 last_error = f"status={login.status_code} body={body}"
             else:
                 last_error = f"status={login.status_code}"
         except Exception as exc:
+            _observe_upstream("qbittorrent", "auth/login", started, False)
             last_error = exc
-        if attempt + 1 < login_retries:
-            time.sleep(login_retry_delay)
-    if not login or login.status_code != 200 or "Ok." not in login.text:
+        if attempt + 1 < retries:
+            time.sleep(retry_delay)
+    return f"login_failed: {last_error}"
+
+
+def _qb_sync_maindata(client: Dict[str, Any], base_url: str, timeout: float, verify_ssl: Any) -> requests.Response:
+    started = time.monotonic()
+    try:
+        resp = client["session"].get(
+            f"{base_url}/api/v2/sync/maindata",
+            params={"rid": client["rid"]},
+            timeout=timeout,
+            verify=verify_ssl,
+        )
+    except Exception:
+        _observe_upstream("qbittorrent", "sync/maindata", started, False)
+        raise
+    _observe_upstream("qbittorrent", "sync/maindata", started, resp.ok)
+    return resp
+
+
+def _qb_apply_maindata(client: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    state = payload.get("server_state")
+    if payload.get("full_update") or client["rid"] == 0:
+        client["server_state"] = dict(state or {})
+    elif isinstance(state, dict):
+        client["server_state"].update(state)
+    rid = payload.get("rid")
+    if isinstance(rid, int):
+        client["rid"] = rid
+
+
+def _qb_request(instance: Dict[str, Any], path: str, data: Optional[Dict[str, Any]] = None) -> requests.Response:
+    """Call the qB Web API on the instance's shared session, logging in again once on 403."""
+    base_url = str(instance.get("url") or "").rstrip("/")
+    username = instance.get("username") or ""
+    password = instance.get("password") or ""
+    timeout = float(instance.get("timeout_seconds") or 6)
+    login_retries = max(1, int(instance.get("login_retries") or 3))
+    login_retry_delay = max(0, float(instance.get("login_retry_delay") or 3))
+    verify_ssl = instance.get("verify_ssl", True)
+    if not base_url or not username or not password:
+        raise RuntimeError("missing_credentials")
+    client = _qb_client(base_url, username)
+    with client["lock"]:
+        for attempt in range(2):
+            if not client["logged_in"]:
+                error = _qb_login(
+                    client, base_url, username, password, timeout, verify_ssl, login_retries, login_retry_delay
+                )
+                if error:
+                    raise RuntimeError(error)
+            started = time.monotonic()
+            try:
+                resp = client["session"].request(
+                    "POST" if data is not None else "GET",
+                    f"{base_url}/api/v2/{path}",
+                    data=data,
+                    timeout=timeout,
+                    verify=verify_ssl,
+                )
+            except Exception:
+                _observe_upstream("qbittorrent", path, started, False)
+                raise
+            _observe_upstream("qbittorrent", path, started, resp.ok)
+            if resp.status_code == 403 and attempt == 0:
+                client["logged_in"] = False
+                continue
+            resp.raise_for_status()
+            return resp
+    raise RuntimeError("unreachable")
+
+
+def _fetch_qb_instance(instance: Dict[str, Any], counter_mode: str) -> Dict[str, Any]:
+    base_url = str(instance.get("url") or "").rstrip("/")
+    name = instance.get("name") or base_url
+    username = instance.get("username") or ""
+    password = instance.get("password") or ""
+    timeout = float(instance.get("timeout_seconds") or 6)
+    login_retries = max(1, int(instance.get("login_retries") or 3))
+    login_retry_delay = max(0, float(instance.get("login_retry_delay") or 3))
+    verify_ssl = instance.get("verify_ssl", True)
+    if not base_url or not username or not password:
         return {
             "name": name,
             "url": base_url,
             "status": "error",
-            "error": f"login_failed: {last_error}",
+            "error": "missing_credentials",
             "counter_mode": counter_mode,
         }
-    try:
-        info = session.get(
-            f"{base_url}/api/v2/sync/maindata",
-            timeout=timeout,
-            verify=verify_ssl,
-        )
-        payload = info.json()
-    except Exception as exc:
+    now = time.time()
+    cooldown_until = QB_COOLDOWN_UNTIL.get(name) or QB_COOLDOWN_UNTIL.get(base_url)
+    if cooldown_until and now < cooldown_until:
         return {
             "name": name,
             "url": base_url,
             "status": "error",
-            "error": f"fetch_failed: {exc}",
+            "error": "cooldown",
             "counter_mode": counter_mode,
         }
-    state = payload.get("server_state") or {}
+    client = _qb_client(base_url, username)
+    with client["lock"]:
+        if not client["logged_in"]:
+            error = _qb_login(client, base_url, username, password, timeout, verify_ssl, login_retries, login_retry_delay)
+            if error:
+                return {"name": name, "url": base_url, "status": "error", "error": error, "counter_mode": counter_mode}
+        try:
+            info = _qb_sync_maindata(client, base_url, timeout, verify_ssl)
+            if info.status_code == 403:
+                # SID expired (qB restarted or session timeout): log in again once and resync from rid=0.
+                error = _qb_login(
+                    client, base_url, username, password, timeout, verify_ssl, login_retries, login_retry_delay
+                )
+                if error:
+                    return {
+                        "name": name,
+                        "url": base_url,
+                        "status": "error",
+                        "error": error,
+                        "counter_mode": counter_mode,
+                    }
+                info = _qb_sync_maindata(client, base_url, timeout, verify_ssl)
+            info.raise_for_status()
+            _qb_apply_maindata(client, info.json())
+        except Exception as exc:
+            client["rid"] = 0
+            return {
+                "name": name,
+                "url": base_url,
+                "status": "error",
+                "error": f"fetch_failed: {exc}",
+                "counter_mode": counter_mode,
+            }
+        state = dict(client["server_state"])
     alltime_ul = state.get("alltime_ul")
     alltime_dl = state.get("alltime_dl")
     up_info = state.get("up_info_data")
@@ -381,6 +1221,25 @@ def _fetch_qb_instance(instance: Dict[str, Any], counter_mode: str) -> Dict[str,
     }
 
 
+def _submit_qb_fetch(instance: Dict[str, Any], counter_mode: str) -> Future:
+    """Single-flight per instance: callers share the in-flight fetch instead of queueing behind its lock.
+
+    A fetch stuck on a dead seedbox therefore holds one pool thread, not one per caller.
+    """
+    base_url = str(instance.get("url") or "").rstrip("/")
+    username = instance.get("username") or ""
+    if not base_url or not username:
+        return QB_EXECUTOR.submit(_fetch_qb_instance, instance, counter_mode)
+    client = _qb_client(base_url, username)
+    with QB_CLIENTS_LOCK:
+        inflight = client["fetch"]
+        if inflight is not None and not inflight[1].done() and inflight[0] == counter_mode:
+            return inflight[1]
+        future = QB_EXECUTOR.submit(_fetch_qb_instance, instance, counter_mode)
+        client["fetch"] = (counter_mode, future)
+        return future
+
+
 def _collect_qbittorrent_stats(config: Dict[str, Any]) -> Dict[str, Any]:
     qb_cfg = config.get("qbittorrent", {}) or {}
     if not qb_cfg.get("enabled"):
@@ -401,12 +1260,40 @@ def _collect_qbittorrent_stats(config: Dict[str, Any]) -> Dict[str, Any]:
             "total_download_bytes": 0,
             "counter_mode": counter_mode,
         }
+    started = time.monotonic()
+    pending = []
+    for instance in instances:
+        instance_mode = instance.get("counter_mode") or counter_mode
+        try:
+            deadline = max(1.0, float(instance.get("deadline_seconds") or QB_DEADLINE_SECONDS))
+        except (TypeError, ValueError):
+            deadline = QB_DEADLINE_SECONDS
+        pending.append((instance, instance_mode, deadline, _submit_qb_fetch(instance, instance_mode)))
     results = []
     total_upload = 0
     total_download = 0
-    for instance in instances:
-        instance_mode = instance.get("counter_mode") or counter_mode
-        result = _fetch_qb_instance(instance, instance_mode)
+    for instance, instance_mode, deadline, future in pending:
+        try:
+            result = future.result(timeout=max(0.0, started + deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # The fetch keeps running in the pool; later polls join it until it finishes.
+            base_url = str(instance.get("url") or "").rstrip("/")
+            result = {
+                "name": instance.get("name") or base_url,
+                "url": base_url,
+                "status": "error",
+                "error": f"deadline_exceeded: {deadline:g}s",
+                "counter_mode": instance_mode,
+            }
+        except Exception as exc:
+            base_url = str(instance.get("url") or "").rstrip("/")
+            result = {
+                "name": instance.get("name") or base_url,
+                "url": base_url,
+                "status": "error",
+                "error": f"fetch_failed: {exc}",
+                "counter_mode": instance_mode,
+            }
         results.append(result)
         if result.get("status") == "ok":
             upload = result.get("upload_bytes")
@@ -468,10 +1355,371 @@ def _build_qb_compare_line(
     return "\n".join(lines)
 
 
-def _date_from_hour_key(key: str) -> Optional[str]:
-    if not key:
+def _qb_pacing_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    qb_cfg = config.get("qbittorrent", {}) or {}
+    pacing = qb_cfg.get("pacing") or {}
+    settings = {
+        "enabled": bool(qb_cfg.get("enabled") and pacing.get("enabled")),
+        "target_percent": 95.0,
+        "min_upload_kib": 256.0,
+        "gain": 0.5,
+        "cycle_reset_day": 1,
+        "notify": True,
+    }
+    for key, cast in (("target_percent", float), ("min_upload_kib", float), ("gain", float), ("cycle_reset_day", int)):
+        if pacing.get(key) is not None:
+            try:
+                settings[key] = cast(pacing.get(key))
+            except (TypeError, ValueError):
+                pass
+    if pacing.get("notify") is not None:
+        settings["notify"] = bool(pacing.get("notify"))
+    settings["gain"] = max(0.05, min(1.0, settings["gain"]))
+    settings["cycle_reset_day"] = max(1, min(28, settings["cycle_reset_day"]))
+    return settings
+
+
+def _traffic_cycle_end(now: datetime, reset_day: int) -> datetime:
+    end = now.replace(day=reset_day, hour=0, minute=0, second=0, microsecond=0)
+    if end <= now:
+        end = end.replace(year=now.year + 1, month=1) if now.month == 12 else end.replace(month=now.month + 1)
+    return end
+
+
+def _qb_pacing_limit(
+    outgoing: float,
+    limit_bytes: float,
+    rate: Optional[float],
+    current: Optional[float],
+    seconds_left: float,
+    settings: Dict[str, Any],
+) -> Optional[float]:
+    """Next qB upload limit in bytes/s, or None while the server is under pace and not yet throttled.
+
+    The target rate spreads the remaining budget over the rest of the cycle. Once engaged, the limit
+    is scaled by the ratio of target to observed Hetzner outbound rate, damped by the gain, so qB's
+    own accounting gap (protocol overhead, other services) is corrected by the feedback.
+    """
+    floor = settings["min_upload_kib"] * 1024
+    budget = limit_bytes * settings["target_percent"] / 100 - outgoing
+    if budget <= 0:
+        return floor
+    target = budget / max(seconds_left, 60.0)
+    if current is None:
+        if rate is None or rate <= target:
+            return None
+        return max(floor, target)
+    if not rate or rate <= 0:
+        limit = current
+    else:
+        limit = current * (1 + settings["gain"] * (target / rate - 1))
+    return max(floor, min(limit, target * QB_PACING_MAX_BOOST))
+
+
+def _load_qb_pacing_state() -> None:
+    if QB_PACING_META["loaded"]:
+        return
+    QB_PACING_META["loaded"] = True
+    try:
+        raw = _load_json(QB_PACING_STATE_PATH)
+    except Exception as e:
+        print(f"[alert] qB pacing state load failed: {e}")
+        return
+    for name, entry in raw.items():
+        if isinstance(entry, dict) and entry.get("limit"):
+            QB_PACING_STATE[str(name)] = {
+                "limit": float(entry["limit"]),
+                "baseline": float(entry.get("baseline") or 0),
+                "outgoing": entry.get("outgoing"),
+                "adopted": False,
+            }
+
+
+def _save_qb_pacing_state() -> None:
+    state = {
+        name: {"limit": pacing["limit"], "baseline": pacing.get("baseline") or 0, "outgoing": pacing.get("outgoing")}
+        for name, pacing in QB_PACING_STATE.items()
+        if pacing.get("limit")
+    }
+    try:
+        _save_json(QB_PACING_STATE_PATH, state)
+    except Exception as e:
+        print(f"[alert] qB pacing state save failed: {e}")
+
+
+def _qb_pacing_backing_off(server_name: str) -> bool:
+    backoff = QB_PACING_META["backoff"].get(server_name)
+    return bool(backoff and time.time() < backoff["until"])
+
+
+def _qb_pacing_call(
+    server_name: str, instance: Dict[str, Any], path: str, data: Optional[Dict[str, Any]] = None
+) -> str:
+    """Run one pacing request on QB_EXECUTOR under the instance deadline.
+
+    Unreachable instances are backed off exponentially, and a call still stuck from an earlier
+    poll is not stacked on, so a dead seedbox costs the poller nothing but a dict lookup.
+    """
+    now = time.time()
+    backoff = QB_PACING_META["backoff"].get(server_name)
+    if backoff and now < backoff["until"]:
+        raise RuntimeError(f"backing off until {datetime.fromtimestamp(backoff['until']).strftime('%H:%M:%S')}")
+    previous = QB_PACING_META["calls"].get(server_name)
+    if previous is not None and not previous.done():
+        error: Exception = RuntimeError("previous call still running")
+    else:
+        try:
+            deadline = max(1.0, float(instance.get("deadline_seconds") or QB_DEADLINE_SECONDS))
+        except (TypeError, ValueError):
+            deadline = QB_DEADLINE_SECONDS
+        future = QB_EXECUTOR.submit(_qb_request, instance, path, data)
+        QB_PACING_META["calls"][server_name] = future
+        try:
+            text = future.result(timeout=deadline).text.strip()
+            QB_PACING_META["backoff"].pop(server_name, None)
+            return text
+        except FutureTimeoutError:
+            error = RuntimeError(f"deadline_exceeded: {deadline:g}s")
+        except Exception as e:
+            error = e
+    delay = QB_PACING_BACKOFF_SECONDS
+    if backoff:
+        delay = min(QB_PACING_BACKOFF_MAX_SECONDS, backoff["delay"] * 2)
+    QB_PACING_META["backoff"][server_name] = {"until": now + delay, "delay": delay}
+    raise error
+
+
+def _qb_set_upload_limit(server_name: str, instance: Dict[str, Any], limit: float) -> bool:
+    try:
+        _qb_pacing_call(server_name, instance, "transfer/setUploadLimit", {"limit": int(limit)})
+    except Exception as e:
+        print(f"[alert] qB pacing: set upload limit failed: server={server_name} error={e}")
+        return False
+    _metric_set("hetzner_web_qb_upload_limit_bytes", int(limit), {"server": server_name})
+    return True
+
+
+def _qb_pacing_matches(server_name: str, instance: Dict[str, Any], pacing: Dict[str, Any]) -> Optional[bool]:
+    """Whether qB still has the limit we set; None when the instance cannot be asked."""
+    try:
+        current = float(_qb_pacing_call(server_name, instance, "transfer/uploadLimit") or 0)
+    except Exception as e:
+        print(f"[alert] qB pacing: read upload limit failed: server={server_name} error={e}")
         return None
-    return key.split(" ", 1)[0] if " " in key else None
+    return abs(current - int(pacing["limit"])) < 1024
+
+
+def _release_qb_pacing(instances: Dict[str, Dict[str, Any]]) -> None:
+    """Restore the operator's limit on every instance whose current limit is still ours."""
+    for name, pacing in list(QB_PACING_STATE.items()):
+        instance = instances.get(name)
+        if not pacing.get("limit") or not instance:
+            QB_PACING_STATE.pop(name, None)
+            continue
+        if _qb_pacing_backing_off(name):
+            continue
+        matches = _qb_pacing_matches(name, instance, pacing)
+        if matches is None:
+            continue
+        if matches and not _qb_set_upload_limit(name, instance, pacing.get("baseline") or 0):
+            continue
+        note = "" if matches else " (limit changed by operator, left as is)"
+        print(f"[info] qB pacing released: server={name}{note}")
+        QB_PACING_STATE.pop(name, None)
+    _save_qb_pacing_state()
+
+
+def _pace_qb_uploads(event: Dict[str, Any]) -> None:
+    """Throttle qB uploads so the rest of the traffic budget lasts until the cycle resets."""
+    config = event["config"]
+    settings = _qb_pacing_settings(config)
+    instances = {
+        str(inst["name"]): inst
+        for inst in _normalize_qb_instances(config.get("qbittorrent", {}) or {})
+        if inst.get("name")
+    }
+    limit_bytes = _traffic_limit_bytes(config)
+    _load_qb_pacing_state()
+    if not settings["enabled"] or not limit_bytes:
+        if any(pacing.get("limit") for pacing in QB_PACING_STATE.values()):
+            _release_qb_pacing(instances)
+        return
+    now = event["taken_at"]
+    cycle_end = _traffic_cycle_end(now, settings["cycle_reset_day"])
+    seconds_left = (cycle_end - now).total_seconds()
+    telegram_cfg = config.get("telegram", {}) or {}
+    for sid in event["refreshed"]:
+        entry = event["servers"].get(sid) or {}
+        name = entry.get("name") or sid
+        instance = instances.get(name)
+        outgoing = entry.get("outbound_bytes")
+        if not instance or outgoing is None or _qb_pacing_backing_off(name):
+            continue
+        pacing = QB_PACING_STATE.setdefault(name, {"limit": None, "baseline": 0.0, "outgoing": None, "adopted": True})
+        if not pacing["adopted"]:
+            # A limit persisted by a previous process: keep managing it only if qB still has it.
+            matches = _qb_pacing_matches(name, instance, pacing)
+            if matches is None:
+                continue
+            pacing["adopted"] = True
+            if not matches:
+                print(f"[info] qB pacing: server={name} limit changed by operator, no longer managed")
+                pacing.update(limit=None, baseline=0.0)
+                _save_qb_pacing_state()
+        if pacing["outgoing"] is not None and float(outgoing) < pacing["outgoing"]:
+            # Counter reset: new billing cycle or a rebuilt server (whose qB starts unthrottled).
+            cooldown_until = QB_COOLDOWN_UNTIL.get(name)
+            if pacing["limit"] and not (cooldown_until and time.time() < cooldown_until):
+                _qb_set_upload_limit(name, instance, pacing.get("baseline") or 0)
+            pacing.update(limit=None, baseline=0.0)
+            _save_qb_pacing_state()
+            print(f"[info] qB pacing reset: server={name}")
+        pacing["outgoing"] = float(outgoing)
+        limit = _qb_pacing_limit(float(outgoing), limit_bytes, entry.get("rate"), pacing["limit"], seconds_left, settings)
+        current = pacing["limit"]
+        if limit is None or (current and abs(limit - current) / current < QB_PACING_MIN_CHANGE):
+            continue
+        if current is None:
+            # Remember the operator's own limit so releasing restores it, and never loosen it.
+            try:
+                pacing["baseline"] = float(_qb_pacing_call(name, instance, "transfer/uploadLimit") or 0)
+            except Exception as e:
+                print(f"[alert] qB pacing: read upload limit failed: server={name} error={e}")
+                continue
+        if current is None and pacing["baseline"] and limit >= pacing["baseline"]:
+            continue  # the operator's own limit is already tighter
+        if pacing["baseline"]:
+            limit = min(limit, pacing["baseline"])
+        if not _qb_set_upload_limit(name, instance, limit):
+            continue
+        pacing["limit"] = limit
+        _save_qb_pacing_state()
+        print(f"[info] qB pacing: server={name} upload_limit={limit / 1024:.0f}KiB/s rate={entry.get('rate')}")
+        if current is None and settings["notify"] and telegram_cfg.get("enabled"):
+            _send_telegram_markdown(
+                telegram_cfg.get("bot_token", ""),
+                telegram_cfg.get("chat_id", ""),
+                "🐢 *qB 上传限速已启用*\n\n"
+                f"🖥 服务器: *{name}*\n"
+                f"📊 已用: *{float(outgoing) / limit_bytes * 100:.2f}%*\n"
+                f"⏱ 限速: *{limit / 1024 / 1024:.2f} MiB/s*（剩余流量均摊到 {cycle_end.strftime('%m-%d')}）",
+            )
+
+
+def _qb_counter_delta(prev_raw: Optional[float], raw: float, counter_mode: str) -> tuple:
+    """Bytes since the previous sample, plus whether the counter was reset."""
+    if prev_raw is None:
+        return 0.0, False
+    if raw >= prev_raw:
+        return raw - prev_raw, False
+    if counter_mode == "session":
+        # Session counters restart from zero with qB, so everything seen now is new traffic.
+        return raw, True
+    # alltime counters are only persisted periodically; after a crash they can step back. Rebaseline.
+    return 0.0, True
+
+
+def _record_qb_bucket(state: Dict[str, Any], hour_key: str, qb_stats: Dict[str, Any]) -> None:
+    """Fold the current qB counters into monotonic per-instance totals for this bucket."""
+    counters = state.get("qb_counters", {}) or {}
+    bucket: Dict[str, Any] = {}
+    for inst in qb_stats.get("instances") or []:
+        name = inst.get("name")
+        if not name or inst.get("status") != "ok":
+            continue
+        counter_mode = inst.get("counter_mode") or "alltime"
+        prev = counters.get(name) or {}
+        if prev.get("counter_mode") != counter_mode:
+            prev = {}
+        entry = {"counter_mode": counter_mode, "reset": False}
+        for direction in ("upload", "download"):
+            raw = inst.get(f"{direction}_bytes")
+            total = float(prev.get(f"{direction}_total") or 0.0)
+            if not isinstance(raw, (int, float)):
+                entry[f"{direction}_raw"] = prev.get(f"{direction}_raw")
+                entry[f"{direction}_total"] = total if prev else None
+                continue
+            delta, reset = _qb_counter_delta(prev.get(f"{direction}_raw"), float(raw), counter_mode)
+            entry[f"{direction}_raw"] = float(raw)
+            entry[f"{direction}_total"] = total + delta
+            entry["reset"] = entry["reset"] or reset
+        counters[name] = entry
+        bucket[name] = {
+            "upload_bytes": entry["upload_total"],
+            "download_bytes": entry["download_total"],
+            "counter_mode": counter_mode,
+            "reset": entry["reset"],
+        }
+    state["qb_counters"] = counters
+    if bucket:
+        qb_hourly = state.get("qb_hourly", {}) or {}
+        qb_hourly[hour_key] = bucket
+        state["qb_hourly"] = qb_hourly
+
+
+def _build_qb_history_section(state: Dict[str, Any], hours: int = QB_HISTORY_DEFAULT_HOURS) -> Dict[str, Any]:
+    """Per-bucket qB vs Hetzner deltas; overhead_ratio is (hetzner_out - qb_up) / qb_up."""
+    qb_hourly = state.get("qb_hourly", {}) or {}
+    hourly = state.get("hourly", {}) or {}
+    keys = sorted(qb_hourly.keys())
+    cutoff = (_now_local() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M")
+    # Keep one bucket before the window so the first bucket inside it has a delta.
+    keys = keys[max(0, bisect.bisect_right(keys, cutoff) - 1):]
+    rows: Dict[str, Any] = {}
+    for prev_key, curr_key in zip(keys, keys[1:]):
+        prev_qb = qb_hourly.get(prev_key, {}) or {}
+        curr_qb = qb_hourly.get(curr_key, {}) or {}
+        prev_hz = _merge_hourly_snapshot(hourly.get(prev_key, {}) or {}) if prev_key in hourly else {}
+        curr_hz = _merge_hourly_snapshot(hourly.get(curr_key, {}) or {}) if curr_key in hourly else {}
+        for name, data in curr_qb.items():
+            prev_data = prev_qb.get(name)
+            if not prev_data:
+                continue
+            row = rows.setdefault(
+                name,
+                {"name": name, "buckets": [], "qb_upload_bytes": 0, "hetzner_outbound_bytes": 0},
+            )
+            bucket: Dict[str, Any] = {"hour": curr_key, "reset": bool(data.get("reset"))}
+            for direction in ("upload", "download"):
+                curr_total = data.get(f"{direction}_bytes")
+                prev_total = prev_data.get(f"{direction}_bytes")
+                if curr_total is None or prev_total is None:
+                    bucket[f"qb_{direction}_bytes"] = None
+                else:
+                    bucket[f"qb_{direction}_bytes"] = int(max(0.0, float(curr_total) - float(prev_total)))
+            for direction in ("outbound", "inbound"):
+                curr_value = (curr_hz.get(name) or {}).get(f"{direction}_bytes")
+                prev_value = (prev_hz.get(name) or {}).get(f"{direction}_bytes")
+                if curr_value is None or prev_value is None:
+                    bucket[f"hetzner_{direction}_bytes"] = None
+                elif float(curr_value) >= float(prev_value):
+                    bucket[f"hetzner_{direction}_bytes"] = int(float(curr_value) - float(prev_value))
+                else:
+                    bucket[f"hetzner_{direction}_bytes"] = int(float(curr_value))
+            qb_up = bucket["qb_upload_bytes"]
+            hz_out = bucket["hetzner_outbound_bytes"]
+            bucket["overhead_bytes"] = None
+            bucket["overhead_ratio"] = None
+            # A rebaselined alltime counter lost this bucket's qB traffic, so it would fake an overhead.
+            rebaselined = bucket["reset"] and data.get("counter_mode") != "session"
+            if qb_up is not None and hz_out is not None and not rebaselined:
+                bucket["overhead_bytes"] = hz_out - qb_up
+                if qb_up > 0:
+                    bucket["overhead_ratio"] = round((hz_out - qb_up) / qb_up, 4)
+                row["qb_upload_bytes"] += qb_up
+                row["hetzner_outbound_bytes"] += hz_out
+            row["buckets"].append(bucket)
+    for row in rows.values():
+        qb_up = row["qb_upload_bytes"]
+        row["overhead_bytes"] = row["hetzner_outbound_bytes"] - qb_up
+        row["overhead_ratio"] = round(row["overhead_bytes"] / qb_up, 4) if qb_up > 0 else None
+    return {"servers": rows, "hours": keys[1:]}
+
+
+def _date_from_hour_key(key: str) -> Optional[str]:
+    if not key:
+        return None
+    return key.split(" ", 1)[0] if " " in key else None
 
 
 def _telegram_inline_keyboard(menu: str) -> Dict[str, Any]:
@@ -661,6 +1909,10 @@ def _parse_hour(key: str) -> Optional[int]:
 
 
 def _active_server_name_map(config: Dict[str, Any]) -> Dict[str, str]:
+    """Active servers by id, from the fleet poll snapshot; Hetzner is only asked before the first poll."""
+    fleet_servers = _current_fleet_state().get("servers") or {}
+    if fleet_servers:
+        return {sid: entry.get("name") or sid for sid, entry in fleet_servers.items()}
     try:
         client = HetznerClient(config["hetzner"]["api_token"])
         servers = client.get_servers()
@@ -763,6 +2015,148 @@ def _compute_cycle_data(
 
     return {"servers": servers}
 
+def _hourly_outbound_series(hourly: Dict[str, Any]) -> Dict[str, List[tuple]]:
+    """Outbound bytes per server name and clock hour, oldest first; the trailing (partial) hour is dropped."""
+    keys = sorted(hourly.keys())
+    per_name: Dict[str, Dict[str, float]] = {}
+    prev = _merge_hourly_snapshot(hourly[keys[0]]) if keys else {}
+    for key in keys[1:]:
+        curr = _merge_hourly_snapshot(hourly.get(key, {}))
+        for name, data in curr.items():
+            delta = _counter_delta((prev.get(name) or {}).get("outbound_bytes"), data.get("outbound_bytes"))
+            if delta is None:
+                continue
+            buckets = per_name.setdefault(name, {})
+            buckets[key[:13]] = buckets.get(key[:13], 0.0) + delta
+        prev = curr
+    series: Dict[str, List[tuple]] = {}
+    for name, buckets in per_name.items():
+        hours = sorted(buckets)[:-1][-FORECAST_HISTORY_HOURS:]
+        points = []
+        for hour in hours:
+            try:
+                points.append((datetime.strptime(hour, "%Y-%m-%d %H"), buckets[hour]))
+            except ValueError:
+                continue
+        series[name] = points
+    return series
+
+
+def _fit_forecast_model(points: List[tuple]) -> Dict[str, Any]:
+    totals = [0.0] * 24
+    counts = [0] * 24
+    for hour, value in points:
+        totals[hour.hour] += value
+        counts[hour.hour] += 1
+    means = [totals[h] / counts[h] if counts[h] else None for h in range(24)]
+    known = [m for m in means if m is not None]
+    overall = sum(known) / len(known) if known else 0.0
+    profile = [(m / overall) if (m is not None and overall > 0) else 1.0 for m in means]
+    level: Optional[float] = None
+    for hour, value in points:
+        factor = profile[hour.hour] or 1.0
+        deseasonalized = value / factor if factor > 0 else value
+        level = deseasonalized if level is None else (
+            FORECAST_TREND_ALPHA * deseasonalized + (1 - FORECAST_TREND_ALPHA) * level
+        )
+    return {"level": level or 0.0, "profile": profile, "hours": len(points)}
+
+
+def _forecast_models(hourly: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # hourly comes from _load_cached, so the same object means the same file contents.
+    if FORECAST_CACHE["source"] is hourly:
+        return FORECAST_CACHE["models"]
+    models = {name: _fit_forecast_model(points) for name, points in _hourly_outbound_series(hourly).items()}
+    FORECAST_CACHE["source"] = hourly
+    FORECAST_CACHE["models"] = models
+    return models
+
+
+def _forecast_breach(
+    model: Optional[Dict[str, Any]],
+    outgoing: Optional[float],
+    limit_bytes: Optional[float],
+    now: Optional[datetime] = None,
+) -> Optional[Dict[str, Any]]:
+    """Project when cumulative outbound traffic reaches ``limit_bytes``.
+
+    Each future hour is forecast as trend level x hour-of-day factor. The rebuild
+    window is the quietest forecast hour within FORECAST_WINDOW_HOURS before the breach.
+    """
+    if not model or outgoing is None or not limit_bytes or model["hours"] < FORECAST_MIN_HISTORY_HOURS:
+        return None
+    now = now or _now_local().replace(tzinfo=None)
+    remaining = limit_bytes - float(outgoing)
+    if remaining <= 0:
+        return {"eta": now, "hours_left": 0.0, "window": None, "rate_per_hour": model["level"]}
+    if model["level"] <= 0:
+        return None
+    hour_start = now.replace(minute=0, second=0, microsecond=0)
+    cursor = now
+    used = 0.0
+    hours: List[tuple] = []
+    eta: Optional[datetime] = None
+    for step in range(FORECAST_HORIZON_HOURS):
+        slot = hour_start + timedelta(hours=step)
+        rate = model["level"] * model["profile"][slot.hour]
+        span = (slot + timedelta(hours=1) - cursor).total_seconds() / 3600
+        hours.append((slot, rate))
+        if rate > 0 and used + rate * span >= remaining:
+            eta = cursor + timedelta(hours=(remaining - used) / rate)
+            break
+        used += rate * span
+        cursor = slot + timedelta(hours=1)
+    if eta is None:
+        return None
+    window_start = eta - timedelta(hours=FORECAST_WINDOW_HOURS)
+    candidates = [
+        (rate, slot) for slot, rate in hours if slot >= window_start and slot + timedelta(hours=1) > now and slot < eta
+    ]
+    window = min(candidates)[1] if candidates else None
+    return {
+        "eta": eta,
+        "hours_left": (eta - now).total_seconds() / 3600,
+        "window": window,
+        "rate_per_hour": model["level"],
+    }
+
+
+def _forecast_view(forecast: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not forecast:
+        return None
+    return {
+        "eta": forecast["eta"].strftime("%Y-%m-%d %H:%M"),
+        "hours_left": round(forecast["hours_left"], 1),
+        "rebuild_window": forecast["window"].strftime("%Y-%m-%d %H:00") if forecast["window"] else None,
+        "tb_per_hour": str(_bytes_to_tb(forecast["rate_per_hour"])),
+    }
+
+
+def _traffic_limit_bytes(config: Dict[str, Any]) -> Optional[float]:
+    limit_gb = (config.get("traffic") or {}).get("limit_gb")
+    if not limit_gb:
+        return None
+    try:
+        return float(Decimal(limit_gb) * (Decimal(1024) ** 3))
+    except Exception:
+        return None
+
+
+def _server_forecast(name: str, outgoing: Optional[float], limit_bytes: Optional[float]) -> Optional[Dict[str, Any]]:
+    hourly = _load_cached(REPORT_STATE_PATH, _load_json).get("hourly") or {}
+    return _forecast_breach(_forecast_models(hourly).get(name), outgoing, limit_bytes)
+
+
+def _format_forecast_line(forecast: Optional[Dict[str, Any]]) -> Optional[str]:
+    view = _forecast_view(forecast)
+    if not view:
+        return None
+    line = f"⏳ 预计触顶: `{view['eta']}` (约 {view['hours_left']} 小时)"
+    if view["rebuild_window"]:
+        line += f"\n🌙 低峰窗口: `{view['rebuild_window']}`"
+    return line
+
+
 def _delta_by_name(prev: Dict[str, Any], curr: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     aggregates: Dict[str, Dict[str, Any]] = {}
     prev_by_name = _merge_hourly_snapshot(prev)
@@ -857,7 +2251,6 @@ def _detect_last_rebuilds(hourly: Dict[str, Any], name_map: Optional[Dict[str, s
 
 class HetznerClient:
     BASE_URL = "https://api.hetzner.cloud/v1"
-    CF_API_BASE = "https://api.cloudflare.com/client/v4"
 
     def __init__(self, token: str):
         self.token = token
@@ -868,9 +2261,15 @@ class HetznerClient:
 
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         url = f"{self.BASE_URL}/{endpoint}"
-        resp = requests.request(method, url, headers=self.headers, timeout=20, **kwargs)
-        resp.raise_for_status()
-        return resp.json()
+        started = time.monotonic()
+        ok = False
+        try:
+            resp = HTTP_SESSION.request(method, url, headers=self.headers, timeout=HETZNER_HTTP_TIMEOUT, **kwargs)
+            resp.raise_for_status()
+            ok = True
+            return resp.json()
+        finally:
+            _observe_upstream("hetzner", f"{method} {endpoint}", started, ok)
 
     def get_servers(self) -> List[Dict[str, Any]]:
         data = self._request("GET", "servers")
@@ -883,9 +2282,18 @@ class HetznerClient:
         except Exception:
             return None
 
-    def get_server_metrics(self, server_id: int, start: str, end: str) -> Dict[str, Any]:
+    def get_server_metrics(
+        self,
+        server_id: int,
+        start: str,
+        end: str,
+        metric_type: str = "network",
+        step: Optional[int] = None,
+    ) -> Dict[str, Any]:
         try:
-            params = {"type": "traffic", "start": start, "end": end}
+            params: Dict[str, Any] = {"type": metric_type, "start": start, "end": end}
+            if step:
+                params["step"] = int(step)
             data = self._request("GET", f"servers/{server_id}/metrics", params=params)
             return data.get("metrics", {})
         except Exception:
@@ -962,7 +2370,14 @@ class HetznerClient:
         except Exception:
             return None
 
-    def rebuild_server(self, server_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
+    def rebuild_server(
+        self,
+        server_id: int,
+        config: Dict[str, Any],
+        progress: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        report = progress or (lambda phase: None)
+        report("lookup")
         old_server = self.get_server(server_id)
         if not old_server:
             return {"success": False, "error": "服务器不存在"}
@@ -977,9 +2392,11 @@ class HetznerClient:
                 return {"success": False, "error": "没有可用快照，已取消重建"}
             image = snapshots[0]["id"]
 
+        report("delete")
         if not self.delete_server(server_id):
             return {"success": False, "error": "删除服务器失败"}
 
+        report("wait")
         time.sleep(5)
         create_data = {
             "name": old_server["name"],
@@ -990,6 +2407,7 @@ class HetznerClient:
         }
         last_error: Optional[Exception] = None
         new_server: Optional[Dict[str, Any]] = None
+        report("create")
         for _ in range(3):
             try:
                 resp = self._request("POST", "servers", json=create_data)
@@ -1017,42 +2435,127 @@ class HetznerClient:
         ip: str,
         attempts: int = 3,
         delay_seconds: float = 3,
+        verify: bool = False,
+    ) -> Dict[str, Any]:
+        return CloudflareClient(api_token).update_a_record(
+            zone_id, record_name, ip, attempts=attempts, delay_seconds=delay_seconds, verify=verify
+        )
+
+
+class CloudflareClient:
+    API_BASE = "https://api.cloudflare.com/client/v4"
+
+    def __init__(self, token: str):
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+
+    def _request(self, method: str, path: str, label: str, **kwargs) -> Dict[str, Any]:
+        started = time.monotonic()
+        ok = False
+        try:
+            resp = HTTP_SESSION.request(method, f"{self.API_BASE}/{path}", headers=self.headers, timeout=15, **kwargs)
+            resp.raise_for_status()
+            ok = True
+            return resp.json()
+        finally:
+            _observe_upstream("cloudflare", label, started, ok)
+
+    def list_a_records(self, zone_id: str) -> Dict[str, Dict[str, Any]]:
+        records: Dict[str, Dict[str, Any]] = {}
+        page = 1
+        while True:
+            data = self._request(
+                "GET",
+                f"zones/{zone_id}/dns_records",
+                "GET dns_records",
+                params={"type": "A", "per_page": CF_LIST_PAGE_SIZE, "page": page},
+            )
+            for record in data.get("result") or []:
+                # Several A records may share a name (round robin); like before, the first one is managed.
+                records.setdefault(
+                    _cf_record_key(record.get("name")),
+                    {
+                        "id": record.get("id"),
+                        "content": record.get("content"),
+                        "ttl": record.get("ttl", 1),
+                        "proxied": record.get("proxied", False),
+                    },
+                )
+            info = data.get("result_info") or {}
+            if page >= int(info.get("total_pages") or 1):
+                return records
+            page += 1
+
+    def cached_a_records(self, zone_id: str, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        with CF_RECORD_CACHE_LOCK:
+            entry = CF_RECORD_CACHE.get(zone_id)
+            fresh = bool(entry) and not refresh and time.time() - entry["fetched_at"] < CF_RECORD_CACHE_SECONDS
+            _cache_lookup("cloudflare_records", fresh)
+            if not fresh:
+                entry = {"records": self.list_a_records(zone_id), "fetched_at": time.time()}
+                CF_RECORD_CACHE[zone_id] = entry
+            return entry["records"]
+
+    def fetch_a_record(self, zone_id: str, record_id: str) -> Dict[str, Any]:
+        data = self._request("GET", f"zones/{zone_id}/dns_records/{record_id}", "GET dns_records/{id}")
+        return data.get("result") or {}
+
+    def update_a_record(
+        self,
+        zone_id: str,
+        record_name: str,
+        ip: str,
+        attempts: int = 3,
+        delay_seconds: float = 3,
+        verify: bool = False,
     ) -> Dict[str, Any]:
+        """Point ``record_name`` at ``ip``, skipping the write when it already matches.
+
+        The match check normally trusts the zone listing cache, which our own writes keep
+        current. With ``verify`` (a re-assert that exists to catch out-of-band changes) and
+        on every retry after a failure, a cached match is confirmed with a fresh GET first.
+        """
+        key = _cf_record_key(record_name)
         last_error: Optional[Exception] = None
-        for _ in range(attempts):
+        for attempt in range(attempts):
             try:
-                headers = {
-                    "Authorization": f"Bearer {api_token}",
-                    "Content-Type": "application/json",
-                }
-                list_url = f"{self.CF_API_BASE}/zones/{zone_id}/dns_records"
-                params = {"type": "A", "name": record_name}
-                resp = requests.get(list_url, headers=headers, params=params, timeout=15)
-                resp.raise_for_status()
-                data = resp.json()
-                records = data.get("result", [])
-                if not records:
+                record = self.cached_a_records(zone_id).get(key)
+                if not record:
+                    # Created since the last listing? Look once more before giving up.
+                    record = self.cached_a_records(zone_id, refresh=True).get(key)
+                if not record:
                     return {"success": False, "error": "DNS记录不存在"}
-                record = records[0]
-                record_id = record.get("id")
-                update_url = f"{self.CF_API_BASE}/zones/{zone_id}/dns_records/{record_id}"
-                payload = {
-                    "type": "A",
-                    "name": record_name,
-                    "content": ip,
-                    "ttl": record.get("ttl", 1),
-                    "proxied": record.get("proxied", False),
-                }
-                upd = requests.put(update_url, headers=headers, json=payload, timeout=15)
-                upd.raise_for_status()
-                return {"success": True}
+                if record.get("content") == ip and (verify or attempt > 0):
+                    content = self.fetch_a_record(zone_id, record["id"]).get("content")
+                    with CF_RECORD_CACHE_LOCK:
+                        record["content"] = content
+                if record.get("content") == ip:
+                    return {"success": True, "changed": False}
+                self._request(
+                    "PATCH",
+                    f"zones/{zone_id}/dns_records/{record['id']}",
+                    "PATCH dns_records/{id}",
+                    json={"content": ip},
+                )
+                with CF_RECORD_CACHE_LOCK:
+                    record["content"] = ip
+                return {"success": True, "changed": True}
             except Exception as e:
                 last_error = e
+                if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 404:
+                    with CF_RECORD_CACHE_LOCK:
+                        CF_RECORD_CACHE.pop(zone_id, None)
                 if delay_seconds > 0:
                     time.sleep(delay_seconds)
         return {"success": False, "error": str(last_error)}
 
 
+def _cf_record_key(name: Any) -> str:
+    return str(name or "").strip().rstrip(".").lower()
+
+
 def _get_basic_auth(request: Request) -> Optional[tuple]:
     auth = request.headers.get("Authorization")
     if not auth or not auth.startswith("Basic "):
@@ -1069,7 +2572,7 @@ def _get_basic_auth(request: Request) -> Optional[tuple]:
 
 
 def _require_auth(request: Request) -> None:
-    cfg = _load_json(WEB_CONFIG_PATH)
+    cfg = _load_cached(WEB_CONFIG_PATH, _load_json)
     auth = _get_basic_auth(request)
     if not auth:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -1110,56 +2613,151 @@ def _format_iso(dt: datetime) -> str:
     return dt.isoformat()
 
 
-def _integrate_time_series(series: List[List[Any]]) -> float:
-    total = 0.0
-    if not series or len(series) < 2:
-        return 0.0
-    for i in range(len(series) - 1):
-        try:
-            value = float(series[i][1])
-            t_curr = datetime.fromisoformat(series[i][0].replace("Z", "+00:00"))
-            t_next = datetime.fromisoformat(series[i + 1][0].replace("Z", "+00:00"))
-            duration = (t_next - t_curr).total_seconds()
-            total += value * duration
-        except Exception:
-            continue
-    return total
+def _metric_integrals(
+    client: "HetznerClient", server_id: Any, metric_type: str, names: List[str], start_ts: float
+) -> Dict[str, float]:
+    """Integrate series from start_ts to now, fetching only samples newer than the settled part of the cache."""
+
+    def fetch(from_ts: float, to_ts: float, step: int) -> Optional[Dict[str, Any]]:
+        metrics = client.get_server_metrics(
+            server_id,
+            start=_format_iso(datetime.fromtimestamp(from_ts, timezone.utc)),
+            end=_format_iso(datetime.fromtimestamp(to_ts, timezone.utc)),
+            metric_type=metric_type,
+            step=step,
+        )
+        return metrics.get("time_series") if isinstance(metrics, dict) else None
+
+    return METRICS_CACHE.integrals((str(server_id), metric_type), names, start_ts, fetch)
 
 
 def _get_today_traffic_bytes(client: "HetznerClient", server_id: int) -> Dict[str, float]:
-    now = _now_local()
-    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    metrics = client.get_server_metrics(server_id, start=_format_iso(start), end=_format_iso(now))
-    time_series = metrics.get("time_series", {}) if isinstance(metrics, dict) else {}
-    out_series = time_series.get("traffic.0.out", [])
-    in_series = time_series.get("traffic.0.in", [])
+    start = _now_local().replace(hour=0, minute=0, second=0, microsecond=0)
+    totals = _metric_integrals(
+        client, server_id, "network", ["network.0.bandwidth.out", "network.0.bandwidth.in"], start.timestamp()
+    )
     return {
-        "out_bytes": _integrate_time_series(out_series),
-        "in_bytes": _integrate_time_series(in_series),
+        "out_bytes": totals["network.0.bandwidth.out"],
+        "in_bytes": totals["network.0.bandwidth.in"],
     }
 
 
-def _send_telegram_message(
+def _post_telegram_message(
     bot_token: str,
     chat_id: str,
     text: str,
+    parse_mode: Optional[str] = None,
     reply_markup: Optional[Dict[str, Any]] = None,
-) -> bool:
-    if not bot_token or not chat_id:
-        return False
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    message_id: Optional[int] = None,
+) -> tuple:
+    """One sendMessage (or editMessageText when message_id is set) call.
+
+    Returns ("ok"|"retry"|"failed", retry_after seconds or None, sent message id or None).
+    """
+    method = "editMessageText" if message_id is not None else "sendMessage"
+    url = f"https://api.telegram.org/bot{bot_token}/{method}"
+    payload: Dict[str, Any] = {"chat_id": chat_id, "text": text}
+    if message_id is not None:
+        payload["message_id"] = message_id
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    started = time.monotonic()
     try:
-        payload: Dict[str, Any] = {"chat_id": chat_id, "text": text}
-        if reply_markup:
-            payload["reply_markup"] = reply_markup
         resp = requests.post(url, json=payload, timeout=15)
-        if resp.status_code >= 400:
-            print(f"[alert] telegram send failed: {resp.status_code} {resp.text}")
-            return False
-        return True
     except Exception as e:
-        print(f"[alert] telegram send failed: {e}")
+        _observe_upstream("telegram", method, started, False)
+        print(f"[alert] telegram send failed: {_redact_error(e)}")
+        return "retry", None, None
+    _observe_upstream("telegram", method, started, resp.status_code < 400)
+    if resp.status_code < 400:
+        try:
+            sent_id = (resp.json().get("result") or {}).get("message_id")
+        except Exception:
+            sent_id = None
+        return "ok", None, sent_id if sent_id is not None else message_id
+    print(f"[alert] telegram send failed: {resp.status_code} {resp.text}")
+    if resp.status_code == 429 or resp.status_code >= 500:
+        try:
+            retry_after = (resp.json().get("parameters") or {}).get("retry_after")
+        except Exception:
+            retry_after = None
+        return "retry", float(retry_after) if retry_after is not None else None, None
+    if parse_mode:
+        # Fallback to plain text if Markdown parse fails.
+        return _post_telegram_message(bot_token, chat_id, text, reply_markup=reply_markup, message_id=message_id)
+    return "failed", None, None
+
+
+def _split_telegram_text(text: str) -> List[str]:
+    if len(text) <= TELEGRAM_MAX_CHARS:
+        return [text]
+    chunks: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > TELEGRAM_MAX_CHARS:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:TELEGRAM_MAX_CHARS])
+            line = line[TELEGRAM_MAX_CHARS:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > TELEGRAM_MAX_CHARS:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _enqueue_telegram(
+    bot_token: str,
+    chat_id: str,
+    text: str,
+    parse_mode: Optional[str],
+    reply_markup: Optional[Dict[str, Any]],
+    holder: Optional[Dict[str, Any]] = None,
+    edit_of: Optional[Dict[str, Any]] = None,
+    on_done: Optional[Callable[[bool], None]] = None,
+) -> bool:
+    if not bot_token or not chat_id:
         return False
+    key = (bot_token, str(chat_id))
+    now = time.monotonic()
+    chunks = _split_telegram_text(text)
+    with TELEGRAM_OUTBOX_COND:
+        queue = TELEGRAM_OUTBOX.setdefault(key, deque())
+        for index, chunk in enumerate(chunks):
+            queue.append(
+                {
+                    "text": chunk,
+                    "parse_mode": parse_mode,
+                    # The keyboard belongs on the last part of a split message.
+                    "reply_markup": reply_markup if index == len(chunks) - 1 else None,
+                    # holder receives the sent message id; edit_of replaces a message sent with a holder.
+                    "holder": holder if index == 0 else None,
+                    "edit_of": edit_of if index == 0 else None,
+                    # on_done(delivered) runs on the sender thread once the last part is sent or dropped.
+                    "callbacks": [on_done] if on_done and index == len(chunks) - 1 else [],
+                    "queued_at": now,
+                    "attempts": 0,
+                }
+            )
+        TELEGRAM_OUTBOX_COND.notify_all()
+    _ensure_telegram_sender()
+    return True
+
+
+def _send_telegram_message(
+    bot_token: str,
+    chat_id: str,
+    text: str,
+    reply_markup: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Queue a plain-text message; returns once queued, never waits on Telegram."""
+    return _enqueue_telegram(bot_token, chat_id, text, None, reply_markup)
 
 
 def _send_telegram_markdown(
@@ -1167,23 +2765,139 @@ def _send_telegram_markdown(
     chat_id: str,
     text: str,
     reply_markup: Optional[Dict[str, Any]] = None,
+    edit_of: Optional[Dict[str, Any]] = None,
+    on_done: Optional[Callable[[bool], None]] = None,
 ) -> bool:
-    if not bot_token or not chat_id:
-        return False
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    try:
-        payload: Dict[str, Any] = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-        if reply_markup:
-            payload["reply_markup"] = reply_markup
-        resp = requests.post(url, json=payload, timeout=15)
-        if resp.status_code >= 400:
-            print(f"[alert] telegram send failed: {resp.status_code} {resp.text}")
-            # Fallback to plain text if Markdown parse fails or chat errors are transient.
-            return _send_telegram_message(bot_token, chat_id, text, reply_markup=reply_markup)
-        return True
-    except Exception as e:
-        print(f"[alert] telegram send failed: {e}")
-        return False
+    """Queue a Markdown message; returns once queued, never waits on Telegram.
+
+    With edit_of (from _send_telegram_placeholder) the placeholder is edited in place instead.
+    Callers that must know whether it arrived pass on_done, called with True or False.
+    """
+    return _enqueue_telegram(bot_token, chat_id, text, "Markdown", reply_markup, edit_of=edit_of, on_done=on_done)
+
+
+def _send_telegram_placeholder(bot_token: str, chat_id: str, text: str) -> Dict[str, Any]:
+    """Queue a short message that a later _send_telegram_markdown(edit_of=...) will replace."""
+    holder: Dict[str, Any] = {"message_id": None}
+    _enqueue_telegram(bot_token, chat_id, text, None, None, holder=holder)
+    return holder
+
+
+def _telegram_mergeable(item: Dict[str, Any]) -> bool:
+    return not (item["reply_markup"] or item["holder"] is not None or item["edit_of"] is not None)
+
+
+def _take_telegram_batch(queue: deque) -> Dict[str, Any]:
+    """Pop the head message and merge following plain messages into it, up to the length limit."""
+    batch = dict(queue.popleft())
+    if not _telegram_mergeable(batch):
+        return batch
+    while queue:
+        nxt = queue[0]
+        if not _telegram_mergeable(nxt) or nxt["parse_mode"] != batch["parse_mode"] or nxt["attempts"]:
+            break
+        merged = f"{batch['text']}\n\n{nxt['text']}"
+        if len(merged) > TELEGRAM_MAX_CHARS:
+            break
+        batch["text"] = merged
+        batch["callbacks"] = batch["callbacks"] + nxt["callbacks"]
+        queue.popleft()
+    return batch
+
+
+def _next_telegram_batch() -> Optional[tuple]:
+    """Wait until some chat may send; returns (key, batch) or None once stopped and drained."""
+    with TELEGRAM_OUTBOX_COND:
+        while True:
+            stopping = WORKER_STOP.is_set()
+            now = time.monotonic()
+            best: Optional[tuple] = None
+            for key, queue in TELEGRAM_OUTBOX.items():
+                if not queue:
+                    continue
+                head = queue[0]
+                ready_at = max(
+                    TELEGRAM_RATE["global_next"],
+                    TELEGRAM_RATE["chat_next"].get(key, 0.0),
+                    TELEGRAM_RATE["retry_until"].get(key[0], 0.0),
+                )
+                # Keyboard, placeholder and edit messages are never merged, so they skip the window.
+                if not stopping and not head["attempts"] and _telegram_mergeable(head):
+                    ready_at = max(ready_at, head["queued_at"] + TELEGRAM_COALESCE_SECONDS)
+                if best is None or ready_at < best[0]:
+                    best = (ready_at, key)
+            if best is None:
+                if stopping:
+                    return None
+                TELEGRAM_OUTBOX_COND.wait()
+                continue
+            if best[0] > now:
+                TELEGRAM_OUTBOX_COND.wait(best[0] - now)
+                continue
+            key = best[1]
+            TELEGRAM_RATE["global_next"] = now + TELEGRAM_GLOBAL_INTERVAL_SECONDS
+            TELEGRAM_RATE["chat_next"][key] = now + TELEGRAM_CHAT_INTERVAL_SECONDS
+            return key, _take_telegram_batch(TELEGRAM_OUTBOX[key])
+
+
+def _telegram_sender_loop() -> None:
+    while True:
+        picked = _next_telegram_batch()
+        if picked is None:
+            return
+        key, batch = picked
+        started = time.monotonic()
+        # Queues are FIFO per chat, so a placeholder is always sent before its edit.
+        edit_id = (batch["edit_of"] or {}).get("message_id")
+        status, retry_after, sent_id = _post_telegram_message(
+            key[0], key[1], batch["text"], batch["parse_mode"], batch["reply_markup"], edit_id
+        )
+        if status == "failed" and edit_id is not None:
+            status, retry_after, sent_id = _post_telegram_message(
+                key[0], key[1], batch["text"], batch["parse_mode"], batch["reply_markup"]
+            )
+        if status == "ok" and batch["holder"] is not None:
+            batch["holder"]["message_id"] = sent_id
+        if status == "retry":
+            batch["attempts"] += 1
+            if batch["attempts"] >= TELEGRAM_SEND_ATTEMPTS:
+                print(f"[alert] telegram message dropped after {batch['attempts']} attempts")
+                status = "failed"
+            else:
+                delay = retry_after or TELEGRAM_RETRY_BACKOFF_SECONDS * (2 ** (batch["attempts"] - 1))
+                with TELEGRAM_OUTBOX_COND:
+                    until = time.monotonic() + delay
+                    if retry_after is not None:
+                        # 429 retry_after applies to the whole bot, not just this chat.
+                        TELEGRAM_RATE["retry_until"][key[0]] = until
+                    else:
+                        TELEGRAM_RATE["chat_next"][key] = until
+                    TELEGRAM_OUTBOX.setdefault(key, deque()).appendleft(batch)
+        if status != "retry":
+            for callback in batch["callbacks"]:
+                try:
+                    callback(status == "ok")
+                except Exception as e:
+                    print(f"[alert] telegram delivery callback error: {e}")
+        _observe_loop("telegram_sender", started, None if status != "failed" else RuntimeError("send failed"))
+
+
+def _ensure_telegram_sender() -> None:
+    thread = WORKER_THREADS.get("telegram_sender")
+    if thread is not None and thread.is_alive():
+        return
+    with TELEGRAM_OUTBOX_COND:
+        thread = WORKER_THREADS.get("telegram_sender")
+        if thread is not None and thread.is_alive():
+            return
+        if WORKER_STOP.is_set():
+            return
+        _start_worker("telegram_sender", _telegram_sender_loop)
+
+
+def _telegram_outbox_depth() -> int:
+    with TELEGRAM_OUTBOX_COND:
+        return sum(len(queue) for queue in TELEGRAM_OUTBOX.values())
 
 
 def _answer_telegram_callback(bot_token: str, callback_id: Optional[str]) -> None:
@@ -1193,7 +2907,7 @@ def _answer_telegram_callback(bot_token: str, callback_id: Optional[str]) -> Non
     try:
         requests.post(url, json={"callback_query_id": callback_id}, timeout=10)
     except Exception as e:
-        print(f"[alert] telegram callback answer failed: {e}")
+        print(f"[alert] telegram callback answer failed: {_redact_error(e)}")
 
 
 def _maybe_wrap_codeblock(text: str) -> str:
@@ -1293,13 +3007,229 @@ def _resolve_cf_record(record_cfg: Any, fallback_zone: str, fallback_token: str)
     return None
 
 
-def _verify_dns_record(record: str, expected_ip: str) -> Dict[str, Any]:
+def _cf_record_for_name(config: Dict[str, Any], record: str) -> Optional[Dict[str, str]]:
+    """Zone and token for ``record`` from the current config (so delayed tasks never persist the token)."""
+    cf_cfg = config.get("cloudflare", {}) or {}
+    for record_cfg in (cf_cfg.get("record_map", {}) or {}).values():
+        if _record_name(record_cfg) == record:
+            return _resolve_cf_record(record_cfg, cf_cfg.get("zone_id", ""), cf_cfg.get("api_token", ""))
+    return None
+
+
+def _record_name(record_cfg: Any) -> Optional[str]:
+    if isinstance(record_cfg, dict):
+        return record_cfg.get("record") or record_cfg.get("name")
+    if isinstance(record_cfg, str):
+        return record_cfg
+    return None
+
+
+def _dns_build_query(name: str, query_id: int) -> bytes:
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    labels = [label.encode("idna") for label in name.rstrip(".").split(".") if label]
+    qname = b"".join(bytes([len(label)]) + label for label in labels) + b"\x00"
+    return header + qname + struct.pack("!HH", 1, 1)
+
+
+def _dns_skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+
+def _dns_parse_response(data: bytes) -> Dict[str, Any]:
+    _, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    rcode = flags & 0x000F
+    if rcode == 3:
+        return {"addresses": [], "ttl": DNS_NEGATIVE_TTL_SECONDS, "error": "NXDOMAIN"}
+    if rcode != 0:
+        raise ValueError(f"DNS server returned rcode {rcode}")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _dns_skip_name(data, offset) + 4
+    addresses: List[str] = []
+    ttl: Optional[int] = None
+    for _ in range(ancount):
+        offset = _dns_skip_name(data, offset)
+        rtype, rclass, rttl, rdlength = struct.unpack("!HHIH", data[offset : offset + 10])
+        offset += 10
+        rdata = data[offset : offset + rdlength]
+        offset += rdlength
+        if rtype == 1 and rclass == 1 and rdlength == 4:
+            addresses.append(socket.inet_ntoa(rdata))
+            ttl = rttl if ttl is None else min(ttl, rttl)
+    return {"addresses": addresses, "ttl": ttl}
+
+
+class _DnsDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id: int, future: "asyncio.Future[Dict[str, Any]]"):
+        self.query_id = query_id
+        self.future = future
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        if self.future.done() or len(data) < 12:
+            return
+        if struct.unpack("!H", data[:2])[0] != self.query_id:
+            return
+        try:
+            self.future.set_result(_dns_parse_response(data))
+        except Exception as e:
+            self.future.set_exception(e)
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+def _parse_resolver(spec: str) -> tuple:
+    host, sep, port = str(spec).strip().rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return str(spec).strip(), 53
+
+
+async def _dns_query_udp(name: str, resolver: str, timeout: float) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    host, port = _parse_resolver(resolver)
+    infos = await asyncio.wait_for(
+        loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM), timeout
+    )
+    query_id = random.randint(0, 0xFFFF)
+    future: "asyncio.Future[Dict[str, Any]]" = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _DnsDatagramProtocol(query_id, future), remote_addr=infos[0][4]
+    )
+    try:
+        transport.sendto(_dns_build_query(name, query_id))
+        return await asyncio.wait_for(future, timeout)
+    finally:
+        transport.close()
+
+
+async def _dns_query_system(name: str, timeout: float) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    infos = await asyncio.wait_for(
+        loop.getaddrinfo(name, None, family=socket.AF_INET, type=socket.SOCK_STREAM), timeout
+    )
+    addresses: List[str] = []
+    for info in infos:
+        if info[4][0] not in addresses:
+            addresses.append(info[4][0])
+    return {"addresses": addresses, "ttl": None}
+
+
+async def _resolve_a(
+    name: str, resolver: Optional[str], timeout: float, use_cache: bool = True
+) -> Dict[str, Any]:
+    """Resolve an A record through one resolver (None = system resolver), cached by TTL."""
+    key = (name.lower().rstrip("."), resolver or "system")
+    now = time.monotonic()
+    cached = DNS_CACHE.get(key)
+    if use_cache:
+        hit = bool(cached and cached["expires"] > now)
+        _cache_lookup("dns", hit)
+        if hit:
+            return dict(cached["result"], cached=True)
+    try:
+        started = time.monotonic()
+        if resolver:
+            answer = await _dns_query_udp(name, resolver, timeout)
+        else:
+            answer = await _dns_query_system(name, timeout)
+        _observe_upstream("dns", resolver or "system", started, True)
+        ttl = answer.get("ttl")
+        ttl = DNS_DEFAULT_TTL_SECONDS if ttl is None else min(int(ttl), DNS_MAX_TTL_SECONDS)
+        result = {"addresses": answer.get("addresses") or [], "ttl": ttl}
+        if answer.get("error"):
+            result["error"] = answer["error"]
+    except asyncio.TimeoutError:
+        ttl = DNS_NEGATIVE_TTL_SECONDS
+        result = {"addresses": [], "ttl": ttl, "error": "timeout"}
+    except Exception as e:
+        ttl = DNS_NEGATIVE_TTL_SECONDS
+        result = {"addresses": [], "ttl": ttl, "error": str(e) or e.__class__.__name__}
+    result["resolver"] = resolver or "system"
+    DNS_CACHE[key] = {"expires": time.monotonic() + ttl, "result": result}
+    return dict(result, cached=False)
+
+
+def _dns_settings(dns_cfg: Optional[Dict[str, Any]]) -> tuple:
+    dns_cfg = dns_cfg or {}
+    resolvers = dns_cfg.get("dns_resolvers") or []
+    if isinstance(resolvers, str):
+        resolvers = [resolvers]
+    timeout = _parse_float_or_default(dns_cfg.get("dns_timeout_seconds"), DNS_TIMEOUT_SECONDS)
+    return [str(r) for r in resolvers if r] or [None], max(0.5, timeout)
+
+
+async def _check_dns_records(
+    checks: List[Dict[str, str]], dns_cfg: Optional[Dict[str, Any]] = None, use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """Resolve every {"record", "expected"} pair concurrently against the configured resolvers.
+
+    A record is ok when every resolver that answered returned the expected IP.
+    """
+    resolvers, timeout = _dns_settings(dns_cfg)
+    lookups = [
+        _resolve_a(check["record"], resolver, timeout, use_cache=use_cache)
+        for check in checks
+        for resolver in resolvers
+    ]
+    answers = await asyncio.gather(*lookups)
+    results = []
+    for idx, check in enumerate(checks):
+        per_resolver = answers[idx * len(resolvers) : (idx + 1) * len(resolvers)]
+        answered = [a for a in per_resolver if a["addresses"]]
+        entry: Dict[str, Any] = {
+            "record": check["record"],
+            "expected": check["expected"],
+            "cached": all(a["cached"] for a in per_resolver),
+        }
+        if len(resolvers) > 1:
+            entry["answers"] = {a["resolver"]: a["addresses"] or a.get("error") for a in per_resolver}
+        if not answered:
+            entry["ok"] = False
+            entry["error"] = per_resolver[0].get("error") or "no A record"
+        else:
+            entry["resolved"] = answered[0]["addresses"][0]
+            entry["addresses"] = answered[0]["addresses"]
+            entry["ok"] = all(check["expected"] in a["addresses"] for a in answered)
+        results.append(entry)
+    return results
+
+
+def _check_dns_records_blocking(
+    checks: List[Dict[str, str]], dns_cfg: Optional[Dict[str, Any]] = None, use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    # For worker threads (bot, rebuild jobs) that have no event loop of their own.
+    return asyncio.run(_check_dns_records(checks, dns_cfg, use_cache=use_cache))
+
+
+def _verify_dns_record(
+    record: str, expected_ip: str, dns_cfg: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     try:
-        socket.setdefaulttimeout(5)
-        resolved = socket.gethostbyname(record)
-        return {"ok": resolved == expected_ip, "resolved": resolved}
+        result = _check_dns_records_blocking(
+            [{"record": record, "expected": expected_ip}], dns_cfg, use_cache=False
+        )[0]
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    if result.get("resolved") is None:
+        return {"ok": False, "error": result.get("error")}
+    return {"ok": result["ok"], "resolved": result["resolved"]}
+
+
+def _dns_check_targets(servers: List[Dict[str, Any]], record_map: Dict[str, Any]) -> List[Dict[str, Any]]:
+    targets = []
+    for s in servers:
+        record = _record_name(record_map.get(str(s["id"])) or record_map.get(s.get("name", "")))
+        ip = (s.get("public_net", {}).get("ipv4") or {}).get("ip")
+        targets.append({"server": s, "record": record, "expected": ip})
+    return targets
 
 
 def _build_daily_report(config: Dict[str, Any], client: "HetznerClient") -> str:
@@ -1312,16 +3242,16 @@ def _build_daily_report(config: Dict[str, Any], client: "HetznerClient") -> str:
         except Exception:
             limit_bytes = None
 
-    servers = client.get_servers()
+    snapshot = _latest_fleet_traffic(client)
     qb_stats = _collect_qbittorrent_stats(config)
     qb_map = _qb_instance_map(qb_stats) if qb_stats.get("enabled") else {}
     lines = [f"📅 **每日定时战报 ({_now_local().strftime('%Y-%m-%d')})**"]
-    for s in servers:
-        detail = client.get_server(s["id"]) or {}
-        outgoing = detail.get("outgoing_traffic")
-        ingoing = detail.get("ingoing_traffic")
+    for sid, data in snapshot.items():
+        name = data.get("name") or sid
+        outgoing = data.get("outbound_bytes")
+        ingoing = data.get("inbound_bytes")
         if outgoing is None or ingoing is None:
-            lines.append(f"━━━━━━━━━━\n🖥️ `{s.get('name') or s['id']}`\n❌ 获取失败")
+            lines.append(f"━━━━━━━━━━\n🖥️ `{name}`\n❌ 获取失败")
             continue
         percent = None
         if limit_bytes:
@@ -1329,20 +3259,18 @@ def _build_daily_report(config: Dict[str, Any], client: "HetznerClient") -> str:
         outbound_tb = _bytes_to_tb(float(outgoing))
         inbound_tb = _bytes_to_tb(float(ingoing))
         percent_text = f" ({percent:.2f}%)" if percent is not None else ""
-        qb_line = _build_qb_compare_line(
-            detail.get("name") or s.get("name") or s["id"],
-            outgoing,
-            ingoing,
-            qb_map,
-        )
+        qb_line = _build_qb_compare_line(name, outgoing, ingoing, qb_map)
         block = (
             "━━━━━━━━━━\n"
-            f"🖥️ `{detail.get('name') or s.get('name') or s['id']}`\n"
+            f"🖥️ `{name}`\n"
             f"📤 总上传: `{outbound_tb} TB`{percent_text}\n"
             f"📥 总下载: `{inbound_tb} TB`"
         )
         if qb_line:
             block = f"{block}\n{qb_line}"
+        forecast_line = _format_forecast_line(_server_forecast(name, float(outgoing), limit_bytes))
+        if forecast_line:
+            block = f"{block}\n{forecast_line}"
         lines.append(block)
     return "\n".join(lines)
 
@@ -1366,15 +3294,13 @@ def _record_hourly_snapshot(
     now: datetime,
     client: "HetznerClient",
     interval_minutes: int = 60,
+    snapshot: Optional[Dict[str, Any]] = None,
 ) -> None:
-    interval = max(1, min(60, int(interval_minutes)))
-    bucket_minute = (now.minute // interval) * interval
-    bucket_time = now.replace(minute=bucket_minute, second=0, microsecond=0)
-    hour_key = bucket_time.strftime("%Y-%m-%d %H:00") if interval >= 60 else bucket_time.strftime("%Y-%m-%d %H:%M")
+    hour_key = _snapshot_bucket_key(now, interval_minutes)
     hourly = state.get("hourly", {})
     if hour_key in hourly:
         return
-    hourly[hour_key] = _collect_traffic_snapshot(client)
+    hourly[hour_key] = snapshot if snapshot is not None else _collect_traffic_snapshot(client)
     state["hourly"] = hourly
 
 
@@ -1415,79 +3341,91 @@ def _format_hourly_report(hourly: Dict[str, Any], hours: int = 24) -> str:
 
 def _build_manual_report(config: Dict[str, Any], client: "HetznerClient") -> str:
     now = _now_local()
-    state = _load_report_state()
     interval_minutes = (config.get("traffic") or {}).get("check_interval", 60)
-    _record_hourly_snapshot(state, now, client, interval_minutes)
+    # Fetched before taking the report_state lock, so other writers never wait on upstream calls.
+    current_snapshot = _latest_fleet_traffic(client)
 
-    last_time = state.get("last_time")
-    last_snapshot = state.get("servers", {})
-    current_snapshot = _collect_traffic_snapshot(client)
+    def _apply(state: Dict[str, Any]) -> str:
+        _record_hourly_snapshot(state, now, client, interval_minutes, snapshot=current_snapshot)
 
-    traffic_cfg = config.get("traffic", {})
-    limit_gb = traffic_cfg.get("limit_gb")
-    limit_tb = None
-    if limit_gb:
-        try:
-            limit_tb = (Decimal(limit_gb) / Decimal(1024)).quantize(Decimal("0.001"), rounding=ROUND_HALF_UP)
-        except Exception:
-            limit_tb = None
+        last_time = state.get("last_time")
+        last_snapshot = state.get("servers", {})
 
-    parts = ["🕒 *手动流量汇报*"]
-    if last_time:
-        parts.append(f"统计区间: {last_time} ~ {now.strftime('%Y-%m-%d %H:%M')}")
-    else:
-        parts.append("统计区间: 首次统计（仅显示累计出站）")
+        traffic_cfg = config.get("traffic", {})
+        limit_gb = traffic_cfg.get("limit_gb")
+        limit_tb = None
+        if limit_gb:
+            try:
+                limit_tb = (Decimal(limit_gb) / Decimal(1024)).quantize(Decimal("0.001"), rounding=ROUND_HALF_UP)
+            except Exception:
+                limit_tb = None
 
-    for sid, data in current_snapshot.items():
-        outbound = data.get("outbound_bytes")
-        inbound = data.get("inbound_bytes")
-        total_tb = _bytes_to_tb(float(outbound)) if outbound is not None else Decimal("0.000")
-        usage = None
-        if limit_tb and outbound is not None:
-            usage = float((Decimal(outbound) / (Decimal(1024) ** 4) / limit_tb) * 100)
+        parts = ["🕒 *手动流量汇报*"]
+        if last_time:
+            parts.append(f"统计区间: {last_time} ~ {now.strftime('%Y-%m-%d %H:%M')}")
+        else:
+            parts.append("统计区间: 首次统计（仅显示累计出站）")
+
+        for sid, data in current_snapshot.items():
+            outbound = data.get("outbound_bytes")
+            inbound = data.get("inbound_bytes")
+            total_tb = _bytes_to_tb(float(outbound)) if outbound is not None else Decimal("0.000")
+            usage = None
+            if limit_tb and outbound is not None:
+                usage = float((Decimal(outbound) / (Decimal(1024) ** 4) / limit_tb) * 100)
+
+            last = last_snapshot.get(sid, {})
+            last_out = last.get("outbound_bytes")
+            delta_tb = None
+            if outbound is not None and last_out is not None:
+                delta = float(outbound) - float(last_out)
+                if delta >= 0:
+                    delta_tb = _bytes_to_tb(delta)
+
+            usage_text = f"{usage:.2f}%" if usage is not None else "N/A"
+            delta_text = f"{delta_tb} TB" if delta_tb is not None else "N/A"
+            inbound_tb = _bytes_to_tb(float(inbound)) if inbound is not None else Decimal("0.000")
+            parts.append(
+                f"🖥 *{data.get('name')}* (`{sid}`)\n"
+                f"💾 累计出站: *{total_tb} TB* / {limit_tb if limit_tb is not None else 'N/A'} TB\n"
+                f"📈 使用率: *{usage_text}*\n"
+                f"📊 区间增量: *{delta_text}*\n"
+                f"📥 入站: {inbound_tb} TB"
+            )
 
-        last = last_snapshot.get(sid, {})
-        last_out = last.get("outbound_bytes")
-        delta_tb = None
-        if outbound is not None and last_out is not None:
-            delta = float(outbound) - float(last_out)
-            if delta >= 0:
-                delta_tb = _bytes_to_tb(delta)
+        rebuild_summary = _summarize_rebuild_stats(state)
+        rebuild_total = rebuild_summary.get("total") or 0
+        rebuild_auto = rebuild_summary.get("auto_total") or 0
+        last_rebuild = rebuild_summary.get("last") or {}
+        parts.append(f"♻️ 重建统计: {rebuild_total} 次（自动 {rebuild_auto}）")
+        if last_rebuild.get("time"):
+            parts.append(
+                f"🕒 最近重建: {last_rebuild.get('time')} · {last_rebuild.get('server')} "
+                f"({last_rebuild.get('source')})"
+            )
 
-        usage_text = f"{usage:.2f}%" if usage is not None else "N/A"
-        delta_text = f"{delta_tb} TB" if delta_tb is not None else "N/A"
-        inbound_tb = _bytes_to_tb(float(inbound)) if inbound is not None else Decimal("0.000")
-        parts.append(
-            f"🖥 *{data.get('name')}* (`{sid}`)\n"
-            f"💾 累计出站: *{total_tb} TB* / {limit_tb if limit_tb is not None else 'N/A'} TB\n"
-            f"📈 使用率: *{usage_text}*\n"
-            f"📊 区间增量: *{delta_text}*\n"
-            f"📥 入站: {inbound_tb} TB"
-        )
+        parts.append(_format_hourly_report(state.get("hourly", {})))
+        state["last_time"] = now.strftime("%Y-%m-%d %H:%M")
+        state["servers"] = current_snapshot
+        return "\n\n".join(parts)
 
-    rebuild_summary = _summarize_rebuild_stats(state)
-    rebuild_total = rebuild_summary.get("total") or 0
-    rebuild_auto = rebuild_summary.get("auto_total") or 0
-    last_rebuild = rebuild_summary.get("last") or {}
-    parts.append(f"♻️ 重建统计: {rebuild_total} 次（自动 {rebuild_auto}）")
-    if last_rebuild.get("time"):
-        parts.append(
-            f"🕒 最近重建: {last_rebuild.get('time')} · {last_rebuild.get('server')} ({last_rebuild.get('source')})"
-        )
+    return _update_report_state(_apply)
 
-    parts.append(_format_hourly_report(state.get("hourly", {})))
-    state["last_time"] = now.strftime("%Y-%m-%d %H:%M")
-    state["servers"] = current_snapshot
-    _save_report_state(state)
-    return "\n\n".join(parts)
 
 def _perform_rebuild(
-    server_id: int, server_name: str, config: Dict[str, Any], source: str, client: "HetznerClient"
+    server_id: int,
+    server_name: str,
+    config: Dict[str, Any],
+    source: str,
+    client: "HetznerClient",
+    progress: Optional[Callable[[str], None]] = None,
 ) -> Dict[str, Any]:
+    report = progress or (lambda phase: None)
     lock = REBUILD_LOCKS.setdefault(str(server_id), threading.Lock())
     if not lock.acquire(blocking=False):
         return {"success": False, "error": "重建正在进行中"}
     try:
+        report("notify")
         telegram_cfg = config.get("telegram", {})
         bot_token = telegram_cfg.get("bot_token", "")
         chat_id = telegram_cfg.get("chat_id", "")
@@ -1505,7 +3443,7 @@ def _perform_rebuild(
                 ),
             )
 
-        result = client.rebuild_server(server_id, config)
+        result = client.rebuild_server(server_id, config, progress=report)
         if not result.get("success"):
             if telegram_cfg.get("enabled") and bot_token and chat_id:
                 _send_telegram_markdown(
@@ -1522,10 +3460,11 @@ def _perform_rebuild(
         record_map = cf_cfg.get("record_map", {}) or {}
         record_cfg = record_map.get(str(server_id)) or record_map.get(server_name)
 
+        report("config")
         new_id = result.get("new_server_id")
         if new_id:
-            _update_config_mapping(config, str(server_id), str(new_id))
-            _save_yaml(CONFIG_PATH, config)
+            # Remap on a fresh read: the job's config snapshot may predate other edits or rebuilds.
+            config = _update_config(lambda fresh: _update_config_mapping(fresh, str(server_id), str(new_id)))
 
         if not record_cfg and new_id:
             # If mapping was moved to the new ID, re-read it after config update.
@@ -1544,6 +3483,7 @@ def _perform_rebuild(
         )
         dns_result = None
         if resolved:
+            report("dns_update")
             dns_result = client.update_cloudflare_a_record(
                 resolved["api_token"],
                 resolved["zone_id"],
@@ -1567,7 +3507,8 @@ def _perform_rebuild(
             if dns_result:
                 dns_text = "✅ DNS 已更新" if dns_result.get("success") else f"❌ DNS 失败: {dns_result.get('error')}"
                 if dns_result.get("success") and resolved:
-                    verify = _verify_dns_record(resolved["record"], result.get("new_ip", ""))
+                    report("dns_verify")
+                    verify = _verify_dns_record(resolved["record"], result.get("new_ip", ""), cf_cfg)
                     if verify.get("ok"):
                         verify_text = f"✅ DNS 解析一致: `{verify.get('resolved')}`"
                     elif verify.get("resolved"):
@@ -1595,6 +3536,7 @@ def _perform_rebuild(
                     result.get("new_ip", ""),
                     bot_token,
                     chat_id,
+                    dns_cfg=cf_cfg,
                 )
         result["dns"] = dns_result
         return result
@@ -1602,30 +3544,117 @@ def _perform_rebuild(
         lock.release()
 
 
-def _schedule_cf_rebuild_sync(
-    client: "HetznerClient",
-    resolved: Dict[str, str],
-    ip: str,
-    attempts: int,
-    delay_seconds: float,
-    sync_delay: int,
-) -> None:
-    if not ip or sync_delay <= 0:
-        return
+class _SharedListFile:
+    """Exclusive read-modify-write of a JSON list that every worker process shares."""
 
-    def _worker() -> None:
-        time.sleep(sync_delay)
-        client.update_cloudflare_a_record(
-            resolved["api_token"],
-            resolved["zone_id"],
-            resolved["record"],
-            ip,
-            attempts=attempts,
-            delay_seconds=delay_seconds,
+    def __init__(self, path: str, key: str, lock: threading.Lock):
+        self.path = path
+        self.key = key
+        self.lock = lock
+
+    def __enter__(self) -> List[Dict[str, Any]]:
+        self.lock.acquire()
+        self._fd = None
+        try:
+            if fcntl is not None:
+                self._fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                raw = _load_json(self.path)
+            except ValueError as e:
+                print(f"[alert] {self.path} unreadable, starting empty: {e}")
+                raw = {}
+            self.items = raw.get(self.key) if isinstance(raw.get(self.key), list) else []
+        except Exception:
+            self._release()
+            raise
+        return self.items
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        try:
+            if exc_type is None:
+                tmp = f"{self.path}.tmp"
+                # Operational state only readable by the service user.
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    json.dump({self.key: self.items}, f)
+                os.replace(tmp, self.path)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.lock.release()
+
+
+class _DelayedTasksFile(_SharedListFile):
+    def __init__(self):
+        super().__init__(DELAYED_TASKS_PATH, "tasks", DELAYED_TASKS_LOCK)
+
+
+class _RebuildJobsFile(_SharedListFile):
+    def __init__(self):
+        super().__init__(REBUILD_JOBS_PATH, "jobs", REBUILD_JOBS_FILE_LOCK)
+
+
+class _TelegramInboxFile(_SharedListFile):
+    def __init__(self):
+        super().__init__(TELEGRAM_INBOX_PATH, "updates", TELEGRAM_INBOX_LOCK)
+
+
+def _enqueue_delayed_task(kind: str, record: str, ip: str, delay_seconds: float, payload: Dict[str, Any]) -> None:
+    """Persist a task to run after ``delay_seconds``.
+
+    Tasks are unique per (kind, record): the same IP is a no-op, a different IP
+    replaces the pending task because a newer rebuild superseded it.
+    """
+    key = f"{kind}:{record}"
+    with _DelayedTasksFile() as tasks:
+        for task in list(tasks):
+            if task.get("key") != key or task.get("state") == "running":
+                continue
+            if task.get("ip") == ip:
+                return
+            tasks.remove(task)
+            print(f"[info] delayed {kind} for {record} -> {task.get('ip')} superseded by {ip}")
+        tasks.append(
+            {
+                "id": uuid.uuid4().hex[:12],
+                "key": key,
+                "kind": kind,
+                "record": record,
+                "ip": ip,
+                "payload": payload,
+                "state": "pending",
+                "attempts": 0,
+                "run_at": time.time() + max(0.0, delay_seconds),
+                "created_at": time.time(),
+            }
         )
+    with DELAYED_TASKS_WAKE:
+        DELAYED_TASKS_WAKE.notify_all()
 
-    thread = threading.Thread(target=_worker, daemon=True)
-    thread.start()
+
+def _schedule_cf_rebuild_sync(
+    client: "HetznerClient",
+    resolved: Dict[str, str],
+    ip: str,
+    attempts: int,
+    delay_seconds: float,
+    sync_delay: int,
+) -> None:
+    if not ip or sync_delay <= 0:
+        return
+    # The zone and API token are looked up in config when the task runs, not persisted.
+    _enqueue_delayed_task(
+        "cf_sync",
+        resolved["record"],
+        ip,
+        sync_delay,
+        {"attempts": attempts, "delay_seconds": delay_seconds},
+    )
 
 
 def _schedule_dns_verify_notify(
@@ -1634,68 +3663,488 @@ def _schedule_dns_verify_notify(
     bot_token: str,
     chat_id: str,
     delay_seconds: int = CF_VERIFY_DELAY_SECONDS,
+    dns_cfg: Optional[Dict[str, Any]] = None,
 ) -> None:
     if not (record and expected_ip and bot_token and chat_id):
         return
+    # Telegram credentials are read from config when the task runs, not persisted.
+    resolvers, timeout = _dns_settings(dns_cfg)
+    _enqueue_delayed_task(
+        "dns_verify",
+        record,
+        expected_ip,
+        max(5, delay_seconds),
+        {"dns_cfg": {"dns_resolvers": [r for r in resolvers if r], "dns_timeout_seconds": timeout}},
+    )
+
 
-    def _worker() -> None:
-        time.sleep(max(5, delay_seconds))
-        verify = _verify_dns_record(record, expected_ip)
+def _run_delayed_task(task: Dict[str, Any], final_attempt: bool) -> bool:
+    payload = task.get("payload") or {}
+    if task["kind"] == "cf_sync":
+        resolved = _cf_record_for_name(_load_yaml(CONFIG_PATH), task["record"])
+        if not resolved:
+            print(f"[alert] dropping delayed cf_sync for {task['record']}: no longer in cloudflare.record_map")
+            return True
+        result = HetznerClient("").update_cloudflare_a_record(
+            resolved["api_token"],
+            resolved["zone_id"],
+            task["record"],
+            task["ip"],
+            attempts=1,
+            delay_seconds=0,
+            verify=True,
+        )
+        if not result.get("success"):
+            raise RuntimeError(result.get("error") or "DNS update failed")
+        return True
+    if task["kind"] == "dns_verify":
+        verify = _verify_dns_record(task["record"], task["ip"], payload.get("dns_cfg"))
+        if not verify.get("ok") and not verify.get("resolved") and not final_attempt:
+            raise RuntimeError(verify.get("error") or "DNS lookup failed")
         if verify.get("ok"):
             text = f"✅ DNS 解析一致: `{verify.get('resolved')}`"
         elif verify.get("resolved"):
             text = f"⚠️ DNS 解析不一致: `{verify.get('resolved')}`"
         else:
             text = f"⚠️ DNS 校验失败: {verify.get('error') or 'unknown error'}"
-        _send_telegram_markdown(bot_token, chat_id, text)
+        telegram_cfg = _load_yaml(CONFIG_PATH).get("telegram", {}) or {}
+        bot_token = telegram_cfg.get("bot_token", "")
+        chat_id = telegram_cfg.get("chat_id", "")
+        if bot_token and chat_id:
+            _send_telegram_markdown(bot_token, chat_id, text)
+        return True
+    print(f"[alert] dropping delayed task of unknown kind {task['kind']!r}")
+    return True
 
-    thread = threading.Thread(target=_worker, daemon=True)
-    thread.start()
+
+def _execute_delayed_task(task: Dict[str, Any]) -> None:
+    attempts = int(task.get("attempts") or 0) + 1
+    error: Optional[str] = None
+    try:
+        _run_delayed_task(task, final_attempt=attempts >= DELAYED_TASK_MAX_ATTEMPTS)
+    except Exception as e:
+        error = str(e)
+    with _DelayedTasksFile() as tasks:
+        current = next((t for t in tasks if t.get("id") == task["id"]), None)
+        if current is None:
+            return
+        if error is None:
+            tasks.remove(current)
+            result = "ok"
+        elif attempts >= DELAYED_TASK_MAX_ATTEMPTS:
+            tasks.remove(current)
+            result = "failed"
+            print(f"[alert] delayed {task['kind']} for {task['record']} gave up after {attempts} attempts: {error}")
+        else:
+            backoff = min(DELAYED_TASK_BACKOFF_MAX_SECONDS, DELAYED_TASK_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+            current.update(
+                state="pending",
+                attempts=attempts,
+                last_error=error,
+                run_at=time.time() + backoff * random.uniform(0.8, 1.2),
+            )
+            result = "retry"
+    _metric_inc("hetzner_web_delayed_task_runs_total", {"kind": task["kind"], "result": result})
+    with DELAYED_TASKS_WAKE:
+        DELAYED_TASKS_WAKE.notify_all()
 
 
-def _sync_cloudflare_records(config: Dict[str, Any], client: "HetznerClient") -> Dict[str, int]:
-    cf_cfg = config.get("cloudflare", {})
-    if not cf_cfg.get("sync_on_start"):
-        return {"updated": 0, "skipped": 0}
+def _delayed_task_loop() -> None:
+    with _DelayedTasksFile() as tasks:
+        for task in tasks:
+            if task.get("state") == "running":
+                # Interrupted by a restart: run it again.
+                task["state"] = "pending"
+            # Older cf_sync tasks stored the Cloudflare credentials; they are resolved at run time now.
+            for secret in ("api_token", "zone_id"):
+                (task.get("payload") or {}).pop(secret, None)
+    while not WORKER_STOP.is_set():
+        started = time.monotonic()
+        wait = DELAYED_TASK_POLL_SECONDS
+        try:
+            due: List[Dict[str, Any]] = []
+            now = time.time()
+            with _DelayedTasksFile() as tasks:
+                for task in tasks:
+                    if task.get("state") != "pending":
+                        continue
+                    if float(task.get("run_at") or 0) <= now:
+                        task["state"] = "running"
+                        due.append(dict(task))
+                    else:
+                        wait = min(wait, float(task["run_at"]) - now)
+            for task in due:
+                _submit_tracked(DELAYED_TASK_EXECUTOR, _execute_delayed_task, task)
+            _observe_loop("delayed_tasks", started)
+        except Exception as e:
+            _observe_loop("delayed_tasks", started, e)
+            print(f"[alert] delayed task queue error: {e}")
+        with DELAYED_TASKS_WAKE:
+            if not WORKER_STOP.is_set():
+                DELAYED_TASKS_WAKE.wait(max(0.5, wait))
+
+
+def _delayed_queue_depth() -> Dict[tuple, int]:
+    raw = _load_cached(DELAYED_TASKS_PATH, _load_json) if os.path.exists(DELAYED_TASKS_PATH) else {}
+    depth: Dict[tuple, int] = {}
+    for task in raw.get("tasks") or []:
+        key = (task.get("kind") or "unknown", task.get("state") or "pending")
+        depth[key] = depth.get(key, 0) + 1
+    return depth
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {key: value for key, value in job.items() if not key.startswith("_")}
+    view["phases"] = [dict(phase) for phase in job.get("phases", [])]
+    return view
+
+
+def _pid_alive(pid: Any) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except (TypeError, ValueError, OSError):
+        return False
+    return True
+
+
+def _reap_orphan_jobs(jobs: List[Dict[str, Any]]) -> None:
+    """Fail queued/running jobs whose owning worker process is gone (crash or restart)."""
+    for job in jobs:
+        if job.get("status") in ("queued", "running") and not _pid_alive(job.get("pid")):
+            job.update(status="failed", phase="failed", error="worker process exited", finished_at=time.time())
+            job["version"] = int(job.get("version") or 0) + 1
+
+
+def _publish_rebuild_job(view: Dict[str, Any]) -> None:
+    try:
+        with _RebuildJobsFile() as jobs:
+            for index, existing in enumerate(jobs):
+                if existing.get("id") == view["id"]:
+                    if int(existing.get("version") or 0) <= view["version"]:
+                        jobs[index] = view
+                    break
+            else:
+                jobs.append(view)
+    except Exception as e:
+        print(f"[alert] rebuild job publish failed: {e}")
+
+
+def _shared_rebuild_jobs() -> List[Dict[str, Any]]:
+    try:
+        jobs = _load_json(REBUILD_JOBS_PATH).get("jobs") or []
+    except Exception:
+        return []
+    jobs = [job for job in jobs if isinstance(job, dict)]
+    _reap_orphan_jobs(jobs)
+    return jobs
+
+
+def _job_enter_phase(job: Dict[str, Any], phase: str) -> None:
+    now = time.time()
+    with REBUILD_JOBS_LOCK:
+        phases = job["phases"]
+        if phases and phases[-1].get("finished_at") is None:
+            phases[-1]["finished_at"] = now
+            phases[-1]["duration_ms"] = int((now - phases[-1]["started_at"]) * 1000)
+        if phase:
+            phases.append({"name": phase, "started_at": now, "finished_at": None, "duration_ms": None})
+        job["phase"] = phase or job.get("phase")
+        job["version"] += 1
+        view = _job_view(job)
+    _publish_rebuild_job(view)
+
+
+def _prune_rebuild_jobs(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    cutoff = time.time() - REBUILD_JOB_RETENTION_SECONDS
+    return [job for job in jobs if not (job.get("finished_at") and job["finished_at"] < cutoff)]
+
+
+def _run_rebuild_job(job: Dict[str, Any]) -> None:
+    with REBUILD_JOBS_LOCK:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        job["version"] += 1
+        view = _job_view(job)
+    _publish_rebuild_job(view)
+    result: Dict[str, Any]
+    try:
+        config = job["_config"] or _load_yaml(CONFIG_PATH)
+        client = job["_client"] or HetznerClient(config["hetzner"]["api_token"])
+        result = _perform_rebuild(
+            job["server_id"],
+            job["server_name"],
+            config,
+            job["source"],
+            client,
+            progress=lambda phase: _job_enter_phase(job, phase),
+        )
+    except Exception as e:
+        print(f"[alert] rebuild job {job['id']} error: {e}")
+        result = {"success": False, "error": str(e)}
+    _job_enter_phase(job, "")
+    with REBUILD_JOBS_LOCK:
+        job["status"] = "succeeded" if result.get("success") else "failed"
+        job["phase"] = job["status"]
+        job["result"] = result
+        job["error"] = None if result.get("success") else result.get("error")
+        job["finished_at"] = time.time()
+        job["version"] += 1
+        job.pop("_config", None)
+        job.pop("_client", None)
+        on_done = job.pop("_on_done", None)
+        view = _job_view(job)
+    _publish_rebuild_job(view)
+    # A rebuild replaces the server (new id and IP), so no cached bot reply is still valid.
+    _invalidate_bot_cache()
+    if on_done:
+        try:
+            on_done(result)
+        except Exception as e:
+            print(f"[alert] rebuild job callback error: {e}")
+
+
+def _submit_rebuild_job(
+    server_id: int,
+    server_name: str,
+    source: str,
+    config: Optional[Dict[str, Any]] = None,
+    client: Optional["HetznerClient"] = None,
+    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Queue a rebuild and return its job view.
+
+    A server with a queued or running rebuild in any worker process gets the existing
+    job back (flagged "deduplicated"); the check and the insert happen under the jobs
+    file lock. The rebuild pool size caps how many rebuilds run at once per process.
+    """
+    key = str(server_id)
+    with _RebuildJobsFile() as jobs:
+        _reap_orphan_jobs(jobs)
+        jobs[:] = _prune_rebuild_jobs(jobs)
+        for existing in jobs:
+            if str(existing.get("server_id")) == key and existing.get("status") in ("queued", "running"):
+                view = dict(existing)
+                view["deduplicated"] = True
+                return view
+        job: Dict[str, Any] = {
+            "id": uuid.uuid4().hex[:12],
+            "type": "rebuild",
+            "server_id": server_id,
+            "server_name": server_name,
+            "source": source,
+            "status": "queued",
+            "phase": "queued",
+            "phases": [],
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "version": 0,
+            "pid": os.getpid(),
+            "_config": config,
+            "_client": client,
+            "_on_done": on_done,
+        }
+        with REBUILD_JOBS_LOCK:
+            kept = {j["id"] for j in _prune_rebuild_jobs(list(REBUILD_JOBS.values()))}
+            for job_id in list(REBUILD_JOBS):
+                if job_id not in kept:
+                    REBUILD_JOBS.pop(job_id, None)
+            REBUILD_JOBS[job["id"]] = job
+            view = _job_view(job)
+        jobs.append(view)
+    _submit_tracked(REBUILD_EXECUTOR, _run_rebuild_job, job)
+    return view
+
+
+def _get_rebuild_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with REBUILD_JOBS_LOCK:
+        job = REBUILD_JOBS.get(job_id)
+        if job:
+            return _job_view(job)
+    for job in _shared_rebuild_jobs():
+        if job.get("id") == job_id:
+            return job
+    return None
+
+
+def _list_rebuild_jobs() -> List[Dict[str, Any]]:
+    jobs = {job["id"]: job for job in _shared_rebuild_jobs() if job.get("id")}
+    with REBUILD_JOBS_LOCK:
+        jobs.update({job_id: _job_view(job) for job_id, job in REBUILD_JOBS.items()})
+    return list(jobs.values())
+
+
+def _rebuild_job_active(server_id: Any) -> bool:
+    return any(
+        str(job.get("server_id")) == str(server_id) and job.get("status") in ("queued", "running")
+        for job in _list_rebuild_jobs()
+    )
+
+
+def _mark_auto_rebuild(sid: str, result: Dict[str, Any]) -> None:
+    if result.get("success") and sid in ALERT_STATE:
+        ALERT_STATE[sid]["auto_rebuild"] = True
+
+
+def _rebuild_queue_depth() -> Dict[str, int]:
+    jobs = _list_rebuild_jobs()
+    queued = sum(1 for job in jobs if job.get("status") == "queued")
+    running = sum(1 for job in jobs if job.get("status") == "running")
+    return {"queued": queued, "running": running}
+
+
+def _server_ipv4(server: Dict[str, Any]) -> Optional[str]:
+    return ((server.get("public_net") or {}).get("ipv4") or {}).get("ip")
+
+
+def _sync_dns_record(
+    client: "HetznerClient",
+    resolved: Dict[str, str],
+    server_id: str,
+    ip: Optional[str],
+    attempts: int,
+    delay_seconds: float,
+) -> Dict[str, Any]:
+    if not ip:
+        ip = _server_ipv4(client.get_server(int(server_id)) or {})
+    if not ip:
+        return {"success": False, "error": "no ipv4"}
+    return client.update_cloudflare_a_record(
+        resolved["api_token"],
+        resolved["zone_id"],
+        resolved["record"],
+        ip,
+        attempts=attempts,
+        delay_seconds=delay_seconds,
+    )
+
+
+def _sync_dns_targets(
+    config: Dict[str, Any],
+    client: "HetznerClient",
+    targets: List[tuple],
+    wait: bool = True,
+) -> Dict[str, int]:
+    """Update the mapped records of (server_id, name, ip) targets on the DNS pool.
+
+    With wait=False the updates run in the background and failures are only logged.
+    """
+    cf_cfg = config.get("cloudflare", {}) or {}
     record_map = cf_cfg.get("record_map", {}) or {}
-    if not record_map:
-        return {"updated": 0, "skipped": 0}
     attempts = _parse_int_or_default(cf_cfg.get("update_retries"), CF_RETRY_ATTEMPTS)
     delay_seconds = _parse_float_or_default(cf_cfg.get("update_retry_delay"), CF_RETRY_DELAY_SECONDS)
-    servers = client.get_servers()
-    updated = 0
-    skipped = 0
-    for s in servers:
-        sid = str(s["id"])
-        record_cfg = record_map.get(sid) or record_map.get(s.get("name", ""))
+    counts = {"updated": 0, "unchanged": 0, "skipped": 0}
+    futures = []
+    for sid, name, ip in targets:
+        record_cfg = record_map.get(str(sid)) or record_map.get(name or "")
         resolved = _resolve_cf_record(record_cfg, cf_cfg.get("zone_id", ""), cf_cfg.get("api_token", ""))
         if not resolved:
-            skipped += 1
+            counts["skipped"] += 1
             continue
-        ip = None
-        public_net = s.get("public_net", {})
-        if public_net.get("ipv4"):
-            ip = public_net["ipv4"].get("ip")
-        if not ip:
-            detail = client.get_server(s["id"]) or {}
-            if detail.get("public_net", {}).get("ipv4"):
-                ip = detail["public_net"]["ipv4"].get("ip")
-        if not ip:
-            skipped += 1
-            continue
-        result = client.update_cloudflare_a_record(
-            resolved["api_token"],
-            resolved["zone_id"],
-            resolved["record"],
-            ip,
-            attempts=attempts,
-            delay_seconds=delay_seconds,
+        future = _submit_tracked(
+            CF_SYNC_EXECUTOR, _sync_dns_record, client, resolved, str(sid), ip, attempts, delay_seconds
         )
-        if result.get("success"):
-            updated += 1
+        futures.append((resolved["record"], future))
+        if not wait:
+            future.add_done_callback(functools.partial(_log_dns_sync_result, resolved["record"]))
+    if not wait:
+        return counts
+    for record, future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        if not result.get("success"):
+            counts["skipped"] += 1
+            print(f"[alert] DNS sync failed: record={record} error={result.get('error')}")
+        elif result.get("changed") is False:
+            counts["unchanged"] += 1
         else:
-            skipped += 1
-    return {"updated": updated, "skipped": skipped}
+            counts["updated"] += 1
+    return counts
+
+
+def _log_dns_sync_result(record: str, future: Any) -> None:
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    if not result.get("success"):
+        print(f"[alert] DNS sync failed: record={record} error={result.get('error')}")
+    elif result.get("changed"):
+        print(f"[info] DNS record updated: record={record}")
+
+
+def _sync_cloudflare_records(config: Dict[str, Any], client: "HetznerClient", force: bool = False) -> Dict[str, int]:
+    cf_cfg = config.get("cloudflare", {})
+    if not force and not cf_cfg.get("sync_on_start"):
+        return {"updated": 0, "unchanged": 0, "skipped": 0}
+    record_map = cf_cfg.get("record_map", {}) or {}
+    if not record_map:
+        return {"updated": 0, "unchanged": 0, "skipped": 0}
+    targets = [(str(s["id"]), s.get("name", ""), _server_ipv4(s)) for s in client.get_servers()]
+    return _sync_dns_targets(config, client, targets)
+
+
+def _diff_fleet(previous: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Server additions, removals and IPv4 changes between two fleet views (sid -> name/ipv4)."""
+    changes: List[Dict[str, Any]] = []
+
+    def _change(kind: str, sid: str, name: Any, old_ip: Optional[str], new_ip: Optional[str]) -> None:
+        changes.append({"type": kind, "sid": sid, "name": name, "old_ip": old_ip, "new_ip": new_ip})
+
+    for sid, entry in current.items():
+        before = previous.get(sid)
+        if before is None:
+            _change("added", sid, entry.get("name"), None, entry.get("ipv4"))
+        elif entry.get("ipv4") and entry.get("ipv4") != before.get("ipv4"):
+            _change("ip_changed", sid, entry.get("name"), before.get("ipv4"), entry.get("ipv4"))
+    for sid, before in previous.items():
+        if sid not in current:
+            _change("removed", sid, before.get("name"), before.get("ipv4"), None)
+    return changes
+
+
+def _sync_dns_from_fleet(event: Dict[str, Any]) -> None:
+    """Sync records for servers that appeared or changed IP since the last poll, plus an optional full reconcile."""
+    config = event["config"]
+    cf_cfg = config.get("cloudflare", {}) or {}
+    current = {
+        sid: {"name": entry.get("name") or sid, "ipv4": entry.get("ipv4")}
+        for sid, entry in event["servers"].items()
+    }
+    previous = DNS_FLEET_STATE["servers"]
+    DNS_FLEET_STATE["servers"] = current
+    if previous is None:
+        # The first view is the baseline; sync_on_start covers records that were already stale.
+        DNS_FLEET_STATE["reconciled_at"] = time.time()
+        return
+    if not cf_cfg.get("record_map"):
+        return
+    changes = _diff_fleet(previous, current)
+    for change in changes:
+        print(
+            f"[info] fleet change: {change['type']} server={change['name']} "
+            f"old_ip={change['old_ip']} new_ip={change['new_ip']}"
+        )
+    targets = [(c["sid"], c["name"], c["new_ip"]) for c in changes if c["type"] != "removed" and c["new_ip"]]
+    reconcile_hours = _parse_float_or_default(cf_cfg.get("reconcile_hours"), 0)
+    reconcile_due = time.time() - DNS_FLEET_STATE["reconciled_at"] >= reconcile_hours * 3600
+    if reconcile_hours > 0 and event["bucket"] and reconcile_due:
+        DNS_FLEET_STATE["reconciled_at"] = time.time()
+        # Relist so edits made in the Cloudflare dashboard are seen, then check every server.
+        with CF_RECORD_CACHE_LOCK:
+            CF_RECORD_CACHE.clear()
+        targets = [(sid, entry["name"], entry["ipv4"]) for sid, entry in current.items()]
+        print(f"[info] DNS reconcile: checking {len(targets)} servers")
+    if targets:
+        _sync_dns_targets(config, event["client"], targets, wait=False)
 
 
 def _normalize_scheduler_tasks(config: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -1736,8 +4185,6 @@ def _update_config_mapping(config: Dict[str, Any], old_id: str, new_id: str) ->
 
     cf_cfg = config.get("cloudflare", {}) or {}
     record_map = cf_cfg.get("record_map", {}) or {}
-    attempts = _parse_int_or_default(cf_cfg.get("update_retries"), CF_RETRY_ATTEMPTS)
-    delay_seconds = _parse_float_or_default(cf_cfg.get("update_retry_delay"), CF_RETRY_DELAY_SECONDS)
     if old_id in record_map:
         record_map[new_id] = record_map[old_id]
         record_map.pop(old_id, None)
@@ -1745,11 +4192,13 @@ def _update_config_mapping(config: Dict[str, Any], old_id: str, new_id: str) ->
         config["cloudflare"] = cf_cfg
 
 
-def _create_from_snapshot_map(config: Dict[str, Any], client: "HetznerClient") -> None:
+def _create_from_snapshot_map(config: Dict[str, Any], client: "HetznerClient") -> List[tuple]:
+    """Create a server for every snapshot_id_map entry; returns the (old_id, new_id) pairs created."""
     rebuild_cfg = config.get("rebuild", {}) or {}
     snapshot_map = rebuild_cfg.get("snapshot_id_map", {}) or {}
+    created_ids: List[tuple] = []
     if not snapshot_map:
-        return
+        return created_ids
 
     template = rebuild_cfg.get("fallback_template", {}) or {}
     server_type = template.get("server_type")
@@ -1758,8 +4207,13 @@ def _create_from_snapshot_map(config: Dict[str, Any], client: "HetznerClient") -
 
     cf_cfg = config.get("cloudflare", {}) or {}
     record_map = cf_cfg.get("record_map", {}) or {}
+    attempts = _parse_int_or_default(cf_cfg.get("update_retries"), CF_RETRY_ATTEMPTS)
+    delay_seconds = _parse_float_or_default(cf_cfg.get("update_retry_delay"), CF_RETRY_DELAY_SECONDS)
 
-    for old_id, snapshot_id in snapshot_map.items():
+    for old_id, snapshot_id in list(snapshot_map.items()):
+        if _rebuild_job_active(old_id):
+            print(f"[info] skip create from snapshot for {old_id}: rebuild in progress")
+            continue
         record_cfg = record_map.get(str(old_id))
         record = None
         if isinstance(record_cfg, dict):
@@ -1783,7 +4237,8 @@ def _create_from_snapshot_map(config: Dict[str, Any], client: "HetznerClient") -
         new_id = str(created.get("id"))
         new_ip = (created.get("public_net") or {}).get("ipv4", {}).get("ip")
         if new_id:
-            _update_config_mapping(config, str(old_id), new_id)
+            _update_config(lambda fresh: _update_config_mapping(fresh, str(old_id), new_id))
+            created_ids.append((str(old_id), new_id))
             resolved = _resolve_cf_record(record_cfg, cf_cfg.get("zone_id", ""), cf_cfg.get("api_token", ""))
             if resolved and new_ip:
                 client.update_cloudflare_a_record(
@@ -1794,6 +4249,7 @@ def _create_from_snapshot_map(config: Dict[str, Any], client: "HetznerClient") -
                     attempts=attempts,
                     delay_seconds=delay_seconds,
                 )
+    return created_ids
 
 
 def _run_schedule_task(action: str, config: Dict[str, Any], client: "HetznerClient") -> None:
@@ -1803,221 +4259,667 @@ def _run_schedule_task(action: str, config: Dict[str, Any], client: "HetznerClie
         _create_from_snapshot_map(config, client)
 
 
-def _schedule_loop() -> None:
-    while True:
+def _schedule_timezone(config: Dict[str, Any]) -> Optional[ZoneInfo]:
+    name = ((config.get("scheduler") or {}).get("timezone") or "").strip()
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        print(f"[alert] unknown scheduler timezone {name!r}, using local time")
+        return None
+
+
+def _next_fire_time(hhmm: str, after: datetime, tz: Optional[ZoneInfo] = None) -> Optional[datetime]:
+    """Next wall-clock occurrence of HH:MM strictly after ``after`` in ``tz`` (local time if None).
+
+    Times inside a DST gap are moved forward to the first valid instant; ambiguous
+    times during fall-back fire on their first occurrence.
+    """
+    try:
+        hh, mm = str(hhmm).strip().split(":", 1)
+        hour, minute = int(hh), int(mm)
+    except (TypeError, ValueError):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    base = after.astimezone(tz) if tz else after.astimezone()
+    for offset in range(3):
+        day = base.date() + timedelta(days=offset)
+        if tz:
+            candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz)
+        else:
+            candidate = datetime(day.year, day.month, day.day, hour, minute).astimezone()
+        candidate = candidate.astimezone(timezone.utc)
+        if candidate > after:
+            return candidate.astimezone(tz) if tz else candidate.astimezone()
+    return None
+
+
+def _desired_timer_tasks(config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    desired: Dict[str, Dict[str, Any]] = {}
+    scheduler_cfg = config.get("scheduler", {}) or {}
+    if scheduler_cfg.get("enabled"):
+        for task in _normalize_scheduler_tasks(config):
+            action = task.get("action")
+            times = task.get("times") or []
+            if isinstance(times, str):
+                times = [times]
+            for t in times:
+                desired[f"{action}@{t}"] = {"kind": "task", "action": action, "time": t}
+    telegram_cfg = config.get("telegram", {}) or {}
+    daily_time = telegram_cfg.get("daily_report_time")
+    if (
+        telegram_cfg.get("enabled")
+        and daily_time
+        and telegram_cfg.get("bot_token")
+        and telegram_cfg.get("chat_id")
+    ):
+        desired[f"daily_report@{daily_time}"] = {"kind": "daily_report", "time": daily_time}
+    return desired
+
+
+def _timer_fired_times() -> Dict[str, float]:
+    """Last fire time per timer key, loaded once from TIMER_STATE_PATH (caller holds TIMER_LOCK)."""
+    if TIMER_STATE["fired"] is None:
         try:
-            config = _load_yaml(CONFIG_PATH)
-            scheduler_cfg = config.get("scheduler", {}) or {}
-            if not scheduler_cfg.get("enabled"):
-                time.sleep(30)
+            raw = _load_json(TIMER_STATE_PATH).get("fired") or {}
+        except Exception as e:
+            print(f"[alert] timer state load failed: {e}")
+            raw = {}
+        fired: Dict[str, float] = {}
+        for key, value in raw.items():
+            try:
+                fired[str(key)] = float(value)
+            except (TypeError, ValueError):
+                continue
+        TIMER_STATE["fired"] = fired
+    return TIMER_STATE["fired"]
+
+
+def _record_timer_fired(key: str, fire_ts: float) -> None:
+    with TIMER_LOCK:
+        fired = _timer_fired_times()
+        fired[key] = fire_ts
+        snapshot = dict(fired)
+    try:
+        _save_json(TIMER_STATE_PATH, {"fired": snapshot})
+    except Exception as e:
+        print(f"[alert] timer state save failed: {e}")
+
+
+def _sync_timer_tasks(config: Dict[str, Any]) -> None:
+    """Reconcile the timer heap with the tasks implied by ``config``.
+
+    A task seen for the first time in this process resumes from its persisted last
+    fire time, so an occurrence missed while the app was down comes due immediately
+    and goes through the misfire policy like any other late run.
+    """
+    tz = _schedule_timezone(config)
+    tz_name = getattr(tz, "key", None)
+    desired = _desired_timer_tasks(config)
+    now = datetime.now(timezone.utc)
+    with TIMER_LOCK:
+        fired = _timer_fired_times()
+        for key in list(fired):
+            if key not in desired:
+                fired.pop(key, None)
+        for key in list(TIMER_TASKS):
+            if key not in desired:
+                TIMER_TASKS.pop(key, None)
+        for key, spec in desired.items():
+            existing = TIMER_TASKS.get(key)
+            if existing and existing["tz"] == tz_name:
                 continue
-            tasks = _normalize_scheduler_tasks(config)
-            if not tasks:
-                time.sleep(30)
+            after = now
+            if not existing and key in fired:
+                after = min(now, datetime.fromtimestamp(fired[key], timezone.utc))
+            next_run = _next_fire_time(spec["time"], after, tz)
+            if next_run is None:
+                print(f"[alert] invalid schedule time for {key}")
                 continue
+            TIMER_STATE["seq"] += 1
+            TIMER_TASKS[key] = {
+                **spec,
+                "key": key,
+                "tz": tz_name,
+                "next_run": next_run,
+                "last_run": existing.get("last_run") if existing else None,
+                "generation": TIMER_STATE["seq"],
+            }
+            heapq.heappush(TIMER_HEAP, (next_run.timestamp(), TIMER_STATE["seq"], key))
+        TIMER_LOCK.notify_all()
 
-            now = _now_local()
-            current_time = now.strftime("%H:%M")
-            current_date = now.strftime("%Y-%m-%d")
-            last_runs = SCHEDULE_STATE.setdefault("last_task_runs", {})
-
-            for task in tasks:
-                action = task.get("action")
-                times = task.get("times") or []
-                if isinstance(times, str):
-                    times = [times]
-                for t in times:
-                    key = f"{action}:{t}"
-                    if current_time == t and last_runs.get(key) != current_date:
-                        client = HetznerClient(config["hetzner"]["api_token"])
-                        _run_schedule_task(action, config, client)
-                        _save_yaml(CONFIG_PATH, config)
-                        last_runs[key] = current_date
-        except Exception as e:
-            print(f"[alert] schedule error: {e}")
-        time.sleep(20)
 
-def _monitor_traffic_loop() -> None:
-    while True:
-        try:
-            config = _load_yaml(CONFIG_PATH)
-            traffic_cfg = config.get("traffic", {})
-            telegram_cfg = config.get("telegram", {})
-            enabled = bool(telegram_cfg.get("enabled"))
-            limit_gb = traffic_cfg.get("limit_gb")
-            bot_token = telegram_cfg.get("bot_token", "")
-            chat_id = telegram_cfg.get("chat_id", "")
-            exceed_action = traffic_cfg.get("exceed_action", "")
-            check_interval = traffic_cfg.get("check_interval", 5)
-            interval_seconds = max(30, int(check_interval) * 60)
+def _pop_due_timer_tasks(now_ts: float) -> List[tuple]:
+    due: List[tuple] = []
+    now = datetime.fromtimestamp(now_ts, timezone.utc)
+    while TIMER_HEAP and TIMER_HEAP[0][0] <= now_ts:
+        fire_ts, generation, key = heapq.heappop(TIMER_HEAP)
+        entry = TIMER_TASKS.get(key)
+        if not entry or entry["generation"] != generation:
+            continue
+        due.append((dict(entry), fire_ts))
+        # Occurrences missed during a long stall collapse into this single run.
+        tz = ZoneInfo(entry["tz"]) if entry["tz"] else None
+        next_run = _next_fire_time(entry["time"], now, tz)
+        if next_run is None:
+            TIMER_TASKS.pop(key, None)
+            continue
+        TIMER_STATE["seq"] += 1
+        entry["next_run"] = next_run
+        entry["generation"] = TIMER_STATE["seq"]
+        heapq.heappush(TIMER_HEAP, (next_run.timestamp(), TIMER_STATE["seq"], key))
+    return due
 
-            if not limit_gb:
-                time.sleep(interval_seconds)
-                continue
 
-            try:
-                limit_bytes = float(Decimal(limit_gb) * (Decimal(1024) ** 3))
-            except Exception:
-                time.sleep(interval_seconds)
-                continue
+def _misfire_allows(config: Dict[str, Any], lateness: float) -> bool:
+    if lateness <= TIMER_LATE_TOLERANCE_SECONDS:
+        return True
+    scheduler_cfg = config.get("scheduler", {}) or {}
+    policy = scheduler_cfg.get("misfire_policy") or "run_once"
+    if policy == "skip":
+        return False
+    grace = _parse_float_or_default(scheduler_cfg.get("misfire_grace_seconds"), TIMER_MISFIRE_GRACE_SECONDS)
+    return lateness <= grace
 
-            levels = _parse_alert_levels(telegram_cfg.get("notify_levels"))
+
+def _run_timer_task(entry: Dict[str, Any], fire_ts: float) -> None:
+    loop = "schedule" if entry["kind"] == "task" else "daily_report"
+    started = time.monotonic()
+    try:
+        config = _load_yaml(CONFIG_PATH)
+        current_date = _now_local().strftime("%Y-%m-%d")
+        if entry["kind"] == "task":
             client = HetznerClient(config["hetzner"]["api_token"])
-            servers = client.get_servers()
-            qb_stats = _collect_qbittorrent_stats(config)
-            qb_map = _qb_instance_map(qb_stats) if qb_stats.get("enabled") else {}
+            _run_schedule_task(entry["action"], config, client)
+            SCHEDULE_STATE.setdefault("last_task_runs", {})[f"{entry['action']}:{entry['time']}"] = current_date
+        else:
+            telegram_cfg = config.get("telegram", {}) or {}
+            client = HetznerClient(config["hetzner"]["api_token"])
+            report = _build_daily_report(config, client)
+            _send_telegram_markdown(telegram_cfg.get("bot_token", ""), telegram_cfg.get("chat_id", ""), report)
+            SCHEDULE_STATE["last_daily_report"] = current_date
+        with TIMER_LOCK:
+            if entry["key"] in TIMER_TASKS:
+                TIMER_TASKS[entry["key"]]["last_run"] = datetime.fromtimestamp(fire_ts).astimezone()
+        _observe_loop(loop, started)
+    except Exception as e:
+        _observe_loop(loop, started, e)
+        print(f"[alert] {loop.replace('_', ' ')} error: {e}")
 
-            for s in servers:
-                sid = str(s["id"])
-                detail = client.get_server(s["id"]) or {}
-                outgoing = detail.get("outgoing_traffic")
-                if outgoing is None:
-                    continue
-                percent = (float(outgoing) / limit_bytes) * 100
-                state = ALERT_STATE.setdefault(
-                    sid, {"last_level": 0, "last_outgoing": None, "auto_rebuild": False}
-                )
-                last_outgoing = state.get("last_outgoing")
-                if last_outgoing is not None and float(outgoing) < float(last_outgoing):
-                    state["last_level"] = 0
-                    state["auto_rebuild"] = False
-                    _persist_threshold_from_alert_state()
-                state["last_outgoing"] = float(outgoing)
-
-                reached = [level for level in levels if percent >= level]
-                if not reached:
+
+def _timer_loop() -> None:
+    """Single scheduler thread: sleeps until the earliest task is due instead of polling HH:MM."""
+    config: Dict[str, Any] = {}
+    while not WORKER_STOP.is_set():
+        started = time.monotonic()
+        try:
+            try:
+                mtime = os.stat(CONFIG_PATH).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != TIMER_STATE["config_mtime"]:
+                TIMER_STATE["config_mtime"] = mtime
+                config = _load_yaml(CONFIG_PATH) if mtime is not None else {}
+                _sync_timer_tasks(config)
+            with TIMER_LOCK:
+                now_ts = time.time()
+                due = _pop_due_timer_tasks(now_ts)
+                if not due:
+                    # Capped so wall-clock jumps and config edits are noticed promptly.
+                    wait = TIMER_MAX_SLEEP_SECONDS
+                    if TIMER_HEAP:
+                        wait = min(wait, max(0.0, TIMER_HEAP[0][0] - now_ts))
+                    _observe_loop("timer", started)
+                    if not WORKER_STOP.is_set():
+                        TIMER_LOCK.wait(timeout=wait)
                     continue
-                last_level = int(state.get("last_level") or 0)
-                levels_to_send = [level for level in levels if last_level < level <= percent]
-                if not levels_to_send:
+            for entry, fire_ts in due:
+                lateness = now_ts - fire_ts
+                _record_timer_fired(entry["key"], fire_ts)
+                if not _misfire_allows(config, lateness):
+                    print(f"[alert] skipped {entry['key']}: {int(lateness)}s late (misfire policy)")
                     continue
-
-                outbound_tb = _bytes_to_tb(float(outgoing))
-                server_name = detail.get("name") or s.get("name") or sid
-                if enabled and bot_token and chat_id:
-                    limit_tb = (Decimal(limit_bytes) / (Decimal(1024) ** 4)).quantize(
-                        Decimal("0.001"), rounding=ROUND_HALF_UP
-                    )
-                    qb_line = _build_qb_compare_line(
-                        server_name,
-                        outgoing,
-                        detail.get("ingoing_traffic"),
-                        qb_map,
-                    )
-                    for level in levels_to_send:
-                        notify_text = _format_traffic_notification(
-                            server_name,
-                            outgoing,
-                            detail.get("ingoing_traffic"),
-                            limit_tb,
-                            percent,
-                            int(level),
-                            qb_line,
-                        )
-                        if _send_telegram_markdown(bot_token, chat_id, notify_text):
-                            state["last_level"] = int(level)
-                            _persist_threshold_from_alert_state()
-                            print(
-                                f"[alert] telegram notify sent: server={server_name} "
-                                f"percent={percent:.2f} level={int(level)}"
-                            )
-
-                if exceed_action in ("rebuild", "delete_rebuild") and float(outgoing) >= limit_bytes:
-                    if not state.get("auto_rebuild"):
-                        server_name = detail.get("name") or s.get("name") or sid
-                        if enabled and bot_token and chat_id:
-                            _send_telegram_markdown(
-                                bot_token, chat_id, _format_exceed_notification(server_name, percent)
-                            )
-                        result = _perform_rebuild(
-                            s["id"],
-                            server_name,
-                            config,
-                            "流量超标自动重建",
-                            client,
-                        )
-                        if result.get("success"):
-                            state["auto_rebuild"] = True
-                elif exceed_action == "delete" and float(outgoing) >= limit_bytes:
-                    if not state.get("auto_rebuild"):
-                        if client.delete_server(s["id"]):
-                            state["auto_rebuild"] = True
+                if lateness > TIMER_LATE_TOLERANCE_SECONDS:
+                    print(f"[info] running {entry['key']} {int(lateness)}s late")
+                _submit_tracked(TIMER_EXECUTOR, _run_timer_task, entry, fire_ts)
+            _observe_loop("timer", started)
         except Exception as e:
-            print(f"[alert] monitor error: {e}")
-        time.sleep(interval_seconds)
+            _observe_loop("timer", started, e)
+            print(f"[alert] scheduler error: {e}")
+            WORKER_STOP.wait(5)
 
 
-def _daily_report_loop() -> None:
-    while True:
-        try:
-            config = _load_yaml(CONFIG_PATH)
-            telegram_cfg = config.get("telegram", {})
-            if not telegram_cfg.get("enabled"):
-                time.sleep(30)
-                continue
-            daily_time = telegram_cfg.get("daily_report_time")
-            bot_token = telegram_cfg.get("bot_token", "")
-            chat_id = telegram_cfg.get("chat_id", "")
-            if not daily_time or not bot_token or not chat_id:
-                time.sleep(30)
-                continue
-            now = _now_local()
-            current_time = now.strftime("%H:%M")
-            current_date = now.strftime("%Y-%m-%d")
-            if current_time == daily_time and SCHEDULE_STATE.get("last_daily_report") != current_date:
-                client = HetznerClient(config["hetzner"]["api_token"])
-                report = _build_daily_report(config, client)
-                _send_telegram_markdown(bot_token, chat_id, report)
-                SCHEDULE_STATE["last_daily_report"] = current_date
-        except Exception as e:
-            print(f"[alert] daily report error: {e}")
-        time.sleep(30)
+def _timer_next_runs() -> Dict[str, Dict[str, Any]]:
+    with TIMER_LOCK:
+        return {key: dict(entry) for key, entry in TIMER_TASKS.items()}
 
 
-def _snapshot_loop() -> None:
-    while True:
-        try:
-            config = _load_yaml(CONFIG_PATH)
+def _poll_bounds(traffic_cfg: Dict[str, Any], interval_seconds: int) -> tuple:
+    min_s = _parse_float_or_default(traffic_cfg.get("poll_min_seconds"), POLL_MIN_SECONDS)
+    max_s = _parse_float_or_default(traffic_cfg.get("poll_max_seconds"), max(POLL_MAX_SECONDS, interval_seconds))
+    min_s = max(30.0, min_s)
+    return min_s, max(min_s, max_s)
+
+
+def _update_poll_rate(poll: Dict[str, Any], outgoing: float, now: float) -> None:
+    last = poll.get("last_sample")
+    poll["last_sample"] = (now, outgoing)
+    if not last:
+        return
+    elapsed = now - last[0]
+    if outgoing < last[1]:
+        poll["rate"] = None  # counter reset (new billing period or rebuilt server)
+        return
+    if elapsed <= 0:
+        return
+    sample = (outgoing - last[1]) / elapsed
+    rate = poll.get("rate")
+    poll["rate"] = sample if rate is None else POLL_RATE_SMOOTHING * sample + (1 - POLL_RATE_SMOOTHING) * rate
+
+
+def _plan_next_poll(
+    poll: Dict[str, Any],
+    outgoing: float,
+    limit_bytes: float,
+    levels: List[int],
+    base_seconds: float,
+    bounds: tuple,
+    now: float,
+) -> float:
+    """Schedule the next check before the projected crossing of the next alert level or the limit."""
+    min_s, max_s = bounds
+    targets = [limit_bytes * level / 100 for level in levels if limit_bytes * level / 100 > outgoing]
+    if limit_bytes > outgoing:
+        targets.append(limit_bytes)
+    rate = poll.get("rate")
+    if not targets or rate is None:
+        delay = base_seconds
+    elif rate <= 0:
+        delay = max_s
+    else:
+        delay = (min(targets) - outgoing) / rate * POLL_SAFETY_FACTOR
+    delay = min(max_s, max(min_s, delay))
+    poll["next_check"] = now + delay
+    poll["delay"] = delay
+    return delay
+
+
+def _snapshot_bucket_key(now: datetime, interval_minutes: Any) -> str:
+    interval = max(1, min(60, int(interval_minutes)))
+    bucket_minute = (now.minute // interval) * interval
+    bucket_time = now.replace(minute=bucket_minute, second=0, microsecond=0)
+    return bucket_time.strftime("%Y-%m-%d %H:00") if interval >= 60 else bucket_time.strftime("%Y-%m-%d %H:%M")
+
+
+def _snapshot_interval_minutes(config: Dict[str, Any]) -> int:
+    check_interval = (config.get("traffic") or {}).get("check_interval", 5)
+    return max(SNAPSHOT_MIN_MINUTES, min(60, int(check_interval)))
+
+
+def _subscribe_fleet(name: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+    FLEET_SUBSCRIBERS.append((name, callback))
+
+
+def _request_fleet_refresh() -> None:
+    MONITOR_STATE["refresh_requested"] = True
+    FLEET_REFRESH.set()
+
+
+def _publish_fleet_event(event: Dict[str, Any]) -> None:
+    """Hand one poll result to every subscriber, in the poller thread, in registration order."""
+    with FLEET_BUS:
+        FLEET_STATE["version"] = int(FLEET_STATE.get("version") or 0) + 1
+        FLEET_STATE["refreshed"] = list(event["refreshed"])
+        if event["full"]:
+            FLEET_STATE["full_at"] = time.time()
+        event["version"] = FLEET_STATE["version"]
+        FLEET_BUS.notify_all()
+    _publish_fleet_state()
+    _notify_fleet_listeners()
+    for name, callback in FLEET_SUBSCRIBERS:
+        started = time.monotonic()
+        try:
+            callback(event)
+            _observe_loop(name, started)
+        except Exception as e:
+            _observe_loop(name, started, e)
+            print(f"[alert] {name} error: {e}")
+
+
+def _fleet_traffic_snapshot(servers: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        sid: {
+            "name": entry.get("name") or sid,
+            "outbound_bytes": entry.get("outbound_bytes"),
+            "inbound_bytes": entry.get("inbound_bytes"),
+        }
+        for sid, entry in servers.items()
+    }
+
+
+def _latest_fleet_traffic(client: "HetznerClient", max_age: float = 300, timeout: float = 30) -> Dict[str, Any]:
+    """Traffic for every server from the shared poller; falls back to a direct fetch when it is not running."""
+    if MONITOR_STATE["running"]:
+        full_at = FLEET_STATE.get("full_at")
+        if not full_at or time.time() - full_at > max_age:
+            with FLEET_BUS:
+                version = FLEET_STATE["version"]
+            _request_fleet_refresh()
+            deadline = time.monotonic() + timeout
+            with FLEET_BUS:
+                while FLEET_STATE["version"] == version or MONITOR_STATE["refresh_requested"]:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    FLEET_BUS.wait(remaining)
+        full_at = FLEET_STATE.get("full_at")
+        if full_at and time.time() - full_at <= max_age + timeout:
+            return _fleet_traffic_snapshot(dict(FLEET_STATE["servers"]))
+    return _collect_traffic_snapshot(client)
+
+
+def _fleet_poll_loop() -> None:
+    """The only place that polls fleet traffic; consumers subscribe via _subscribe_fleet."""
+    MONITOR_STATE["running"] = True
+    while not WORKER_STOP.is_set():
+        started = time.monotonic()
+        sleep_seconds = 60.0
+        try:
+            config = _load_yaml(CONFIG_PATH)
+            traffic_cfg = config.get("traffic", {}) or {}
             token = (config.get("hetzner") or {}).get("api_token", "")
             if not token:
-                time.sleep(60)
+                _observe_loop("fleet_poll", started, RuntimeError("hetzner.api_token is not set"))
+                FLEET_REFRESH.wait(60)
+                if not WORKER_STOP.is_set():
+                    FLEET_REFRESH.clear()
                 continue
+            check_interval = traffic_cfg.get("check_interval", 5)
+            interval_seconds = max(30, int(check_interval) * 60)
+            limit_bytes = _traffic_limit_bytes(config)
+            levels = _parse_alert_levels((config.get("telegram") or {}).get("notify_levels"))
+            bounds = _poll_bounds(traffic_cfg, interval_seconds)
             client = HetznerClient(token)
-            state = _load_report_state()
-            interval_minutes = (config.get("traffic") or {}).get("check_interval", 5)
-            now = _now_local()
-            _record_hourly_snapshot(state, now, client, interval_minutes)
-            hourly = state.get("hourly", {})
-            if len(hourly) == 1:
-                interval = max(1, min(60, int(interval_minutes)))
-                bucket_minute = (now.minute // interval) * interval
-                bucket_time = now.replace(minute=bucket_minute, second=0, microsecond=0)
-                curr_key = (
-                    bucket_time.strftime("%Y-%m-%d %H:00")
-                    if interval >= 60
-                    else bucket_time.strftime("%Y-%m-%d %H:%M")
+
+            now_local = _now_local()
+            bucket_key = _snapshot_bucket_key(now_local, _snapshot_interval_minutes(config))
+            # A forced refresh re-polls everyone; a new snapshot bucket is built from the cached
+            # FLEET_STATE entries, so only servers whose adaptive interval is up are polled.
+            full = MONITOR_STATE["refresh_requested"]
+            new_bucket = bucket_key != MONITOR_STATE["last_bucket"]
+            now = time.monotonic()
+            if full or not MONITOR_STATE["servers"] or now - MONITOR_STATE["servers_at"] >= interval_seconds:
+                MONITOR_STATE["servers"] = client.get_servers()
+                MONITOR_STATE["servers_at"] = now
+                known = {str(s["id"]) for s in MONITOR_STATE["servers"]}
+                for sid in list(POLL_STATE):
+                    if sid not in known:
+                        POLL_STATE.pop(sid, None)
+                for sid in list(FLEET_STATE["servers"]):
+                    if sid not in known:
+                        FLEET_STATE["servers"].pop(sid, None)
+
+            refreshed: List[str] = []
+            for s in MONITOR_STATE["servers"]:
+                sid = str(s["id"])
+                poll = POLL_STATE.setdefault(sid, {"next_check": 0.0, "rate": None})
+                now = time.monotonic()
+                if not full and now < poll["next_check"]:
+                    continue
+                detail = client.get_server(s["id"]) or {}
+                outgoing = detail.get("outgoing_traffic")
+                delay: Optional[float] = None
+                if outgoing is None:
+                    poll["next_check"] = now + interval_seconds
+                else:
+                    _update_poll_rate(poll, float(outgoing), now)
+                    if limit_bytes:
+                        delay = _plan_next_poll(
+                            poll, float(outgoing), limit_bytes, levels, interval_seconds, bounds, now
+                        )
+                    else:
+                        poll["next_check"] = now + interval_seconds
+                _update_fleet_server(
+                    sid,
+                    detail.get("name") or s.get("name") or sid,
+                    outgoing,
+                    detail.get("ingoing_traffic"),
+                    limit_bytes,
+                    rate=poll.get("rate"),
+                    poll_seconds=delay,
+                    status=detail.get("status") or s.get("status"),
+                    ipv4=_server_ipv4(detail) or _server_ipv4(s),
+                    server_type=(s.get("server_type") or {}).get("name"),
+                    location=((s.get("datacenter") or {}).get("location") or {}).get("name"),
                 )
-                prev_time = bucket_time - timedelta(minutes=interval)
-                prev_key = (
-                    prev_time.strftime("%Y-%m-%d %H:00")
-                    if interval >= 60
-                    else prev_time.strftime("%Y-%m-%d %H:%M")
+                refreshed.append(sid)
+
+            if full:
+                MONITOR_STATE["refresh_requested"] = False
+            MONITOR_STATE["last_bucket"] = bucket_key
+            if refreshed or full or new_bucket:
+                _publish_fleet_event(
+                    {
+                        "config": config,
+                        "client": client,
+                        "servers": dict(FLEET_STATE["servers"]),
+                        "refreshed": refreshed,
+                        "full": full,
+                        "bucket": bucket_key if new_bucket else None,
+                        "taken_at": now_local,
+                    }
                 )
-                if curr_key in hourly and prev_key not in hourly:
-                    hourly[prev_key] = hourly[curr_key]
-                    state["hourly"] = hourly
-            _save_report_state(state)
+
+            # Wake for the earliest due server, the next snapshot bucket, or the list refresh.
+            bucket_minutes = _snapshot_interval_minutes(config)
+            next_bucket = now_local.replace(second=0, microsecond=0) + timedelta(
+                minutes=bucket_minutes - now_local.minute % bucket_minutes
+            )
+            sleep_seconds = min(interval_seconds, (next_bucket - _now_local()).total_seconds() + 1)
+            due = [poll["next_check"] for poll in POLL_STATE.values()]
+            if due:
+                sleep_seconds = min(sleep_seconds, min(due) - time.monotonic())
+            sleep_seconds = max(5.0, sleep_seconds)
+            _observe_loop("fleet_poll", started)
         except Exception as e:
-            print(f"[alert] snapshot error: {e}")
-        time.sleep(300)
+            _observe_loop("fleet_poll", started, e)
+            print(f"[alert] fleet poll error: {e}")
+        FLEET_REFRESH.wait(sleep_seconds)
+        if not WORKER_STOP.is_set():
+            FLEET_REFRESH.clear()
+    MONITOR_STATE["running"] = False
+
+
+def _threshold_alert_done(sid: str, server_name: str, level: int, percent: float, delivered: bool) -> None:
+    """Outbox callback: only a delivered alert advances (and persists) last_level."""
+    state = ALERT_STATE.get(sid)
+    if state is None:
+        return
+    if delivered:
+        if level > int(state.get("last_level") or 0):
+            state["last_level"] = level
+            _persist_threshold_from_alert_state()
+        print(f"[alert] telegram notify sent: server={server_name} percent={percent:.2f} level={level}")
+        return
+    # Re-arm: the next poll sends this level again.
+    if int(state.get("pending_level") or 0) >= level:
+        state["pending_level"] = None
+    print(f"[alert] telegram notify dropped, will retry: server={server_name} level={level}")
+
+
+def _evaluate_fleet_thresholds(event: Dict[str, Any]) -> None:
+    config = event["config"]
+    client = event["client"]
+    traffic_cfg = config.get("traffic", {}) or {}
+    telegram_cfg = config.get("telegram", {}) or {}
+    enabled = bool(telegram_cfg.get("enabled"))
+    bot_token = telegram_cfg.get("bot_token", "")
+    chat_id = telegram_cfg.get("chat_id", "")
+    exceed_action = traffic_cfg.get("exceed_action", "")
+    limit_bytes = _traffic_limit_bytes(config)
+    if not limit_bytes:
+        return
+    levels = _parse_alert_levels(telegram_cfg.get("notify_levels"))
+    qb_map: Optional[Dict[str, Any]] = None
+
+    for sid in event["refreshed"]:
+        entry = event["servers"].get(sid) or {}
+        outgoing = entry.get("outbound_bytes")
+        if outgoing is None:
+            continue
+        ingoing = entry.get("inbound_bytes")
+        server_name = entry.get("name") or sid
+        server_id = int(sid) if sid.isdigit() else sid
+        percent = (float(outgoing) / limit_bytes) * 100
+        state = ALERT_STATE.setdefault(
+            sid, {"last_level": 0, "last_outgoing": None, "auto_rebuild": False}
+        )
+        last_outgoing = state.get("last_outgoing")
+        if last_outgoing is not None and float(outgoing) < float(last_outgoing):
+            state["last_level"] = 0
+            state["pending_level"] = None
+            state["auto_rebuild"] = False
+            _persist_threshold_from_alert_state()
+        state["last_outgoing"] = float(outgoing)
+
+        if (
+            traffic_cfg.get("proactive_rebuild")
+            and exceed_action in ("rebuild", "delete_rebuild")
+            and float(outgoing) < limit_bytes
+            and not state.get("auto_rebuild")
+            and not _rebuild_job_active(server_id)
+        ):
+            forecast = _server_forecast(server_name, float(outgoing), limit_bytes)
+            window = forecast.get("window") if forecast else None
+            if window:
+                local_now = _now_local().replace(tzinfo=None)
+                if window <= local_now < window + timedelta(hours=1):
+                    if enabled and bot_token and chat_id:
+                        _send_telegram_markdown(
+                            bot_token,
+                            chat_id,
+                            f"🌙 *低峰预防性重建*\n🖥 `{server_name}`\n{_format_forecast_line(forecast)}",
+                        )
+                    _submit_rebuild_job(
+                        server_id,
+                        server_name,
+                        "预测低峰重建",
+                        config=config,
+                        client=client,
+                        on_done=functools.partial(_mark_auto_rebuild, sid),
+                    )
+                    MONITOR_STATE["servers_at"] = 0.0
+                else:
+                    # Make sure the adaptive poller is awake when the window opens.
+                    poll = POLL_STATE.get(sid)
+                    until_window = (window - local_now).total_seconds()
+                    now = time.monotonic()
+                    if poll and 0 < until_window < poll["next_check"] - now:
+                        poll["next_check"] = now + until_window
+
+        reached = [level for level in levels if percent >= level]
+        if not reached:
+            continue
+        # Levels still queued in the outbox count as sent until delivery confirms or drops them.
+        last_level = max(int(state.get("last_level") or 0), int(state.get("pending_level") or 0))
+        levels_to_send = [level for level in levels if last_level < level <= percent]
+        if not levels_to_send:
+            continue
 
+        if enabled and bot_token and chat_id:
+            if qb_map is None:
+                qb_stats = _collect_qbittorrent_stats(config)
+                qb_map = _qb_instance_map(qb_stats) if qb_stats.get("enabled") else {}
+            limit_tb = (Decimal(limit_bytes) / (Decimal(1024) ** 4)).quantize(
+                Decimal("0.001"), rounding=ROUND_HALF_UP
+            )
+            qb_line = _build_qb_compare_line(server_name, outgoing, ingoing, qb_map)
+            for level in levels_to_send:
+                notify_text = _format_traffic_notification(
+                    server_name,
+                    outgoing,
+                    ingoing,
+                    limit_tb,
+                    percent,
+                    int(level),
+                    qb_line,
+                )
+                on_done = functools.partial(_threshold_alert_done, sid, server_name, int(level), percent)
+                if _send_telegram_markdown(bot_token, chat_id, notify_text, on_done=on_done):
+                    state["pending_level"] = int(level)
 
-def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClient") -> str:
+        if exceed_action in ("rebuild", "delete_rebuild") and float(outgoing) >= limit_bytes:
+            if not state.get("auto_rebuild") and not _rebuild_job_active(server_id):
+                if enabled and bot_token and chat_id:
+                    _send_telegram_markdown(
+                        bot_token, chat_id, _format_exceed_notification(server_name, percent)
+                    )
+                _submit_rebuild_job(
+                    server_id,
+                    server_name,
+                    "流量超标自动重建",
+                    config=config,
+                    client=client,
+                    on_done=functools.partial(_mark_auto_rebuild, sid),
+                )
+                MONITOR_STATE["servers_at"] = 0.0
+        elif exceed_action == "delete" and float(outgoing) >= limit_bytes:
+            if not state.get("auto_rebuild"):
+                if client.delete_server(server_id):
+                    state["auto_rebuild"] = True
+                    MONITOR_STATE["servers_at"] = 0.0
+
+
+def _record_fleet_bucket(event: Dict[str, Any]) -> None:
+    if not event["bucket"]:
+        return
+    config = event["config"]
+    interval_minutes = _snapshot_interval_minutes(config)
+    now = event["taken_at"]
+    hour_key = _snapshot_bucket_key(now, interval_minutes)
+    # qB is polled before taking the report_state lock, so rebuild stats and /report never wait on it.
+    qb_stats: Dict[str, Any] = {}
+    if hour_key not in (_load_report_state().get("hourly") or {}):
+        qb_stats = _collect_qbittorrent_stats(config)
+
+    def _apply(state: Dict[str, Any]) -> None:
+        if hour_key not in (state.get("hourly") or {}) and qb_stats.get("enabled"):
+            _record_qb_bucket(state, hour_key, qb_stats)
+        _record_hourly_snapshot(
+            state, now, event["client"], interval_minutes, snapshot=_fleet_traffic_snapshot(event["servers"])
+        )
+        hourly = state.get("hourly", {})
+        if len(hourly) == 1:
+            curr_key = _snapshot_bucket_key(now, interval_minutes)
+            prev_key = _snapshot_bucket_key(now - timedelta(minutes=interval_minutes), interval_minutes)
+            if curr_key in hourly and prev_key not in hourly:
+                hourly[prev_key] = hourly[curr_key]
+                state["hourly"] = hourly
+
+    _update_report_state(_apply)
+
+
+_subscribe_fleet("monitor", _evaluate_fleet_thresholds)
+_subscribe_fleet("snapshot", _record_fleet_bucket)
+_subscribe_fleet("pacing", _pace_qb_uploads)
+_subscribe_fleet("dns", _sync_dns_from_fleet)
+
+
+def _resolve_bot_command(text: str) -> str:
     raw = (text or "").strip()
     pending = BOT_STATE.pop("pending_cmd", None)
     if pending and raw and not raw.startswith("/"):
         text = f"{pending} {raw}"
-    cmd = _map_telegram_shortcut(text)
+    return _map_telegram_shortcut(text)
+
+
+def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClient") -> str:
+    return _run_bot_command(_resolve_bot_command(text), config, client)
+
+
+def _run_bot_command(cmd: str, config: Dict[str, Any], client: "HetznerClient") -> str:
     if not cmd:
         return "⚠️ 未知指令"
     if cmd == "__menu_root__":
@@ -2146,6 +5048,16 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
             if last_rebuild.get("time")
             else "暂无"
         )
+        limit_bytes = _traffic_limit_bytes(config)
+        fleet = _current_fleet_state().get("servers") or {}
+        forecast_lines = []
+        for s in servers:
+            name = s.get("name") or str(s.get("id"))
+            outgoing = (fleet.get(str(s.get("id"))) or {}).get("outbound_bytes")
+            view = _forecast_view(_server_forecast(name, outgoing, limit_bytes))
+            if view:
+                window = f"，低峰窗口 {view['rebuild_window']}" if view["rebuild_window"] else ""
+                forecast_lines.append(f"⏳ {name}: {view['eta']} (约 {view['hours_left']} 小时{window})")
         return (
             "📊 *系统状态概览*\n\n"
             f"🖥 服务器总数: {total} 台\n"
@@ -2159,6 +5071,7 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
             "✅ 监控系统正常运行\n\n"
             "🖥 服务器明细:\n"
             + ("\n".join(lines) if lines else "暂无服务器")
+            + ("\n\n📈 触顶预测:\n" + "\n".join(forecast_lines) if forecast_lines else "")
         )
 
     if command == "/traffic":
@@ -2249,7 +5162,7 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
         return f"📋 上次汇报时间: {last_time}" if last_time else "📋 暂无汇报记录"
 
     if command == "/reportreset":
-        _save_report_state({})
+        _update_report_state(lambda state: state.clear())
         return "♻️ 已重置汇报区间"
 
     if command == "/dnstest":
@@ -2294,24 +5207,22 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
             except Exception:
                 return "⚠️ 用法: /dnscheck <ID>"
         results = ["✅ **DNS 解析检查**"]
-        for s in servers:
-            record_cfg = record_map.get(str(s["id"])) or record_map.get(s.get("name", ""))
-            record = None
-            if isinstance(record_cfg, dict):
-                record = record_cfg.get("record") or record_cfg.get("name")
-            elif isinstance(record_cfg, str):
-                record = record_cfg
-            ip = s.get("public_net", {}).get("ipv4", {}).get("ip")
-            if not record or not ip:
+        targets = _dns_check_targets(servers, record_map)
+        checks = [t for t in targets if t["record"] and t["expected"]]
+        checked = iter(_check_dns_records_blocking(checks, cf_cfg)) if checks else iter([])
+        for target in targets:
+            s = target["server"]
+            if not target["record"] or not target["expected"]:
                 results.append(f"- `{s.get('name') or s['id']}`: 缺少记录或IP")
                 continue
-            try:
-                socket.setdefaulttimeout(5)
-                resolved = socket.gethostbyname(record)
-                ok = "✅" if resolved == ip else "❌"
-                results.append(f"- `{s.get('name')}`: {ok} {record} -> {resolved} (期望 {ip})")
-            except Exception as e:
-                results.append(f"- `{s.get('name')}`: ❌ {e}")
+            check = next(checked)
+            if check.get("resolved") is None:
+                results.append(f"- `{s.get('name')}`: ❌ {check.get('error')}")
+                continue
+            ok = "✅" if check["ok"] else "❌"
+            results.append(
+                f"- `{s.get('name')}`: {ok} {check['record']} -> {check['resolved']} (期望 {check['expected']})"
+            )
         return "\n".join(results)
 
     if command == "/startserver":
@@ -2353,25 +5264,24 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
     if command == "/rebuild":
         if not args:
             return "⚠️ 用法: /rebuild <ID>"
-        target = None
         try:
             sid = int(args[0])
-            target = client.get_server(sid)
-            if target:
-                name = target.get("name") or str(sid)
-                result = _perform_rebuild(sid, name, config, "Telegram 指令", client)
-            else:
-                return "❌ 服务器不存在"
         except Exception:
             name = " ".join(args).strip()
             servers = client.get_servers()
             match = next((s for s in servers if s.get("name") == name), None)
             if not match:
                 return "❌ 服务器不存在"
-            result = _perform_rebuild(match["id"], name, config, "Telegram 指令", client)
-        if result.get("success"):
-            return "✅ 已触发重建"
-        return f"❌ 重建失败: {result.get('error', '未知错误')}"
+            sid = int(match["id"])
+        else:
+            target = client.get_server(sid)
+            if not target:
+                return "❌ 服务器不存在"
+            name = target.get("name") or str(sid)
+        job = _submit_rebuild_job(sid, name, "Telegram 指令", config=config, client=client)
+        if job.get("deduplicated"):
+            return f"⏳ 该服务器已有重建任务: `{job['id']}` ({job['status']})"
+        return f"🚀 已加入重建队列: `{job['id']}`，完成后将推送结果"
 
     if command == "/snapshots":
         snapshots = client.get_snapshots()
@@ -2397,95 +5307,69 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
         return "❌ 创建快照失败"
 
     if command == "/createfromsnapshots":
-        telegram_cfg = config.get("telegram", {}) or {}
-        bot_token = telegram_cfg.get("bot_token", "")
-        chat_id = telegram_cfg.get("chat_id", "")
-        def _task() -> None:
-            cfg = _load_yaml(CONFIG_PATH)
-            cli = HetznerClient(cfg["hetzner"]["api_token"])
-            _create_from_snapshot_map(cfg, cli)
-            _save_yaml(CONFIG_PATH, cfg)
-            if telegram_cfg.get("enabled") and bot_token and chat_id:
-                _send_telegram_markdown(bot_token, chat_id, "✅ 已根据快照配置创建服务器")
-        threading.Thread(target=_task, daemon=True).start()
-        return "🚀 已开始根据快照创建服务器，请稍候查看结果"
+        # Runs in the serial bot job, so the "working" message is edited with the outcome.
+        cfg = _load_yaml(CONFIG_PATH)
+        if not ((cfg.get("rebuild") or {}).get("snapshot_id_map") or {}):
+            return "📦 未配置快照映射"
+        created = _create_from_snapshot_map(cfg, HetznerClient(cfg["hetzner"]["api_token"]))
+        if not created:
+            return "❌ 未创建任何服务器"
+        lines = ["✅ 已根据快照配置创建服务器"]
+        lines.extend(f"- `{old_id}` → `{new_id}`" for old_id, new_id in created)
+        return "\n".join(lines)
 
     if command == "/createfromsnapshot":
         if not args:
             return "⚠️ 用法: /createfromsnapshot <ID>"
         target_id = args[0]
-        rebuild_cfg = config.get("rebuild", {}) or {}
-        snapshot_map = rebuild_cfg.get("snapshot_id_map", {}) or {}
-        snapshot_id = snapshot_map.get(str(target_id))
-        if not snapshot_id:
+        cfg = _load_yaml(CONFIG_PATH)
+        rb = cfg.get("rebuild", {}) or {}
+        snap_id = (rb.get("snapshot_id_map", {}) or {}).get(str(target_id))
+        if not snap_id:
             return "❌ 未找到该ID对应的快照"
+        if _rebuild_job_active(target_id):
+            return "⏳ 该服务器已有重建任务，请稍后再试"
+        cli = HetznerClient(cfg["hetzner"]["api_token"])
+        template = rb.get("fallback_template", {}) or {}
+        cf_cfg = cfg.get("cloudflare", {}) or {}
+        record_cfg = (cf_cfg.get("record_map", {}) or {}).get(str(target_id))
+        record = None
+        if isinstance(record_cfg, dict):
+            record = record_cfg.get("record") or record_cfg.get("name")
+        elif isinstance(record_cfg, str):
+            record = record_cfg
+        name = record.split(".", 1)[0] if record else f"auto-{target_id}"
 
-        telegram_cfg = config.get("telegram", {}) or {}
-        bot_token = telegram_cfg.get("bot_token", "")
-        chat_id = telegram_cfg.get("chat_id", "")
-
-        def _task() -> None:
-            cfg = _load_yaml(CONFIG_PATH)
-            cli = HetznerClient(cfg["hetzner"]["api_token"])
-            rb = cfg.get("rebuild", {}) or {}
-            snap_map = rb.get("snapshot_id_map", {}) or {}
-            snap_id = snap_map.get(str(target_id))
-            if not snap_id:
-                if telegram_cfg.get("enabled") and bot_token and chat_id:
-                    _send_telegram_markdown(bot_token, chat_id, "❌ 未找到该ID对应的快照")
-                return
-            template = rb.get("fallback_template", {}) or {}
-            server_type = template.get("server_type")
-            location = template.get("location")
-            ssh_keys = template.get("ssh_keys") or []
-            cf_cfg = cfg.get("cloudflare", {}) or {}
-            record_cfg = (cf_cfg.get("record_map", {}) or {}).get(str(target_id))
-            record = None
-            if isinstance(record_cfg, dict):
-                record = record_cfg.get("record") or record_cfg.get("name")
-            elif isinstance(record_cfg, str):
-                record = record_cfg
-            name = record.split(".", 1)[0] if record else f"auto-{target_id}"
-
-            created = cli.create_server_from_snapshot(
-                name=name,
-                server_type=server_type,
-                location=location,
-                snapshot_id=int(snap_id),
-                ssh_keys=ssh_keys,
-            )
-            if not created:
-                if telegram_cfg.get("enabled") and bot_token and chat_id:
-                    _send_telegram_markdown(bot_token, chat_id, "❌ 创建服务器失败")
-                return
-            new_id = str(created.get("id"))
-            new_ip = (created.get("public_net") or {}).get("ipv4", {}).get("ip")
-            if new_id:
-                _update_config_mapping(cfg, str(target_id), new_id)
-                _save_yaml(CONFIG_PATH, cfg)
-                resolved = _resolve_cf_record(record_cfg, cf_cfg.get("zone_id", ""), cf_cfg.get("api_token", ""))
-                if resolved and new_ip:
-                    cli.update_cloudflare_a_record(
-                        resolved["api_token"], resolved["zone_id"], resolved["record"], new_ip
-                    )
-            if telegram_cfg.get("enabled") and bot_token and chat_id:
-                _send_telegram_markdown(bot_token, chat_id, f"✅ 已创建服务器: {new_id}")
-
-        threading.Thread(target=_task, daemon=True).start()
-        return "🚀 已开始创建服务器，请稍候查看结果"
+        created = cli.create_server_from_snapshot(
+            name=name,
+            server_type=template.get("server_type"),
+            location=template.get("location"),
+            snapshot_id=int(snap_id),
+            ssh_keys=template.get("ssh_keys") or [],
+        )
+        if not created:
+            return "❌ 创建服务器失败"
+        new_id = str(created.get("id"))
+        new_ip = (created.get("public_net") or {}).get("ipv4", {}).get("ip")
+        if new_id:
+            _update_config(lambda fresh: _update_config_mapping(fresh, str(target_id), new_id))
+            resolved = _resolve_cf_record(record_cfg, cf_cfg.get("zone_id", ""), cf_cfg.get("api_token", ""))
+            if resolved and new_ip:
+                cli.update_cloudflare_a_record(resolved["api_token"], resolved["zone_id"], resolved["record"], new_ip)
+        return f"✅ 已创建服务器: {new_id}"
 
     if command == "/scheduleon":
-        scheduler_cfg = config.get("scheduler", {}) or {}
-        scheduler_cfg["enabled"] = True
-        config["scheduler"] = scheduler_cfg
-        _save_yaml(CONFIG_PATH, config)
+        config = _update_config(
+            lambda fresh: fresh.update(scheduler={**(fresh.get("scheduler") or {}), "enabled": True})
+        )
+        _sync_timer_tasks(config)
         return "✅ 定时任务已开启"
 
     if command == "/scheduleoff":
-        scheduler_cfg = config.get("scheduler", {}) or {}
-        scheduler_cfg["enabled"] = False
-        config["scheduler"] = scheduler_cfg
-        _save_yaml(CONFIG_PATH, config)
+        config = _update_config(
+            lambda fresh: fresh.update(scheduler={**(fresh.get("scheduler") or {}), "enabled": False})
+        )
+        _sync_timer_tasks(config)
         return "⏸️ 定时任务已关闭"
 
     if command == "/schedulestatus":
@@ -2496,6 +5380,8 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
             return f"📋 定时状态: {'开启' if enabled else '关闭'}\n无任务"
         lines = [f"📋 定时状态: {'开启' if enabled else '关闭'}"]
         now = _now_local()
+        tz = _schedule_timezone(config)
+        timers = _timer_next_runs()
         for task in tasks:
             action = task.get("action")
             times = task.get("times") or []
@@ -2503,15 +5389,15 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
                 times = [times]
             next_times = []
             for t in times:
-                try:
-                    hh, mm = t.split(":", 1)
-                    target = now.replace(hour=int(hh), minute=int(mm), second=0, microsecond=0)
-                    if target <= now:
-                        target = target + timedelta(days=1)
-                    next_times.append(target.strftime("%m-%d %H:%M"))
-                except Exception:
-                    next_times.append(t)
+                entry = timers.get(f"{action}@{t}")
+                target = entry["next_run"] if entry else _next_fire_time(t, now, tz)
+                next_times.append(target.strftime("%m-%d %H:%M") if target else t)
             lines.append(f"- {action}: {', '.join(next_times)}")
+        daily = next((entry for entry in timers.values() if entry["kind"] == "daily_report"), None)
+        if daily:
+            lines.append(f"- daily_report: {daily['next_run'].strftime('%m-%d %H:%M')}")
+        if tz:
+            lines.append(f"时区: {tz.key}")
         return "\n".join(lines)
 
     if command == "/scheduleset":
@@ -2531,16 +5417,18 @@ def _handle_bot_command(text: str, config: Dict[str, Any], client: "HetznerClien
             tasks.append({"action": "delete_all", "times": delete_times})
         if create_times:
             tasks.append({"action": "create_from_snapshots", "times": create_times})
-        scheduler_cfg = config.get("scheduler", {}) or {}
-        scheduler_cfg["enabled"] = True
-        scheduler_cfg["tasks"] = tasks
-        config["scheduler"] = scheduler_cfg
-        _save_yaml(CONFIG_PATH, config)
+        config = _update_config(
+            lambda fresh: fresh.update(scheduler={**(fresh.get("scheduler") or {}), "enabled": True, "tasks": tasks})
+        )
+        _sync_timer_tasks(config)
         return "✅ 定时任务已更新"
 
     if command == "/dnsync":
-        result = _sync_cloudflare_records(config, client)
-        return f"✅ DNS 同步完成，更新 {result['updated']} 项，跳过 {result['skipped']} 项"
+        result = _sync_cloudflare_records(config, client, force=True)
+        return (
+            f"✅ DNS 同步完成，更新 {result['updated']} 项，"
+            f"未变化 {result['unchanged']} 项，跳过 {result['skipped']} 项"
+        )
 
     return "⚠️ 未知指令"
 
@@ -2590,209 +5478,354 @@ def _handle_bot_callback(
     return "⚠️ 未知指令", BOT_STATE.get("menu_state") or "root"
 
 
+def _invalidate_bot_cache(server_id: Optional[Any] = None) -> None:
+    """Drop cached replies touching a server (fleet-wide replies always include it); None drops all."""
+    target = None if server_id is None else str(server_id)
+    with BOT_RESPONSE_CACHE_LOCK:
+        for key in list(BOT_RESPONSE_CACHE):
+            args = key[1]
+            if target is None or not args or args[0] == target:
+                BOT_RESPONSE_CACHE.pop(key, None)
+
+
+def _bot_cache_footer(taken_at: float, now: float) -> str:
+    stamp = datetime.fromtimestamp(taken_at).astimezone().strftime("%H:%M:%S")
+    age = int(now - taken_at)
+    if age < 1:
+        return f"\n\n🕒 数据时间: {stamp}"
+    return f"\n\n🕒 数据时间: {stamp}（{age} 秒前，缓存）"
+
+
+def _run_cached_bot_command(cmd: str, config: Dict[str, Any], client: "HetznerClient") -> str:
+    parts = cmd.split()
+    command = parts[0].split("@")[0] if parts else ""
+    args = tuple(parts[1:])
+    ttl = _parse_float_or_default(
+        (config.get("telegram") or {}).get("command_cache_seconds"), BOT_CACHE_TTL_SECONDS
+    )
+    if command not in BOT_CACHEABLE_COMMANDS or ttl <= 0:
+        reply = _run_bot_command(cmd, config, client)
+        if command in BOT_WRITE_COMMANDS:
+            serial_key = _bot_serial_key(command, list(args)) or "fleet"
+            _invalidate_bot_cache(serial_key.split(":", 1)[1] if serial_key.startswith("server:") else None)
+        return reply
+    key = (command, args, _current_fleet_state().get("version"))
+    now = time.time()
+    with BOT_RESPONSE_CACHE_LOCK:
+        entry = BOT_RESPONSE_CACHE.get(key)
+    if entry and now - entry["at"] <= ttl:
+        _cache_lookup("bot_command", True)
+        return entry["reply"] + _bot_cache_footer(entry["at"], now)
+    _cache_lookup("bot_command", False)
+    reply = _run_bot_command(cmd, config, client)
+    with BOT_RESPONSE_CACHE_LOCK:
+        for stale in [k for k, v in BOT_RESPONSE_CACHE.items() if now - v["at"] > ttl or k[:2] == key[:2]]:
+            BOT_RESPONSE_CACHE.pop(stale, None)
+        BOT_RESPONSE_CACHE[key] = {"reply": reply, "at": now}
+    return reply + _bot_cache_footer(now, now)
+
+
+def _bot_serial_key(command: str, args: List[str]) -> Optional[str]:
+    if command not in BOT_WRITE_COMMANDS:
+        return None
+    if command in ("/createfromsnapshots", "/dnsync", "/scheduleon", "/scheduleoff", "/scheduleset", "/reportreset"):
+        return "fleet"
+    if not args:
+        return "fleet"
+    # Key on the server id whether the command names it by id ("0123" too) or by name (/rebuild).
+    try:
+        return f"server:{int(args[0])}"
+    except ValueError:
+        pass
+    name = " ".join(args).strip()
+    for sid, entry in (_current_fleet_state().get("servers") or {}).items():
+        if entry.get("name") == name:
+            return f"server:{sid}"
+    return "fleet"
+
+
+def _bot_keys_conflict(key: str, other: str) -> bool:
+    return key == other or "fleet" in (key, other)
+
+
+def _take_ready_bot_jobs() -> List[tuple]:
+    """Caller holds BOT_SERIAL_LOCK. Start every pending job that conflicts with nothing running or ahead of it."""
+    blocking = list(BOT_SERIAL_RUNNING)
+    ready: List[tuple] = []
+    waiting: deque = deque()
+    for key, job in BOT_SERIAL_PENDING:
+        if any(_bot_keys_conflict(key, other) for other in blocking):
+            waiting.append((key, job))
+        else:
+            ready.append((key, job))
+            BOT_SERIAL_RUNNING.add(key)
+        blocking.append(key)
+    BOT_SERIAL_PENDING.clear()
+    BOT_SERIAL_PENDING.extend(waiting)
+    return ready
+
+
+def _run_serial_bot_job(key: str, job: Callable[[], None]) -> None:
+    """Run one write job, then start whatever it was holding back; no pool thread waits on a queue."""
+    try:
+        job()
+    finally:
+        with BOT_SERIAL_LOCK:
+            BOT_SERIAL_RUNNING.discard(key)
+            ready = _take_ready_bot_jobs()
+        for ready_key, ready_job in ready:
+            _submit_tracked(BOT_EXECUTOR, _run_serial_bot_job, ready_key, ready_job)
+
+
+def _dispatch_bot_job(serial_key: Optional[str], job: Callable[[], None]) -> None:
+    """Run read-only jobs in parallel; write jobs run in order per key, and "fleet" jobs exclude every key."""
+    if serial_key is None:
+        _submit_tracked(BOT_EXECUTOR, job)
+        return
+    with BOT_SERIAL_LOCK:
+        BOT_SERIAL_PENDING.append((serial_key, job))
+        ready = _take_ready_bot_jobs()
+    for ready_key, ready_job in ready:
+        _submit_tracked(BOT_EXECUTOR, _run_serial_bot_job, ready_key, ready_job)
+
+
+def _send_bot_reply(
+    bot_token: str,
+    chat_id: str,
+    reply: str,
+    menu_state: str,
+    edit_of: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Safe from pool threads: the menu state is captured by the dispatcher, not read from BOT_STATE."""
+    _send_telegram_markdown(
+        bot_token,
+        chat_id,
+        _maybe_wrap_codeblock(reply),
+        reply_markup=_telegram_inline_keyboard(menu_state),
+        edit_of=edit_of,
+    )
+
+
+def _ensure_reply_keyboard(bot_token: str, chat_id: str) -> None:
+    """Dispatcher thread only, like every other BOT_STATE write."""
+    if not BOT_STATE.get("reply_keyboard_enabled"):
+        _send_telegram_message(
+            bot_token,
+            chat_id,
+            " ",
+            reply_markup=_telegram_reply_keyboard_root(),
+        )
+        BOT_STATE["reply_keyboard_enabled"] = True
+
+
+def _dispatch_bot_command(text: str, config: Dict[str, Any], bot_token: str, chat_id: str) -> None:
+    cmd = _resolve_bot_command(text)
+    parts = cmd.split()
+    command = parts[0].split("@")[0] if parts else ""
+    client = HetznerClient((config.get("hetzner") or {}).get("api_token", ""))
+    if not command.startswith("/") or command in BOT_INLINE_COMMANDS:
+        reply = _run_bot_command(cmd, config, client)
+        _send_bot_reply(bot_token, chat_id, reply, BOT_STATE.get("menu_state") or "root")
+        _ensure_reply_keyboard(bot_token, chat_id)
+        return
+    ack = _send_telegram_placeholder(bot_token, chat_id, BOT_ACK_TEXT)
+    menu_state = BOT_STATE.get("menu_state") or "root"
+    _ensure_reply_keyboard(bot_token, chat_id)
+
+    def _job() -> None:
+        started = time.monotonic()
+        try:
+            reply = _run_cached_bot_command(cmd, config, client)
+            _observe_loop("bot_command", started)
+        except Exception as e:
+            _observe_loop("bot_command", started, e)
+            print(f"[alert] telegram command {command} failed: {e}")
+            reply = f"❌ 指令执行失败: {_redact_error(e)}"
+        _send_bot_reply(bot_token, chat_id, reply, menu_state, edit_of=ack)
+
+    _dispatch_bot_job(_bot_serial_key(command, parts[1:]), _job)
+
+
+def _dispatch_telegram_update(update: Dict[str, Any], config: Dict[str, Any], bot_token: str, chat_id: str) -> None:
+    """Handle one update: menu actions inline, commands acknowledged and dispatched to the bot pool."""
+    callback = update.get("callback_query") or {}
+    if callback:
+        message = callback.get("message") or {}
+        chat_id_cb = str(message.get("chat", {}).get("id", "")).strip()
+        if not chat_id_cb or chat_id_cb != chat_id:
+            return
+        _answer_telegram_callback(bot_token, callback.get("id"))
+        data_value = callback.get("data") or ""
+        if data_value.startswith("cmd:"):
+            _dispatch_bot_command(data_value.split(":", 1)[1], config, bot_token, chat_id)
+            return
+        client = HetznerClient((config.get("hetzner") or {}).get("api_token", ""))
+        reply, menu_state = _handle_bot_callback(data_value, config, client)
+        _send_bot_reply(bot_token, chat_id, reply, menu_state or BOT_STATE.get("menu_state") or "root")
+        _ensure_reply_keyboard(bot_token, chat_id)
+        return
+    message = update.get("message") or {}
+    if not message:
+        return
+    if str(message.get("chat", {}).get("id")) != chat_id:
+        return
+    text = message.get("text", "")
+    if not text:
+        return
+    message_id = message.get("message_id")
+    if message_id is not None:
+        if message_id == BOT_STATE.get("last_message_id") and text == BOT_STATE.get("last_message_text"):
+            return
+        BOT_STATE["last_message_id"] = message_id
+        BOT_STATE["last_message_text"] = text
+    _dispatch_bot_command(text, config, bot_token, chat_id)
+
+
+def _accept_telegram_update(update: Dict[str, Any], config: Dict[str, Any], bot_token: str, chat_id: str) -> bool:
+    """Dispatch an update once; redeliveries (update_id below the offset) are ignored."""
+    with BOT_UPDATE_LOCK:
+        update_id = update.get("update_id")
+        if update_id is not None:
+            if update_id < BOT_STATE.get("update_offset", 0):
+                return False
+            BOT_STATE["update_offset"] = update_id + 1
+        _dispatch_telegram_update(update, config, bot_token, chat_id)
+        return True
+
+
+def _forward_telegram_update(update: Dict[str, Any]) -> None:
+    with _TelegramInboxFile() as updates:
+        updates.append(update)
+        if len(updates) > TELEGRAM_INBOX_MAX:
+            print(f"[alert] telegram inbox full, dropping {len(updates) - TELEGRAM_INBOX_MAX} oldest update(s)")
+            del updates[: len(updates) - TELEGRAM_INBOX_MAX]
+
+
+def _drain_telegram_inbox(config: Dict[str, Any], bot_token: str, chat_id: str) -> int:
+    """Leader only: dispatch updates that follower workers received, oldest first."""
+    try:
+        # Cheap check before taking the flock: a drained inbox is just {"updates": []}.
+        if os.path.getsize(TELEGRAM_INBOX_PATH) <= len(json.dumps({"updates": []})):
+            return 0
+    except OSError:
+        return 0
+    with _TelegramInboxFile() as updates:
+        pending = [update for update in updates if isinstance(update, dict)]
+        updates.clear()
+    for update in sorted(pending, key=lambda u: u.get("update_id") or 0):
+        _accept_telegram_update(update, config, bot_token, chat_id)
+    return len(pending)
+
+
+def _telegram_webhook_target(telegram_cfg: Dict[str, Any]) -> Optional[str]:
+    if str(telegram_cfg.get("mode") or "polling").lower() != "webhook":
+        return None
+    base = str(telegram_cfg.get("webhook_url") or "").rstrip("/")
+    secret = str(telegram_cfg.get("webhook_secret") or "")
+    if not base or not secret:
+        return None
+    return f"{base}/telegram/webhook/{secret}"
+
+
+def _apply_telegram_mode(telegram_cfg: Dict[str, Any], bot_token: str) -> Optional[str]:
+    """Register or remove the webhook when the configured mode changes; returns the webhook URL in webhook mode."""
+    target = _telegram_webhook_target(telegram_cfg)
+    applied = (bot_token, target)
+    if TELEGRAM_WEBHOOK_STATE["applied"] == applied:
+        return target
+    if not target and str(telegram_cfg.get("mode") or "").lower() == "webhook":
+        print("[alert] telegram webhook mode needs webhook_url and webhook_secret; using polling")
+    base = f"https://api.telegram.org/bot{bot_token}"
+    started = time.monotonic()
+    if target:
+        method = "setWebhook"
+        payload: Dict[str, Any] = {
+            "url": target,
+            "secret_token": str(telegram_cfg.get("webhook_secret")),
+            "allowed_updates": TELEGRAM_ALLOWED_UPDATES,
+        }
+    else:
+        # getUpdates is refused while a webhook is set, so always clear it before polling.
+        method = "deleteWebhook"
+        payload = {}
+    resp = requests.post(f"{base}/{method}", json=payload, timeout=15)
+    _observe_upstream("telegram", method, started, resp.ok)
+    resp.raise_for_status()
+    with BOT_UPDATE_LOCK:
+        # update_id sequences may restart after a quiet week; never carry a stale floor across modes.
+        BOT_STATE["update_offset"] = 0
+    TELEGRAM_WEBHOOK_STATE["applied"] = applied
+    print(f"[info] telegram updates via {'webhook' if target else 'polling'}")
+    return target
+
+
 def _telegram_bot_loop() -> None:
-    while True:
+    while not WORKER_STOP.is_set():
+        started = time.monotonic()
         try:
             config = _load_yaml(CONFIG_PATH)
             telegram_cfg = config.get("telegram", {})
             if not telegram_cfg.get("enabled"):
-                time.sleep(10)
+                _observe_loop("telegram_bot", started)
+                WORKER_STOP.wait(10)
                 continue
             bot_token = telegram_cfg.get("bot_token", "")
             chat_id = str(telegram_cfg.get("chat_id", "")).strip()
             if not bot_token or not chat_id:
-                time.sleep(10)
+                _observe_loop("telegram_bot", started, RuntimeError("telegram bot_token/chat_id is not set"))
+                WORKER_STOP.wait(10)
+                continue
+            if _apply_telegram_mode(telegram_cfg, bot_token):
+                # Webhook mode: updates arrive at /telegram/webhook/{secret}. Dispatch the ones follower
+                # workers queued for us, and re-check the mode every 10 s.
+                _drain_telegram_inbox(config, bot_token, chat_id)
+                _observe_loop("telegram_bot", started)
+                until = time.monotonic() + 10
+                while not WORKER_STOP.wait(TELEGRAM_INBOX_POLL_SECONDS) and time.monotonic() < until:
+                    _drain_telegram_inbox(config, bot_token, chat_id)
                 continue
 
             offset = BOT_STATE.get("update_offset", 0)
             url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
+            polled = time.monotonic()
             resp = requests.get(url, params={"timeout": 25, "offset": offset}, timeout=30)
+            _observe_upstream("telegram", "getUpdates", polled, resp.ok)
             resp.raise_for_status()
             data = resp.json()
             if not data.get("ok"):
-                time.sleep(10)
+                _observe_loop("telegram_bot", started, RuntimeError(data.get("description") or "getUpdates not ok"))
+                WORKER_STOP.wait(10)
                 continue
             for update in data.get("result", []):
-                update_id = update.get("update_id")
-                if update_id is not None:
-                    BOT_STATE["update_offset"] = update_id + 1
-                callback = update.get("callback_query") or {}
-                if callback:
-                    callback_id = callback.get("id")
-                    data_value = callback.get("data") or ""
-                    message = callback.get("message") or {}
-                    chat_id_cb = str(message.get("chat", {}).get("id", "")).strip()
-                    if chat_id_cb and chat_id_cb == chat_id:
-                        reply, menu_state = _handle_bot_callback(data_value, config, client)
-                        _answer_telegram_callback(bot_token, callback_id)
-                        _send_telegram_markdown(
-                            bot_token,
-                            chat_id,
-                            _maybe_wrap_codeblock(reply),
-                            reply_markup=_telegram_inline_keyboard(menu_state),
-                        )
-                        if not BOT_STATE.get("reply_keyboard_enabled"):
-                            _send_telegram_message(
-                                bot_token,
-                                chat_id,
-                                " ",
-                                reply_markup=_telegram_reply_keyboard_root(),
-                            )
-                            BOT_STATE["reply_keyboard_enabled"] = True
-                    continue
-                message = update.get("message") or {}
-                if not message:
-                    continue
-                if str(message.get("chat", {}).get("id")) != chat_id:
-                    continue
-                text = message.get("text", "")
-                if not text:
-                    continue
-                message_id = message.get("message_id")
-                if message_id is not None:
-                    if message_id == BOT_STATE.get("last_message_id") and text == BOT_STATE.get("last_message_text"):
-                        continue
-                    BOT_STATE["last_message_id"] = message_id
-                    BOT_STATE["last_message_text"] = text
-                client = HetznerClient(config["hetzner"]["api_token"])
-                reply = _handle_bot_command(text, config, client)
-                menu_state = BOT_STATE.get("menu_state") or "root"
-                _send_telegram_markdown(
-                    bot_token,
-                    chat_id,
-                    _maybe_wrap_codeblock(reply),
-                    reply_markup=_telegram_inline_keyboard(menu_state),
-                )
-                if not BOT_STATE.get("reply_keyboard_enabled"):
-                    _send_telegram_message(
-                        bot_token,
-                        chat_id,
-                        " ",
-                        reply_markup=_telegram_reply_keyboard_root(),
-                    )
-                    BOT_STATE["reply_keyboard_enabled"] = True
+                _accept_telegram_update(update, config, bot_token, chat_id)
+            _observe_loop("telegram_bot", started)
         except Exception as e:
-            print(f"[alert] telegram bot error: {e}")
-        time.sleep(3)
+            _observe_loop("telegram_bot", started, e)
+            print(f"[alert] telegram bot error: {_redact_error(e)}")
+            WORKER_STOP.wait(3)
 
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+def _traffic_limit_info(config: Dict[str, Any]) -> Dict[str, Any]:
+    traffic_cfg = config.get("traffic", {})
+    limit_gb = traffic_cfg.get("limit_gb")
+    limit_tb = None
+    if limit_gb:
+        try:
+            limit_tb = _quantize_tb(Decimal(limit_gb) / Decimal(1024))
+        except Exception:
+            limit_tb = None
+    return {
+        "limit_gb": limit_gb,
+        "limit_tb": str(limit_tb) if limit_tb is not None else None,
+        "cost_per_tb_eur": 1,
+    }
 
 
-@app.on_event("startup")
-def _start_traffic_monitor() -> None:
-    if os.environ.get("HETZNER_WEB_DISABLE_WORKERS", "").lower() in ("1", "true", "yes"):
-        print("[info] background workers disabled by HETZNER_WEB_DISABLE_WORKERS")
-        return
-    try:
-        persisted = _load_threshold_state()
-        for sid, level in persisted.items():
-            ALERT_STATE[str(sid)] = {
-                "last_level": int(level),
-                "last_outgoing": None,
-                "auto_rebuild": False,
-            }
-    except Exception as e:
-        print(f"[alert] threshold state load failed: {e}")
-    def _backfill_wrapper() -> None:
-        try:
-            state = _load_report_state()
-            if state.get("rebuild_backfilled"):
-                return
-            state = _backfill_rebuild_stats(state)
-            _save_report_state(state)
-        except Exception as e:
-            print(f"[alert] rebuild backfill error: {e}")
+def _server_name_map(servers: List[Dict[str, Any]]) -> Dict[str, str]:
+    return {str(s["id"]): s.get("name") or str(s["id"]) for s in servers}
 
-    threading.Thread(target=_monitor_traffic_loop, daemon=True).start()
-    threading.Thread(target=_daily_report_loop, daemon=True).start()
-    threading.Thread(target=_telegram_bot_loop, daemon=True).start()
-    threading.Thread(target=_schedule_loop, daemon=True).start()
-    threading.Thread(target=_snapshot_loop, daemon=True).start()
-    threading.Thread(target=_backfill_wrapper, daemon=True).start()
-    def _sync_wrapper() -> None:
-        try:
-            config = _load_yaml(CONFIG_PATH)
-            client = HetznerClient(config["hetzner"]["api_token"])
-            _sync_cloudflare_records(config, client)
-        except Exception as e:
-            print(f"[alert] cloudflare sync error: {e}")
-    threading.Thread(target=_sync_wrapper, daemon=True).start()
-    try:
-        config = _load_yaml(CONFIG_PATH)
-        telegram_cfg = config.get("telegram", {})
-        bot_token = telegram_cfg.get("bot_token", "")
-        chat_id = telegram_cfg.get("chat_id", "")
-        if telegram_cfg.get("enabled") and bot_token and chat_id:
-            now = _now_local().strftime("%Y-%m-%d %H:%M:%S")
-            levels = _parse_alert_levels(telegram_cfg.get("notify_levels"))
-            notify_text = f"{', '.join(str(x) for x in levels)}%" if levels else "-"
-            client = HetznerClient(config["hetzner"]["api_token"])
-            servers = client.get_servers()
-            server_count = len(servers)
-            limit_gb = (config.get("traffic") or {}).get("limit_gb")
-            limit_text = f"{limit_gb} GB" if limit_gb else "未设置"
-            total_outbound_bytes = 0.0
-            top_name = "-"
-            top_percent = 0.0
-            if limit_gb:
-                limit_bytes = float(Decimal(limit_gb) * (Decimal(1024) ** 3))
-            else:
-                limit_bytes = 0.0
-            for s in servers:
-                detail = client.get_server(s["id"]) or {}
-                outgoing = detail.get("outgoing_traffic")
-                if outgoing is None:
-                    continue
-                total_outbound_bytes += float(outgoing)
-                if limit_bytes > 0:
-                    percent = (float(outgoing) / limit_bytes) * 100
-                    if percent >= top_percent:
-                        top_percent = percent
-                        top_name = detail.get("name") or s.get("name") or str(s["id"])
-            total_outbound_tb = _bytes_to_tb(total_outbound_bytes)
-            _send_telegram_markdown(
-                bot_token,
-                chat_id,
-                (
-                    "✅ 监控已启动\n"
-                    f"时间: {now}\n"
-                    f"服务器: {server_count} 台\n"
-                    f"阈值: {notify_text}\n"
-                    f"流量上限: {limit_text}\n"
-                    f"当前累计出站(总): {total_outbound_tb} TB\n"
-                    f"最高使用率: {top_name} · {top_percent:.1f}%"
-                ),
-            )
-    except Exception as e:
-        print(f"[alert] startup notify error: {e}")
-
-
-@app.get("/")
-def index() -> FileResponse:
-    return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
-
-@app.get("/demo")
-def demo() -> FileResponse:
-    return FileResponse(os.path.join(STATIC_DIR, "index.html"))
-
-
-@app.get("/api/servers")
-def api_servers(request: Request) -> JSONResponse:
-    _require_auth(request)
-    config = _load_yaml(CONFIG_PATH)
-    client = HetznerClient(config["hetzner"]["api_token"])
-    servers = client.get_servers()
-    traffic_cfg = config.get("traffic", {})
-    limit_gb = traffic_cfg.get("limit_gb")
-    limit_tb = None
-    if limit_gb:
-        try:
-            limit_tb = _quantize_tb(Decimal(limit_gb) / Decimal(1024))
-        except Exception:
-            limit_tb = None
+def _build_server_rows(client: "HetznerClient", servers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     rows = []
     for s in servers:
         detail = client.get_server(s["id"]) or {}
@@ -2814,123 +5847,49 @@ def api_servers(request: Request) -> JSONResponse:
                 "inbound_bytes": ingoing,
             }
         )
-    state = _load_json(REPORT_STATE_PATH)
-    web_cfg = _load_json(WEB_CONFIG_PATH)
-    hourly = _merge_hourly_series(state.get("hourly", {}))
-    tracking = _compute_tracking_totals(hourly, web_cfg.get("tracking_start"))
-    name_map = {str(s["id"]): s.get("name") or str(s["id"]) for s in servers}
-    rebuilds = _detect_last_rebuilds(state.get("hourly", {}), name_map)
-    rebuild_summary = _summarize_rebuild_stats(state)
-    return JSONResponse(
-        {
-            "servers": rows,
-            "updated_at": _now_local().strftime("%Y-%m-%d %H:%M:%S"),
-            "tracking": tracking,
-            "traffic": {
-                "limit_gb": limit_gb,
-                "limit_tb": str(limit_tb) if limit_tb is not None else None,
-                "cost_per_tb_eur": 1,
-            },
-            "rebuilds": rebuilds,
-            "rebuild_summary": rebuild_summary,
-        }
-    )
-
-
-@app.get("/api/qb")
-def api_qb(request: Request) -> JSONResponse:
-    _require_auth(request)
-    config = _load_yaml(CONFIG_PATH)
-    return JSONResponse(_collect_qbittorrent_stats(config))
+    return rows
 
 
-@app.post("/api/rebuild")
-async def api_rebuild(request: Request) -> JSONResponse:
-    _require_auth(request)
-    payload = await request.json()
-    server_id = int(payload.get("server_id"))
-    config = _load_yaml(CONFIG_PATH)
-    client = HetznerClient(config["hetzner"]["api_token"])
-    detail = client.get_server(server_id) or {}
-    name = detail.get("name") or str(server_id)
-    result = _perform_rebuild(server_id, name, config, "Web API", client)
-    if not result.get("success"):
-        return JSONResponse(result, status_code=500)
-    return JSONResponse({"rebuild": result, "dns": result.get("dns")})
-
-
-@app.post("/api/dns_check")
-async def api_dns_check(request: Request) -> JSONResponse:
-    _require_auth(request)
-    payload = await request.json()
-    server_id = payload.get("server_id")
-    config = _load_yaml(CONFIG_PATH)
-    client = HetznerClient(config["hetzner"]["api_token"])
-    servers = client.get_servers()
-    if server_id:
-        servers = [s for s in servers if s["id"] == int(server_id)]
-    cf_cfg = config.get("cloudflare", {})
-    record_map = cf_cfg.get("record_map", {})
-    results = []
-    for s in servers:
-        record = record_map.get(str(s["id"])) or record_map.get(s.get("name", ""))
-        ip = s["public_net"]["ipv4"]["ip"] if s["public_net"].get("ipv4") else None
-        if not record or not ip:
-            results.append({"id": s["id"], "status": "missing"})
-            continue
-        try:
-            socket.setdefaulttimeout(5)
-            resolved = socket.gethostbyname(record)
-            ok = resolved == ip
-            results.append({"id": s["id"], "record": record, "resolved": resolved, "expected": ip, "ok": ok})
-        except Exception as e:
-            results.append({"id": s["id"], "record": record, "error": str(e)})
-    return JSONResponse({"results": results})
+def _fleet_server_rows(fleet_servers: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Same rows as _build_server_rows, from the fleet poll snapshot instead of per-server GETs."""
+    rows = []
+    for sid, entry in sorted(fleet_servers.items(), key=lambda item: int(item[0]) if item[0].isdigit() else 0):
+        outgoing = entry.get("outbound_bytes")
+        ingoing = entry.get("inbound_bytes")
+        rows.append(
+            {
+                "id": int(sid) if sid.isdigit() else sid,
+                "name": entry.get("name") or sid,
+                "status": entry.get("status"),
+                "ip": entry.get("ipv4"),
+                "server_type": entry.get("server_type"),
+                "location": entry.get("location"),
+                "outbound_tb": str(_bytes_to_tb(outgoing) if outgoing is not None else Decimal("0.000")),
+                "inbound_tb": str(_bytes_to_tb(ingoing) if ingoing is not None else Decimal("0.000")),
+                "outbound_bytes": int(outgoing) if outgoing is not None else None,
+                "inbound_bytes": int(ingoing) if ingoing is not None else None,
+            }
+        )
+    return rows
 
 
-@app.get("/api/hourly")
-def api_hourly(request: Request, date: Optional[str] = None) -> JSONResponse:
-    _require_auth(request)
-    state = _load_json(REPORT_STATE_PATH)
-    hourly = state.get("hourly", {})
-    config = _load_yaml(CONFIG_PATH)
-    name_map = _active_server_name_map(config)
+def _build_hourly_section(
+    hourly: Dict[str, Any], name_map: Dict[str, str], date: Optional[str] = None
+) -> Dict[str, Any]:
     include_ids = set(name_map.keys()) if name_map else None
     include_names = set(name_map.values()) if name_map else None
     keys = sorted(hourly.keys())
     if date:
-        try:
-            datetime.strptime(date, "%Y-%m-%d")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format")
         selected_keys = [key for key in keys if key.startswith(date)]
         if not selected_keys:
-            return JSONResponse({"servers": {}, "hours": []})
-        prev_map = {keys[i]: keys[i - 1] for i in range(1, len(keys))}
-        rows: Dict[str, Any] = {}
-        for curr_key in selected_keys:
-            prev_key = prev_map.get(curr_key)
-            prev_raw = hourly.get(prev_key, {}) if prev_key else {}
-            curr_raw = hourly.get(curr_key, {})
-            prev = _filter_snapshot(prev_raw, include_ids, name_map, include_names)
-            curr = _filter_snapshot(curr_raw, include_ids, name_map, include_names)
-            deltas = _delta_by_name(prev, curr)
-            for name in deltas:
-                if name not in rows:
-                    rows[name] = {"name": name, "deltas": []}
-            for name, data in rows.items():
-                delta = deltas.get(name, {})
-                delta_tb = str(_quantize_tb(delta["out"])) if delta.get("has_out") else None
-                delta_in_tb = str(_quantize_tb(delta["in"])) if delta.get("has_in") else None
-                data["deltas"].append({"hour": curr_key, "tb": delta_tb, "in_tb": delta_in_tb})
-        return JSONResponse({"servers": rows, "hours": selected_keys})
-
-    keys = keys[-25:]
+            return {"servers": {}, "hours": []}
+    else:
+        selected_keys = keys[-25:][1:]
+    prev_map = {keys[i]: keys[i - 1] for i in range(1, len(keys))}
     rows: Dict[str, Any] = {}
-    for i in range(1, len(keys)):
-        prev_key = keys[i - 1]
-        curr_key = keys[i]
-        prev_raw = hourly.get(prev_key, {})
+    for curr_key in selected_keys:
+        prev_key = prev_map.get(curr_key)
+        prev_raw = hourly.get(prev_key, {}) if prev_key else {}
         curr_raw = hourly.get(curr_key, {})
         prev = _filter_snapshot(prev_raw, include_ids, name_map, include_names)
         curr = _filter_snapshot(curr_raw, include_ids, name_map, include_names)
@@ -2943,21 +5902,15 @@ def api_hourly(request: Request, date: Optional[str] = None) -> JSONResponse:
             delta_tb = str(_quantize_tb(delta["out"])) if delta.get("has_out") else None
             delta_in_tb = str(_quantize_tb(delta["in"])) if delta.get("has_in") else None
             data["deltas"].append({"hour": curr_key, "tb": delta_tb, "in_tb": delta_in_tb})
-    return JSONResponse({"servers": rows, "hours": keys[1:]})
+    return {"servers": rows, "hours": selected_keys}
 
 
-@app.get("/api/daily")
-def api_daily(request: Request) -> JSONResponse:
-    _require_auth(request)
-    state = _load_json(REPORT_STATE_PATH)
-    hourly = state.get("hourly", {})
-    config = _load_yaml(CONFIG_PATH)
-    name_map = _active_server_name_map(config)
+def _build_daily_section(hourly: Dict[str, Any], name_map: Dict[str, str]) -> Dict[str, Any]:
     include_ids = set(name_map.keys()) if name_map else None
     include_names = set(name_map.values()) if name_map else None
     keys = sorted(hourly.keys())
     if len(keys) < 2:
-        return JSONResponse({"days": [], "peak": "0.000", "total": "0.000", "servers": []})
+        return {"days": [], "peak": "0.000", "total": "0.000", "servers": []}
 
     daily_totals: Dict[str, Decimal] = {}
     daily_in_totals: Dict[str, Decimal] = {}
@@ -3008,26 +5961,1077 @@ def api_daily(request: Request) -> JSONResponse:
             in_value = _quantize_tb(per_server_in.get(name, {}).get(date_key, Decimal("0.000")))
             rows.append({"date": date_key, "outbound_tb": str(value), "inbound_tb": str(in_value)})
         servers.append({"id": name, "name": name, "days": rows})
-    return JSONResponse(
-        {
-            "days": days,
-            "peak": str(peak),
-            "total": str(total),
-            "in_peak": str(in_peak),
-            "in_total": str(in_total),
-            "servers": servers,
-        }
+    return {
+        "days": days,
+        "peak": str(peak),
+        "total": str(total),
+        "in_peak": str(in_peak),
+        "in_total": str(in_total),
+        "servers": servers,
+    }
+
+
+def _parse_export_bound(value: Optional[str], end: bool) -> Optional[str]:
+    if not value:
+        return None
+    value = value.strip()
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt == "%Y-%m-%d":
+            return parsed.strftime("%Y-%m-%d 23:59" if end else "%Y-%m-%d 00:00")
+        return parsed.strftime("%Y-%m-%d %H:%M")
+    raise HTTPException(status_code=400, detail="Invalid date format")
+
+
+def _export_bucket(key: str, resolution: str) -> str:
+    if resolution == "day":
+        return key[:10]
+    if resolution == "hour":
+        return f"{key[:13]}:00"
+    return key
+
+
+def _counter_delta(prev: Any, curr: Any) -> Optional[float]:
+    if prev is None or curr is None:
+        return None
+    if float(curr) >= float(prev):
+        return float(curr) - float(prev)
+    return float(curr)
+
+
+def _iter_export_rows(start: Optional[str], end: Optional[str], resolution: str, path: Optional[str] = None):
+    """Yield per-server, per-bucket deltas plus the cumulative counters at bucket end.
+
+    Snapshots are streamed from report_state.json; only the previous snapshot and
+    the bucket being aggregated are kept.
+    """
+    prev: Dict[str, Dict[str, Any]] = {}
+    label: Optional[str] = None
+    bucket: Dict[str, Dict[str, Any]] = {}
+    for key, snapshot in _iter_hourly_sorted(path):
+        if end and key > end:
+            break
+        current = _export_bucket(key, resolution)
+        if current != label:
+            yield from bucket.values()
+            label = current
+            bucket = {}
+        for sid, data in snapshot.items():
+            if not isinstance(data, dict):
+                continue
+            last = prev.get(sid, {})
+            out_delta = _counter_delta(last.get("outbound_bytes"), data.get("outbound_bytes"))
+            in_delta = _counter_delta(last.get("inbound_bytes"), data.get("inbound_bytes"))
+            prev[sid] = data
+            if start and key < start:
+                continue
+            row = bucket.setdefault(
+                sid,
+                {
+                    "time": label,
+                    "server_id": sid,
+                    "server": data.get("name") or sid,
+                    "outbound_bytes": None,
+                    "inbound_bytes": None,
+                    "outbound_total_bytes": None,
+                    "inbound_total_bytes": None,
+                },
+            )
+            if out_delta is not None:
+                row["outbound_bytes"] = (row["outbound_bytes"] or 0) + int(out_delta)
+            if in_delta is not None:
+                row["inbound_bytes"] = (row["inbound_bytes"] or 0) + int(in_delta)
+            if data.get("outbound_bytes") is not None:
+                row["outbound_total_bytes"] = int(float(data["outbound_bytes"]))
+            if data.get("inbound_bytes") is not None:
+                row["inbound_total_bytes"] = int(float(data["inbound_bytes"]))
+            row["server"] = data.get("name") or row["server"]
+    yield from bucket.values()
+
+
+def _stream_export(start: Optional[str], end: Optional[str], resolution: str, fmt: str):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n") if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+        yield out.getvalue().encode("utf-8")
+        out.seek(0)
+        out.truncate()
+    for row in _iter_export_rows(start, end, resolution):
+        if writer:
+            writer.writerow(["" if row[col] is None else row[col] for col in EXPORT_COLUMNS])
+        else:
+            out.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+            out.write("\n")
+        if out.tell() >= EXPORT_FLUSH_BYTES:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+
+def _parse_dashboard_sections(include: Optional[str]) -> List[str]:
+    if not include:
+        return list(DASHBOARD_SECTIONS)
+    sections = [part.strip() for part in include.split(",") if part.strip()]
+    unknown = [part for part in sections if part not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    return sections
+
+
+def _build_dashboard(
+    config: Dict[str, Any], sections: List[str], qb_stats: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Build the requested dashboard sections from one state load and the fleet poll snapshot.
+
+    Hetzner is only called when the snapshot is still empty (before the first poll, or with
+    background workers disabled).
+    """
+    state = _load_cached(REPORT_STATE_PATH, _load_json)
+    raw_hourly = state.get("hourly", {})
+    payload: Dict[str, Any] = {"updated_at": _now_local().strftime("%Y-%m-%d %H:%M:%S")}
+
+    fleet_servers = _current_fleet_state().get("servers") or {}
+    needs_servers = any(section in sections for section in ("servers", "rebuilds", "hourly", "daily", "cycle"))
+    server_rows: List[Dict[str, Any]] = []
+    if fleet_servers:
+        name_map = {sid: entry.get("name") or sid for sid, entry in fleet_servers.items()}
+        if "servers" in sections:
+            server_rows = _fleet_server_rows(fleet_servers)
+    else:
+        client = HetznerClient(config["hetzner"]["api_token"])
+        servers: List[Dict[str, Any]] = []
+        if needs_servers:
+            try:
+                servers = client.get_servers()
+            except Exception:
+                # Same degradation as _active_server_name_map: history sections stay
+                # available unfiltered, only the live server list needs Hetzner.
+                if "servers" in sections:
+                    raise
+        name_map = _server_name_map(servers)
+        if "servers" in sections:
+            server_rows = _build_server_rows(client, servers)
+
+    if "servers" in sections:
+        payload["servers"] = server_rows
+        payload["traffic"] = _traffic_limit_info(config)
+        limit_bytes = _traffic_limit_bytes(config)
+        models = _forecast_models(raw_hourly)
+        for row in payload["servers"]:
+            row["forecast"] = _forecast_view(
+                _forecast_breach(models.get(row["name"]), row.get("outbound_bytes"), limit_bytes)
+            )
+    if "tracking" in sections:
+        web_cfg = _load_cached(WEB_CONFIG_PATH, _load_json)
+        payload["tracking"] = _compute_tracking_totals(
+            _merge_hourly_series(raw_hourly), web_cfg.get("tracking_start")
+        )
+    if "rebuilds" in sections:
+        payload["rebuilds"] = _detect_last_rebuilds(raw_hourly, name_map)
+        payload["rebuild_summary"] = _summarize_rebuild_stats(state)
+    if "hourly" in sections:
+        payload["hourly"] = _build_hourly_section(raw_hourly, name_map)
+    if "daily" in sections:
+        payload["daily"] = _build_daily_section(raw_hourly, name_map)
+    if "cycle" in sections:
+        payload["cycle"] = _compute_cycle_data(
+            raw_hourly, include_ids=set(name_map.keys()), name_map=name_map
+        )
+    if "qb" in sections:
+        payload["qb"] = qb_stats if qb_stats is not None else _collect_qbittorrent_stats(config)
+    return payload
+
+
+def _qb_history_payload(hours: int) -> Dict[str, Any]:
+    return _build_qb_history_section(_load_cached(REPORT_STATE_PATH, _load_json), hours)
+
+
+def _hourly_payload(date: Optional[str]) -> Dict[str, Any]:
+    state = _load_cached(REPORT_STATE_PATH, _load_json)
+    name_map = _active_server_name_map(_load_cached(CONFIG_PATH, _load_yaml))
+    return _build_hourly_section(state.get("hourly", {}), name_map, date)
+
+
+def _daily_payload() -> Dict[str, Any]:
+    state = _load_cached(REPORT_STATE_PATH, _load_json)
+    name_map = _active_server_name_map(_load_cached(CONFIG_PATH, _load_yaml))
+    return _build_daily_section(state.get("hourly", {}), name_map)
+
+
+def _cycle_payload(config: Dict[str, Any]) -> Dict[str, Any]:
+    return _build_dashboard(config, ["cycle"])["cycle"]
+
+
+async def _run_upstream(
+    func: Any, *args: Any, deadline: Optional[float] = UPSTREAM_DEADLINE_SECONDS, **kwargs: Any
+) -> Any:
+    """Run blocking upstream work on a worker pool, bounded by a deadline.
+
+    The deadline only bounds the wait: a timed-out call keeps its pool thread until the
+    underlying HTTP timeouts (HETZNER_HTTP_TIMEOUT, Cloudflare 15 s, qB timeout_seconds /
+    deadline_seconds) end it, so UPSTREAM_MAX_WORKERS caps how many can pile up.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(UPSTREAM_EXECUTOR, functools.partial(func, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(future, timeout=deadline)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream timeout")
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in (request.headers.get("accept-encoding") or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            quality = _parse_float_or_default(params[2:], 1.0)
+        accepted[token] = quality
+    return accepted
+
+
+def _negotiate_encoding(request: Request) -> Optional[str]:
+    accepted = _accepted_encodings(request)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _matched_etag(request: Request, digest: str) -> Optional[str]:
+    """The If-None-Match entry (as sent) that validates against digest, whatever its encoding suffix."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    for raw in header.split(","):
+        raw = raw.strip()
+        if raw == "*":
+            return f'"{digest}"'
+        candidate = raw[2:] if raw.startswith("W/") else raw
+        if candidate.strip('"').split("-", 1)[0] == digest:
+            return raw
+    return None
+
+
+def _etag_matches(request: Request, digest: str) -> bool:
+    return _matched_etag(request, digest) is not None
+
+
+def _encoded_response(
+    request: Request,
+    body: bytes,
+    digest: str,
+    media_type: str,
+    cache_control: str,
+    encoded: Optional[Dict[str, bytes]] = None,
+) -> Response:
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    encoding = _negotiate_encoding(request) if len(body) >= COMPRESS_MIN_BYTES else None
+    if _etag_matches(request, digest):
+        # Same validator as the 200 this replaces, including the encoding suffix.
+        headers["ETag"] = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        payload = (encoded or {}).get(encoding)
+        if payload is None:
+            payload = _compress_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'"{digest}-{encoding}"'
+        return Response(content=payload, media_type=media_type, headers=headers)
+    headers["ETag"] = f'"{digest}"'
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _data_version_etag(request: Request, sources: tuple, live: str = "") -> Optional[str]:
+    """Validator from the versions of what the payload is built from, known before building it.
+
+    ``live`` carries a digest of any part that has no version (live qB stats). None when the
+    fleet snapshot is still empty: the builders then fall back to live Hetzner calls, which no
+    local version covers.
+    """
+    paths = {"REPORT_STATE": REPORT_STATE_PATH, "CONFIG": CONFIG_PATH, "WEB_CONFIG": WEB_CONFIG_PATH}
+    # The hour keeps time-relative fields (forecast hours_left, today's totals) from going stale.
+    parts = [API_ETAG_SALT, request.url.path, str(request.query_params), _now_local().strftime("%Y-%m-%d %H"), live]
+    for source in sources:
+        if source == "fleet":
+            fleet = _current_fleet_state()
+            if not fleet.get("servers"):
+                return None
+            parts.append(f"{fleet.get('version')}@{fleet.get('updated_at')}")
+            continue
+        try:
+            stat = os.stat(paths[source])
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append("-")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def _json_response(
+    request: Request, payload: Dict[str, Any], volatile: tuple = (), digest: Optional[str] = None
+) -> Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if digest:
+        return _encoded_response(request, body, digest, "application/json", API_CACHE_CONTROL)
+    # Without a data version the ETag hashes the data; volatile keys such as "updated_at" would
+    # otherwise change it on every poll.
+    if volatile:
+        stable = {key: value for key, value in payload.items() if key not in volatile}
+        versioned = json.dumps(stable, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    else:
+        versioned = body
+    digest = hashlib.sha256(versioned).hexdigest()[:32]
+    return _encoded_response(request, body, digest, "application/json", API_CACHE_CONTROL)
+
+
+def _json_call(
+    request: Request,
+    func: Callable[..., Any],
+    *args: Any,
+    volatile: tuple = (),
+    sources: tuple = (),
+    live: str = "",
+    **kwargs: Any,
+) -> Response:
+    """Build a payload and its encoded response in one pool call, so neither JSON parsing of
+    report_state.json nor dumps/hash/compression runs on the event loop.
+
+    With ``sources`` the ETag comes from their versions, and a matching If-None-Match returns
+    304 without calling ``func`` at all.
+    """
+    digest = _data_version_etag(request, sources, live) if sources else None
+    if digest:
+        matched = _matched_etag(request, digest)
+        if matched:
+            return Response(
+                status_code=304,
+                headers={"Cache-Control": API_CACHE_CONTROL, "Vary": "Accept-Encoding", "ETag": matched},
+            )
+    return _json_response(request, func(*args, **kwargs), volatile=volatile, digest=digest)
+
+
+def _dashboard_call(request: Request, config: Dict[str, Any], sections: List[str]) -> Response:
+    """Fetch live qB stats first and fold them into the validator, so a 304 still skips every other section."""
+    qb_stats = _collect_qbittorrent_stats(config) if "qb" in sections else None
+    live = ""
+    if qb_stats is not None:
+        live = hashlib.sha256(json.dumps(qb_stats, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return _json_call(
+        request,
+        _build_dashboard,
+        config,
+        sections,
+        volatile=("updated_at",),
+        sources=API_SOURCES_DASHBOARD,
+        live=live,
+        qb_stats=qb_stats,
     )
 
 
-@app.get("/api/cycle")
-def api_cycle(request: Request) -> JSONResponse:
+def _load_static_asset(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = STATIC_ENCODED_CACHE.get(path)
+    hit = bool(cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size)
+    _cache_lookup("static", hit)
+    if hit:
+        return cached
+    with open(path, "rb") as f:
+        body = f.read()
+    encoded: Dict[str, bytes] = {}
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding == "br" and brotli is None:
+            continue
+        sibling = f"{path}{suffix}"
+        # Prefer assets compressed at build time, as long as they are not stale.
+        if os.path.isfile(sibling) and os.stat(sibling).st_mtime_ns >= stat.st_mtime_ns:
+            with open(sibling, "rb") as f:
+                encoded[encoding] = f.read()
+        elif len(body) >= COMPRESS_MIN_BYTES:
+            encoded[encoding] = _compress_body(body, encoding)
+    cached = {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "body": body,
+        "encoded": encoded,
+        "digest": hashlib.sha256(body).hexdigest()[:32],
+        "media_type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+    }
+    STATIC_ENCODED_CACHE[path] = cached
+    return cached
+
+
+def _static_response(request: Request, path: str, cache_control: str) -> Response:
+    asset = _load_static_asset(path)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return _encoded_response(
+        request,
+        asset["body"],
+        asset["digest"],
+        asset["media_type"],
+        cache_control,
+        encoded=asset["encoded"],
+    )
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Workers start once the server is accepting connections; startup never waits on Hetzner or Telegram.
+    async def _deferred_start() -> None:
+        await asyncio.sleep(WORKER_START_DELAY_SECONDS)
+        threading.Thread(target=_start_traffic_monitor, name="worker-start", daemon=True).start()
+
+    starter = asyncio.create_task(_deferred_start())
+    try:
+        yield
+    finally:
+        starter.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, _stop_background_workers)
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+def _try_leader_lock(blocking: bool) -> bool:
+    if fcntl is None:
+        return True
+    fd = LEADER_STATE.get("fd")
+    if fd is None:
+        fd = os.open(LEADER_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+        LEADER_STATE["fd"] = fd
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(fd, flags)
+    except OSError:
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()}\n".encode("ascii"))
+    return True
+
+
+def _become_leader() -> None:
+    LEADER_STATE["leader"] = True
+    LEADER_STATE["since"] = time.time()
+    _start_background_workers()
+
+
+def _await_leadership() -> None:
+    # flock is released by the kernel when the holder exits, so this blocks until the leader dies.
+    while not WORKER_STOP.is_set():
+        try:
+            if _try_leader_lock(blocking=True):
+                if WORKER_STOP.is_set():
+                    return
+                print(f"[info] pid {os.getpid()} took over background workers")
+                _become_leader()
+                return
+        except Exception as e:
+            print(f"[alert] leader election error: {e}")
+        WORKER_STOP.wait(5)
+
+
+def _forget_inflight(future: Any) -> None:
+    with INFLIGHT_LOCK:
+        INFLIGHT_FUTURES.discard(future)
+
+
+def _submit_tracked(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args: Any) -> Any:
+    """Submit background work that shutdown should drain instead of abandoning."""
+    future = executor.submit(fn, *args)
+    with INFLIGHT_LOCK:
+        INFLIGHT_FUTURES.add(future)
+    future.add_done_callback(_forget_inflight)
+    return future
+
+
+def _supervise(name: str, target: Callable[[], None]) -> None:
+    """Run a worker loop until WORKER_STOP, restarting it with backoff if it crashes or returns."""
+    backoff = WORKER_RESTART_BACKOFF_SECONDS
+    while not WORKER_STOP.is_set():
+        started = time.monotonic()
+        try:
+            target()
+            if WORKER_STOP.is_set():
+                return
+            print(f"[alert] worker {name} exited unexpectedly")
+        except Exception as e:
+            print(f"[alert] worker {name} crashed: {e}")
+            with WORKER_HEALTH_LOCK:
+                entry = _worker_health_entry(name)
+                entry["last_error"] = _redact_error(e)
+                entry["last_error_at"] = time.time()
+        _metric_inc("hetzner_web_worker_restarts_total", {"worker": name})
+        with WORKER_HEALTH_LOCK:
+            _worker_health_entry(name)["restarts"] += 1
+        _publish_worker_health(force=True)
+        if time.monotonic() - started >= WORKER_HEALTHY_SECONDS:
+            backoff = WORKER_RESTART_BACKOFF_SECONDS
+        print(f"[info] restarting worker {name} in {backoff:.0f}s")
+        WORKER_STOP.wait(backoff)
+        backoff = min(WORKER_RESTART_BACKOFF_MAX_SECONDS, backoff * 2)
+
+
+def _start_worker(name: str, target: Callable[[], None], supervised: bool = True) -> None:
+    if supervised:
+        thread = threading.Thread(target=_supervise, args=(name, target), name=name, daemon=True)
+    else:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+    WORKER_THREADS[name] = thread
+    thread.start()
+    if supervised:
+        with WORKER_HEALTH_LOCK:
+            _worker_health_entry(name)
+        _publish_worker_health(force=True)
+
+
+def _stop_background_workers(deadline: float = SHUTDOWN_DRAIN_SECONDS) -> None:
+    """Stop the loops, drain in-flight jobs and queued Telegram messages until the deadline, then flush state."""
+    WORKER_STOP.set()
+    leader = LEADER_STATE.get("leader")
+    end = time.monotonic() + deadline
+    with TELEGRAM_OUTBOX_COND:
+        TELEGRAM_OUTBOX_COND.notify_all()
+    if leader:
+        _stop_leader_workers(end)
+    with INFLIGHT_LOCK:
+        pending = [future for future in INFLIGHT_FUTURES if not future.done()]
+    if pending:
+        _, not_done = wait_futures(pending, timeout=max(0.0, end - time.monotonic()))
+        if not_done:
+            print(f"[alert] {len(not_done)} background job(s) still running at shutdown")
+    # Last, so messages sent by the jobs above still go out.
+    sender = WORKER_THREADS.get("telegram_sender")
+    if sender is not None:
+        sender.join(max(0.0, end - time.monotonic()))
+        if sender.is_alive():
+            print(f"[alert] {_telegram_outbox_depth()} telegram message(s) unsent at shutdown")
+    if not leader:
+        return
+    try:
+        _persist_threshold_from_alert_state()
+        _publish_fleet_state()
+    except Exception as e:
+        print(f"[alert] state flush at shutdown failed: {e}")
+    print("[info] background workers stopped")
+
+
+def _stop_leader_workers(end: float) -> None:
+    print(f"[info] stopping background workers (drain up to {end - time.monotonic():.0f}s)")
+    FLEET_REFRESH.set()
+    with TIMER_LOCK:
+        TIMER_LOCK.notify_all()
+    with DELAYED_TASKS_WAKE:
+        DELAYED_TASKS_WAKE.notify_all()
+    with FLEET_BUS:
+        FLEET_BUS.notify_all()
+    # Queued-but-unstarted timer and delayed work is dropped: timers are re-planned and
+    # delayed tasks are persisted, so both resume on the next start.
+    TIMER_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    DELAYED_TASK_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    for name, thread in list(WORKER_THREADS.items()):
+        if name in ("telegram_sender", "leader_wait"):
+            continue
+        thread.join(max(0.0, end - time.monotonic()))
+        if thread.is_alive():
+            print(f"[alert] worker {name} still running at shutdown")
+
+
+def _start_traffic_monitor() -> None:
+    if os.environ.get("HETZNER_WEB_DISABLE_WORKERS", "").lower() in ("1", "true", "yes"):
+        print("[info] background workers disabled by HETZNER_WEB_DISABLE_WORKERS")
+        return
+    try:
+        acquired = _try_leader_lock(blocking=False)
+    except Exception as e:
+        print(f"[alert] leader lock unavailable, running workers in this process: {e}")
+        acquired = True
+    if acquired:
+        _become_leader()
+        return
+    print(f"[info] pid {os.getpid()} is a follower; background workers run in the leader process")
+    _start_worker("leader_wait", _await_leadership, supervised=False)
+
+
+def _start_background_workers() -> None:
+    try:
+        persisted = _load_threshold_state()
+        for sid, level in persisted.items():
+            ALERT_STATE[str(sid)] = {
+                "last_level": int(level),
+                "last_outgoing": None,
+                "auto_rebuild": False,
+            }
+    except Exception as e:
+        print(f"[alert] threshold state load failed: {e}")
+    def _backfill_wrapper() -> None:
+        try:
+            state = _load_report_state()
+            if not state.get("rebuild_backfilled"):
+                state = _update_report_state(
+                    lambda fresh: fresh if fresh.get("rebuild_backfilled") else _backfill_rebuild_stats(fresh)
+                )
+            _publish_rebuild_stats(state.get("rebuild_stats", {}) or {})
+        except Exception as e:
+            print(f"[alert] rebuild backfill error: {e}")
+
+    _start_worker("fleet_poll", _fleet_poll_loop)
+    _start_worker("telegram_bot", _telegram_bot_loop)
+    _start_worker("timer", _timer_loop)
+    _start_worker("delayed_tasks", _delayed_task_loop)
+    _start_worker("backfill", _backfill_wrapper, supervised=False)
+    def _sync_wrapper() -> None:
+        try:
+            config = _load_yaml(CONFIG_PATH)
+            client = HetznerClient(config["hetzner"]["api_token"])
+            _sync_cloudflare_records(config, client)
+        except Exception as e:
+            print(f"[alert] cloudflare sync error: {e}")
+    _start_worker("cloudflare_sync", _sync_wrapper, supervised=False)
+    try:
+        config = _load_yaml(CONFIG_PATH)
+        telegram_cfg = config.get("telegram", {})
+        bot_token = telegram_cfg.get("bot_token", "")
+        chat_id = telegram_cfg.get("chat_id", "")
+        if telegram_cfg.get("enabled") and bot_token and chat_id:
+            now = _now_local().strftime("%Y-%m-%d %H:%M:%S")
+            levels = _parse_alert_levels(telegram_cfg.get("notify_levels"))
+            notify_text = f"{', '.join(str(x) for x in levels)}%" if levels else "-"
+            client = HetznerClient(config["hetzner"]["api_token"])
+            servers = client.get_servers()
+            server_count = len(servers)
+            limit_gb = (config.get("traffic") or {}).get("limit_gb")
+            limit_text = f"{limit_gb} GB" if limit_gb else "未设置"
+            total_outbound_bytes = 0.0
+            top_name = "-"
+            top_percent = 0.0
+            if limit_gb:
+                limit_bytes = float(Decimal(limit_gb) * (Decimal(1024) ** 3))
+            else:
+                limit_bytes = 0.0
+            for s in servers:
+                detail = client.get_server(s["id"]) or {}
+                outgoing = detail.get("outgoing_traffic")
+                if outgoing is None:
+                    continue
+                total_outbound_bytes += float(outgoing)
+                if limit_bytes > 0:
+                    percent = (float(outgoing) / limit_bytes) * 100
+                    if percent >= top_percent:
+                        top_percent = percent
+                        top_name = detail.get("name") or s.get("name") or str(s["id"])
+            total_outbound_tb = _bytes_to_tb(total_outbound_bytes)
+            _send_telegram_markdown(
+                bot_token,
+                chat_id,
+                (
+                    "✅ 监控已启动\n"
+                    f"时间: {now}\n"
+                    f"服务器: {server_count} 台\n"
+                    f"阈值: {notify_text}\n"
+                    f"流量上限: {limit_text}\n"
+                    f"当前累计出站(总): {total_outbound_tb} TB\n"
+                    f"最高使用率: {top_name} · {top_percent:.1f}%"
+                ),
+            )
+    except Exception as e:
+        print(f"[alert] startup notify error: {e}")
+
+
+@app.get("/")
+def index(request: Request) -> Response:
+    return _static_response(request, os.path.join(STATIC_DIR, "index.html"), INDEX_CACHE_CONTROL)
+
+
+@app.get("/demo")
+def demo(request: Request) -> Response:
+    return _static_response(request, os.path.join(STATIC_DIR, "index.html"), INDEX_CACHE_CONTROL)
+
+
+@app.get("/static/{asset_path:path}")
+def static_asset(request: Request, asset_path: str) -> Response:
+    root = os.path.realpath(STATIC_DIR)
+    path = os.path.realpath(os.path.join(root, asset_path))
+    if not path.startswith(root + os.sep) or path.endswith((".gz", ".br")):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return _static_response(request, path, STATIC_CACHE_CONTROL)
+
+
+@app.get("/api/servers")
+async def api_servers(request: Request) -> Response:
     _require_auth(request)
-    state = _load_json(REPORT_STATE_PATH)
-    hourly = state.get("hourly", {})
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    return await _run_upstream(_dashboard_call, request, config, ["servers", "tracking", "rebuilds"])
+
+
+@app.get("/api/dashboard")
+async def api_dashboard(request: Request, include: Optional[str] = None) -> Response:
+    _require_auth(request)
+    sections = _parse_dashboard_sections(include)
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    return await _run_upstream(_dashboard_call, request, config, sections)
+
+
+@app.get("/api/qb")
+async def api_qb(request: Request) -> Response:
+    _require_auth(request)
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    return await _run_upstream(_json_call, request, _collect_qbittorrent_stats, config)
+
+
+@app.get("/api/qb/history")
+async def api_qb_history(request: Request, hours: int = QB_HISTORY_DEFAULT_HOURS) -> Response:
+    _require_auth(request)
+    if hours < 1 or hours > QB_HISTORY_MAX_HOURS:
+        raise HTTPException(status_code=400, detail=f"hours must be between 1 and {QB_HISTORY_MAX_HOURS}")
+    return await _run_upstream(_json_call, request, _qb_history_payload, hours, sources=("REPORT_STATE",))
+
+
+@app.post("/api/rebuild")
+async def api_rebuild(request: Request) -> JSONResponse:
+    _require_auth(request)
+    payload = await request.json()
+    server_id = int(payload.get("server_id"))
     config = _load_yaml(CONFIG_PATH)
     client = HetznerClient(config["hetzner"]["api_token"])
-    servers = client.get_servers()
-    include_ids = {str(s["id"]) for s in servers}
-    name_map = {str(s["id"]): s.get("name") or str(s["id"]) for s in servers}
-    return JSONResponse(_compute_cycle_data(hourly, include_ids=include_ids, name_map=name_map))
+    detail = await _run_upstream(client.get_server, server_id) or {}
+    name = detail.get("name") or str(server_id)
+    job = _submit_rebuild_job(server_id, name, "Web API", config=config, client=client)
+    return JSONResponse({"job": job}, status_code=200 if job.get("deduplicated") else 202)
+
+
+@app.get("/api/jobs")
+def api_jobs(request: Request) -> JSONResponse:
+    _require_auth(request)
+    jobs = _list_rebuild_jobs()
+    jobs.sort(key=lambda job: job["created_at"], reverse=True)
+    return JSONResponse({"jobs": jobs, "queue": _rebuild_queue_depth()})
+
+
+@app.get("/api/jobs/{job_id}")
+async def api_job(request: Request, job_id: str, wait: float = 0, since: int = -1) -> JSONResponse:
+    """Return a job; with ?wait=N, hold the request until it changes past ?since=version."""
+    _require_auth(request)
+    job = _get_rebuild_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    deadline = time.monotonic() + max(0.0, min(float(wait), JOB_LONG_POLL_MAX_SECONDS))
+    while job["version"] <= since and job["status"] in ("queued", "running"):
+        if time.monotonic() >= deadline or await request.is_disconnected():
+            break
+        await asyncio.sleep(0.5)
+        job = _get_rebuild_job(job_id) or job
+    return JSONResponse({"job": job})
+
+
+@app.post("/api/dns_check")
+async def api_dns_check(request: Request) -> JSONResponse:
+    _require_auth(request)
+    payload = await request.json()
+    server_id = payload.get("server_id")
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    client = HetznerClient(config["hetzner"]["api_token"])
+    servers = await _run_upstream(client.get_servers)
+    if server_id:
+        servers = [s for s in servers if s["id"] == int(server_id)]
+    cf_cfg = config.get("cloudflare", {}) or {}
+    targets = _dns_check_targets(servers, cf_cfg.get("record_map", {}) or {})
+    checks = [t for t in targets if t["record"] and t["expected"]]
+    checked = iter(await _check_dns_records(checks, cf_cfg))
+    results = []
+    for target in targets:
+        sid = target["server"]["id"]
+        if not target["record"] or not target["expected"]:
+            results.append({"id": sid, "status": "missing"})
+            continue
+        check = next(checked)
+        results.append(dict(check, id=sid))
+    return JSONResponse({"results": results})
+
+
+@app.post("/telegram/webhook/{secret}")
+async def telegram_webhook(request: Request, secret: str) -> JSONResponse:
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    telegram_cfg = config.get("telegram", {}) or {}
+    expected = str(telegram_cfg.get("webhook_secret") or "")
+    if not telegram_cfg.get("enabled") or not _telegram_webhook_target(telegram_cfg):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(secret, expected):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get(TELEGRAM_WEBHOOK_HEADER, ""), expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        update = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid update")
+    if not isinstance(update, dict):
+        raise HTTPException(status_code=400, detail="Invalid update")
+    bot_token = telegram_cfg.get("bot_token", "")
+    chat_id = str(telegram_cfg.get("chat_id", "")).strip()
+    if not LEADER_STATE["leader"]:
+        # Bot state and the outbox live in the leader; hand the update over through the shared inbox.
+        await _run_upstream(_forward_telegram_update, update)
+        return JSONResponse({"ok": True, "accepted": True, "forwarded": True})
+    # Answer 200 even for ignored updates, otherwise Telegram keeps redelivering them.
+    accepted = await _run_upstream(_accept_telegram_update, update, config, bot_token, chat_id)
+    return JSONResponse({"ok": True, "accepted": accepted})
+
+
+@app.get("/metrics")
+def metrics(request: Request) -> Response:
+    if not _load_cached(WEB_CONFIG_PATH, _load_json).get("metrics_public"):
+        _require_auth(request)
+    return Response(content=_render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _health_stale_seconds(config: Dict[str, Any]) -> Dict[str, float]:
+    traffic_cfg = config.get("traffic") or {}
+    interval_seconds = max(30, _parse_int_or_default(traffic_cfg.get("check_interval"), 5) * 60)
+    thresholds = dict(HEALTH_STALE_SECONDS)
+    # The poller never sleeps longer than the check interval; allow one missed cycle.
+    thresholds["fleet_poll"] = 2 * interval_seconds + 60
+    overrides = (config.get("health") or {}).get("stale_seconds") or {}
+    if isinstance(overrides, dict):
+        for name, value in overrides.items():
+            thresholds[str(name)] = _parse_float_or_default(value, thresholds.get(str(name), 0.0))
+    return {name: float(value) for name, value in thresholds.items()}
+
+
+def _health_report(config: Dict[str, Any]) -> Dict[str, Any]:
+    now = time.time()
+    if os.environ.get("HETZNER_WEB_DISABLE_WORKERS", "").lower() in ("1", "true", "yes"):
+        return {"status": "ok", "role": "disabled", "pid": os.getpid(), "workers": {}}
+    health_cfg = config.get("health") or {}
+    max_errors = _parse_int_or_default(health_cfg.get("max_consecutive_errors"), HEALTH_MAX_CONSECUTIVE_ERRORS)
+    thresholds = _health_stale_seconds(config)
+    if LEADER_STATE["leader"]:
+        with WORKER_HEALTH_LOCK:
+            workers = {name: dict(entry) for name, entry in WORKER_HEALTH.items()}
+        source = {"pid": os.getpid(), "started_at": HEALTH_STATE["started_at"], "updated_at": now}
+        alive = {name: thread.is_alive() for name, thread in WORKER_THREADS.items()}
+        role = "leader"
+    else:
+        source = _load_cached(HEALTH_SNAPSHOT_PATH, _load_json) if os.path.exists(HEALTH_SNAPSHOT_PATH) else {}
+        workers = {name: dict(entry) for name, entry in (source.get("workers") or {}).items()}
+        alive = {}
+        role = "follower"
+    started_at = float(source.get("started_at") or HEALTH_STATE["started_at"])
+    overall = "ok"
+    for name, entry in workers.items():
+        stale_after = thresholds.get(name)
+        last_finish = entry.get("last_finish")
+        if alive.get(name) is False:
+            status = "dead"
+        elif int(entry.get("consecutive_errors") or 0) >= max_errors:
+            status = "failing"
+        elif stale_after and last_finish is None:
+            status = "starting" if now - started_at < stale_after else "stale"
+        elif stale_after and now - float(last_finish) > stale_after:
+            status = "stale"
+        else:
+            status = "ok"
+        entry["status"] = status
+        entry["stale_after"] = stale_after
+        entry["age_seconds"] = round(now - float(last_finish), 1) if last_finish is not None else None
+        if status not in ("ok", "starting"):
+            overall = "degraded"
+    report: Dict[str, Any] = {"status": overall, "role": role, "pid": os.getpid(), "workers": workers}
+    if role == "follower":
+        updated_at = source.get("updated_at")
+        report["leader_pid"] = source.get("pid")
+        report["snapshot_age_seconds"] = round(now - float(updated_at), 1) if updated_at else None
+        # The leader rewrites the snapshot on every loop iteration, so an old file means no leader is working.
+        if not updated_at or now - float(updated_at) > max(thresholds.values()):
+            report["status"] = "degraded"
+    return report
+
+
+@app.get("/healthz")
+def healthz() -> JSONResponse:
+    try:
+        config = _load_cached(CONFIG_PATH, _load_yaml)
+    except Exception:
+        config = {}
+    report = _health_report(config)
+    return JSONResponse(report, status_code=200 if report["status"] == "ok" else 503)
+
+
+def _fleet_event_payload(fleet: Dict[str, Any]) -> Dict[str, Any]:
+    servers = []
+    for sid, entry in sorted((fleet.get("servers") or {}).items()):
+        outgoing = entry.get("outbound_bytes")
+        ingoing = entry.get("inbound_bytes")
+        servers.append(
+            {
+                "id": sid,
+                "name": entry.get("name") or sid,
+                "status": entry.get("status"),
+                "outbound_tb": str(_bytes_to_tb(outgoing)) if outgoing is not None else None,
+                "inbound_tb": str(_bytes_to_tb(ingoing)) if ingoing is not None else None,
+                "outbound_bytes": outgoing,
+                "inbound_bytes": ingoing,
+                "percent": round(entry["percent"], 2) if entry.get("percent") is not None else None,
+                "sampled_at": entry.get("sampled_at"),
+            }
+        )
+    return {
+        "version": fleet.get("version"),
+        "updated_at": fleet.get("updated_at"),
+        "refreshed": fleet.get("refreshed") or [],
+        "servers": servers,
+    }
+
+
+def _wake_fleet_listeners() -> None:
+    future = SSE_WAKE["future"]
+    SSE_WAKE["future"] = None
+    if future is not None and not future.done():
+        future.set_result(None)
+
+
+def _notify_fleet_listeners() -> None:
+    """Called from the poller thread after a publish; hops onto the event loop."""
+    loop = SSE_WAKE["loop"]
+    if loop is not None and not loop.is_closed():
+        try:
+            loop.call_soon_threadsafe(_wake_fleet_listeners)
+        except RuntimeError:
+            pass
+
+
+async def _watch_fleet_snapshot() -> None:
+    """Followers have no poller to wake them: one task per process watches the snapshot file."""
+    mtime = None
+    while SSE_WAKE["listeners"] > 0:
+        if not LEADER_STATE["leader"]:
+            try:
+                current = os.stat(FLEET_SNAPSHOT_PATH).st_mtime_ns
+            except OSError:
+                current = None
+            if mtime is not None and current != mtime:
+                _wake_fleet_listeners()
+            mtime = current
+        await asyncio.sleep(SSE_SNAPSHOT_CHECK_SECONDS)
+    if SSE_WAKE["watcher"] is asyncio.current_task():
+        SSE_WAKE["watcher"] = None
+
+
+def _fleet_waiter() -> "asyncio.Future":
+    loop = asyncio.get_running_loop()
+    if SSE_WAKE["loop"] is not loop:
+        SSE_WAKE.update(loop=loop, future=None, watcher=None)
+    if SSE_WAKE["watcher"] is None:
+        SSE_WAKE["watcher"] = loop.create_task(_watch_fleet_snapshot())
+    if SSE_WAKE["future"] is None:
+        SSE_WAKE["future"] = loop.create_future()
+    return SSE_WAKE["future"]
+
+
+@app.get("/api/events")
+async def api_events(request: Request) -> Response:
+    """Server-sent events: one ``fleet`` event per published poll, plus keep-alive comments.
+
+    Streams sleep on a shared future that the poller (or, on followers, the snapshot
+    watcher) resolves, instead of re-reading the fleet state every second.
+    """
+    _require_auth(request)
+
+    async def _stream():
+        version = None
+        SSE_WAKE["listeners"] += 1
+        try:
+            while not await request.is_disconnected():
+                waiter = _fleet_waiter()
+                fleet = _current_fleet_state()
+                if fleet.get("version") != version:
+                    version = fleet.get("version")
+                    payload = json.dumps(_fleet_event_payload(fleet), ensure_ascii=False, separators=(",", ":"))
+                    yield f"id: {version}\nevent: fleet\ndata: {payload}\n\n".encode("utf-8")
+                    continue
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            SSE_WAKE["listeners"] -= 1
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/hourly")
+async def api_hourly(request: Request, date: Optional[str] = None) -> Response:
+    _require_auth(request)
+    if date:
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+    return await _run_upstream(_json_call, request, _hourly_payload, date, sources=API_SOURCES_HISTORY)
+
+
+@app.get("/api/daily")
+async def api_daily(request: Request) -> Response:
+    _require_auth(request)
+    return await _run_upstream(_json_call, request, _daily_payload, sources=API_SOURCES_HISTORY)
+
+
+@app.get("/api/export")
+def api_export(
+    request: Request,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    format: str = "csv",
+    resolution: str = "raw",
+) -> Response:
+    _require_auth(request)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if resolution not in EXPORT_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported resolution: {resolution}")
+    start_key = _parse_export_bound(start, end=False)
+    end_key = _parse_export_bound(end, end=True)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"traffic-{resolution}"
+    if start_key:
+        filename += f"-from-{start_key[:10]}"
+    if end_key:
+        filename += f"-to-{end_key[:10]}"
+    return StreamingResponse(
+        _stream_export(start_key, end_key, resolution, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{format}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@app.get("/api/cycle")
+async def api_cycle(request: Request) -> Response:
+    _require_auth(request)
+    config = _load_cached(CONFIG_PATH, _load_yaml)
+    return await _run_upstream(_json_call, request, _cycle_payload, config, sources=API_SOURCES_DASHBOARD)
@@ -4,17 +4,14 @@ import datetime as dt
 import json
 import os
 import re
-import subprocess
 import sys
-import time
+import urllib.error
 import urllib.parse
 import urllib.request
 
 DEFAULT_CONFIG = "/opt/hetzner-web/config.yaml"
-DEFAULT_REPORT = "/opt/hetzner-web/report_state.json"
-DEFAULT_THRESHOLD = "/opt/hetzner-web/threshold_state.json"
 DEFAULT_STATE = "/opt/hetzner-web/health_state.json"
-DEFAULT_CONTAINER = "hetzner-web"
+DEFAULT_URL = "http://127.0.0.1:1227/healthz"
 
 
 def _strip_quotes(value: str) -> str:
@@ -77,28 +74,30 @@ def _send_telegram(bot_token: str, chat_id: str, text: str) -> bool:
         return False
 
 
-def _check_container(name: str):
+def _probe_healthz(url: str, timeout: float):
+    """Return (reachable, payload); /healthz answers 503 with the same JSON body when degraded."""
     try:
-        proc = subprocess.run(
-            ["docker", "inspect", "-f", "{{.State.Running}}", name],
-            capture_output=True,
-            text=True,
-            timeout=5,
-        )
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return True, json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as exc:
+        try:
+            return True, json.loads(exc.read().decode("utf-8"))
+        except Exception:
+            return False, {"error": f"HTTP {exc.code}"}
     except Exception as exc:
-        return False, f"docker inspect failed: {exc}"
-    if proc.returncode != 0:
-        return False, (proc.stderr.strip() or proc.stdout.strip() or "container not found")
-    return proc.stdout.strip() == "true", proc.stdout.strip()
+        return False, {"error": str(exc)}
 
 
-def _check_file_fresh(path: str, max_age_seconds: int):
-    if not os.path.exists(path):
-        return False, "missing"
-    mtime = os.path.getmtime(path)
-    age = int(time.time() - mtime)
-    ok = age <= max_age_seconds
-    return ok, f"age={age}s"
+def _worker_info(entry: dict) -> str:
+    parts = []
+    age = entry.get("age_seconds")
+    parts.append(f"age={int(age)}s" if age is not None else "age=-")
+    parts.append(f"ok={entry.get('ok', 0)} err={entry.get('errors', 0)}")
+    if entry.get("restarts"):
+        parts.append(f"restarts={entry['restarts']}")
+    if entry.get("status") not in ("ok", "starting") and entry.get("last_error"):
+        parts.append(f"last_error={entry['last_error']}")
+    return ", ".join(parts)
 
 
 def _load_state(path: str):
@@ -122,11 +121,9 @@ def _save_state(path: str, data: dict):
 def main():
     parser = argparse.ArgumentParser(description="Hetzner-Web health check")
     parser.add_argument("--config", default=DEFAULT_CONFIG)
-    parser.add_argument("--report", default=DEFAULT_REPORT)
-    parser.add_argument("--threshold", default=DEFAULT_THRESHOLD)
-    parser.add_argument("--container", default=DEFAULT_CONTAINER)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--timeout", type=float, default=10)
     parser.add_argument("--state-file", default=DEFAULT_STATE)
-    parser.add_argument("--max-age-min", type=int, default=10)
     parser.add_argument("--notify-ok", action="store_true")
     parser.add_argument("--notify-ok-daily", action="store_true")
     args = parser.parse_args()
@@ -138,20 +135,23 @@ def main():
     failures = []
     checks = []
 
-    ok, info = _check_container(args.container)
-    checks.append(("container", ok, info))
-    if not ok:
-        failures.append("container")
-
-    max_age_seconds = max(60, args.max_age_min * 60)
-    ok, info = _check_file_fresh(args.report, max_age_seconds)
-    checks.append(("report_state", ok, info))
-    if not ok:
-        failures.append("report_state")
-
-    ok, info = _check_file_fresh(args.threshold, max_age_seconds * 6)
-    checks.append(("threshold_state", ok, info))
-    # threshold_state is soft-check: do not fail
+    reachable, payload = _probe_healthz(args.url, args.timeout)
+    if not reachable:
+        checks.append(("healthz", False, payload.get("error") or "unreachable"))
+        failures.append("healthz")
+    else:
+        status = payload.get("status") or "unknown"
+        info = f"status={status}, role={payload.get('role') or '-'}"
+        if payload.get("snapshot_age_seconds") is not None:
+            info += f", leader_snapshot_age={int(payload['snapshot_age_seconds'])}s"
+        checks.append(("healthz", status == "ok", info))
+        if status != "ok":
+            failures.append("healthz")
+        for name, entry in sorted((payload.get("workers") or {}).items()):
+            ok = entry.get("status") in ("ok", "starting")
+            checks.append((name, ok, _worker_info(entry)))
+            if not ok:
+                failures.append(name)
 
     now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     if failures:
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Stand-in for Telegram: POST a fake update to the local /telegram/webhook/{secret} route."""
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_URL = "http://127.0.0.1:1227"
+
+
+def _build_update(update_id: int, chat_id: str, text: str, callback: bool) -> dict:
+    chat = {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id, "type": "private"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat}
+    if callback:
+        return {
+            "update_id": update_id,
+            "callback_query": {"id": f"stub-{update_id}", "data": text, "message": message},
+        }
+    message["text"] = text
+    return {"update_id": update_id, "message": message}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a fake Telegram update to the webhook route")
+    parser.add_argument("text", help='message text, e.g. "/status", or callback data with --callback')
+    parser.add_argument("--url", default=DEFAULT_URL, help="base URL of the web app")
+    parser.add_argument("--secret", required=True, help="telegram.webhook_secret from config.yaml")
+    parser.add_argument("--chat-id", required=True, help="telegram.chat_id from config.yaml")
+    parser.add_argument("--update-id", type=int, default=int(time.time()))
+    parser.add_argument("--callback", action="store_true", help="send a callback_query (e.g. cmd:/list)")
+    parser.add_argument("--header-secret", default=None, help="override the secret header (to test rejection)")
+    args = parser.parse_args()
+
+    update = _build_update(args.update_id, args.chat_id, args.text, args.callback)
+    url = f"{args.url.rstrip('/')}/telegram/webhook/{args.secret}"
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            "X-Telegram-Bot-Api-Secret-Token": args.header_secret if args.header_secret is not None else args.secret,
+        },
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            print(resp.status, resp.read().decode("utf-8"))
+            return 0
+    except urllib.error.HTTPError as exc:
+        print(exc.code, exc.read().decode("utf-8"))
+        return 1
+    except Exception as exc:
+        print(f"request failed: {exc}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
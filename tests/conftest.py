@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Importing main must not start the background workers or touch real state files.
+os.environ.setdefault("HETZNER_WEB_DISABLE_WORKERS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+import asyncio
+import socket
+import struct
+import threading
+
+import pytest
+
+import main
+
+
+class StubDnsServer:
+    """Answers A queries from a table on a local UDP port; unknown names get NXDOMAIN."""
+
+    def __init__(self, records=None, silent=False):
+        self.records = records or {}
+        self.silent = silent
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.address = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            name = self._qname(data)
+            self.queries.append(name)
+            if not self.silent:
+                self.sock.sendto(self._answer(data, name), addr)
+
+    @staticmethod
+    def _qname(data):
+        labels, offset = [], 12
+        while data[offset]:
+            length = data[offset]
+            labels.append(data[offset + 1 : offset + 1 + length].decode())
+            offset += length + 1
+        return ".".join(labels)
+
+    def _answer(self, query, name):
+        query_id = struct.unpack("!H", query[:2])[0]
+        question = query[12:]
+        if name not in self.records:
+            return struct.pack("!HHHHHH", query_id, 0x8183, 1, 0, 0, 0) + question
+        ips, ttl = self.records[name]
+        answers = b"".join(
+            struct.pack("!HHHIH", 0xC00C, 1, 1, ttl, 4) + socket.inet_aton(ip) for ip in ips
+        )
+        return struct.pack("!HHHHHH", query_id, 0x8180, 1, len(ips), 0, 0) + question + answers
+
+    def close(self):
+        self._stop.set()
+        self.sock.close()
+        self._thread.join(1)
+
+
+@pytest.fixture(autouse=True)
+def _clear_dns_cache():
+    main.DNS_CACHE.clear()
+    yield
+    main.DNS_CACHE.clear()
+
+
+@pytest.fixture
+def stub():
+    server = StubDnsServer({"a.example.com": (["192.0.2.1"], 120), "long.example.com": (["192.0.2.2"], 86400)})
+    yield server
+    server.close()
+
+
+def _resolve(name, resolver, timeout=1.0):
+    return asyncio.run(main._resolve_a(name, resolver, timeout))
+
+
+def test_answer_is_cached_for_its_ttl(stub, monkeypatch):
+    first = _resolve("a.example.com", stub.address)
+    assert first["addresses"] == ["192.0.2.1"]
+    assert first["ttl"] == 120
+    assert first["cached"] is False
+
+    second = _resolve("a.example.com", stub.address)
+    assert second["cached"] is True
+    assert stub.queries == ["a.example.com"]
+
+    now = main.time.monotonic()
+    monkeypatch.setattr(main.time, "monotonic", lambda: now + 121)
+    third = _resolve("a.example.com", stub.address)
+    assert third["cached"] is False
+    assert stub.queries == ["a.example.com", "a.example.com"]
+
+
+def test_ttl_is_capped(stub):
+    assert _resolve("long.example.com", stub.address)["ttl"] == main.DNS_MAX_TTL_SECONDS
+
+
+def test_nxdomain_uses_negative_ttl(stub, monkeypatch):
+    result = _resolve("missing.example.com", stub.address)
+    assert result["addresses"] == []
+    assert result["error"] == "NXDOMAIN"
+    assert result["ttl"] == main.DNS_NEGATIVE_TTL_SECONDS
+
+    assert _resolve("missing.example.com", stub.address)["cached"] is True
+    now = main.time.monotonic()
+    monkeypatch.setattr(main.time, "monotonic", lambda: now + main.DNS_NEGATIVE_TTL_SECONDS + 1)
+    assert _resolve("missing.example.com", stub.address)["cached"] is False
+    assert len(stub.queries) == 2
+
+
+def test_timeout_is_negative_cached():
+    dead = StubDnsServer(silent=True)
+    try:
+        result = _resolve("a.example.com", dead.address, timeout=0.3)
+    finally:
+        dead.close()
+    assert result["error"] == "timeout"
+    assert result["ttl"] == main.DNS_NEGATIVE_TTL_SECONDS
+    assert main.DNS_CACHE[("a.example.com", dead.address)]["result"]["error"] == "timeout"
+
+
+def test_check_falls_back_to_the_resolver_that_answered(stub):
+    dead = StubDnsServer(silent=True)
+    try:
+        dns_cfg = {"dns_resolvers": [dead.address, stub.address], "dns_timeout_seconds": 0.5}
+        results = asyncio.run(
+            main._check_dns_records([{"record": "a.example.com", "expected": "192.0.2.1"}], dns_cfg)
+        )
+    finally:
+        dead.close()
+    assert results[0]["ok"] is True
+    assert results[0]["resolved"] == "192.0.2.1"
+    assert results[0]["answers"][dead.address] == "timeout"
@@ -0,0 +1,82 @@
+import pytest
+import yaml
+from fastapi.testclient import TestClient
+
+import main
+
+SECRET = "s3cret-path"
+
+
+@pytest.fixture
+def webhook(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        yaml.safe_dump(
+            {
+                "telegram": {
+                    "enabled": True,
+                    "bot_token": "123:abc",
+                    "chat_id": "42",
+                    "mode": "webhook",
+                    "webhook_url": "https://example.test",
+                    "webhook_secret": SECRET,
+                }
+            }
+        )
+    )
+    monkeypatch.setattr(main, "CONFIG_PATH", str(config_path))
+    monkeypatch.setattr(main, "TELEGRAM_INBOX_PATH", str(tmp_path / "inbox.json"))
+    monkeypatch.setitem(main.LEADER_STATE, "leader", True)
+    monkeypatch.setitem(main.BOT_STATE, "update_offset", 0)
+    dispatched = []
+    monkeypatch.setattr(main, "_dispatch_telegram_update", lambda update, *args: dispatched.append(update["update_id"]))
+    return TestClient(main.app), dispatched
+
+
+def _update(update_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": 42}, "text": "/servers"}}
+
+
+def _post(client, update, secret=SECRET, header=SECRET):
+    headers = {main.TELEGRAM_WEBHOOK_HEADER: header} if header is not None else {}
+    return client.post(f"/telegram/webhook/{secret}", json=update, headers=headers)
+
+
+def test_bad_secret_header_is_forbidden(webhook):
+    client, dispatched = webhook
+    assert _post(client, _update(1), header="wrong").status_code == 403
+    assert _post(client, _update(1), header=None).status_code == 403
+    assert dispatched == []
+
+
+def test_bad_path_secret_is_not_found(webhook):
+    client, dispatched = webhook
+    assert _post(client, _update(1), secret="guess").status_code == 404
+    assert dispatched == []
+
+
+def test_redelivered_update_is_dispatched_once(webhook):
+    client, dispatched = webhook
+    first = _post(client, _update(7))
+    again = _post(client, _update(7))
+    older = _post(client, _update(6))
+    assert first.json() == {"ok": True, "accepted": True}
+    assert again.status_code == 200 and again.json()["accepted"] is False
+    assert older.status_code == 200 and older.json()["accepted"] is False
+    assert dispatched == [7]
+
+
+def test_follower_forwards_updates_to_the_leader(webhook, monkeypatch):
+    client, dispatched = webhook
+    monkeypatch.setitem(main.LEADER_STATE, "leader", False)
+    assert _post(client, _update(9)).json()["forwarded"] is True
+    assert _post(client, _update(8)).json()["forwarded"] is True
+    assert dispatched == []
+    monkeypatch.setitem(main.LEADER_STATE, "leader", True)
+    config = main._load_yaml(main.CONFIG_PATH)
+    assert main._drain_telegram_inbox(config, "123:abc", "42") == 2
+    assert main._drain_telegram_inbox(config, "123:abc", "42") == 0
+    assert dispatched == [8, 9]
+    # A redelivery that reaches the leader directly after the forwarded copy is still deduplicated.
+    assert _post(client, _update(9)).json()["accepted"] is False
+    assert dispatched == [8, 9]